@@ -0,0 +1,108 @@
+import shutil
+import threading
+from collections import Counter
+
+import metrics
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused so the caller can retry later"""
+
+    def __init__(self, reason, status_code=503, retry_after=30):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """An admitted job; holds its share of the in-flight limits until released"""
+
+    def __init__(self, controller, client):
+        self._controller = controller
+        self.client = client
+        self.pages = 0
+
+    def reserve_pages(self, pages):
+        """Account for the job's pages once the pre-flight estimate is known"""
+        self._controller._reserve_pages(self, pages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._controller._release(self)
+        return False
+
+
+class AdmissionController:
+    """Refuses new uploads when the service can't finish the work it already has.
+
+    Limits are read from ``config`` on every check so they can be tuned at
+    runtime:
+
+    * ``ADMISSION_MAX_QUEUE_DEPTH``: jobs allowed to wait beyond the lane workers
+    * ``ADMISSION_MAX_INFLIGHT_PAGES``: estimated pages across admitted jobs
+    * ``ADMISSION_MAX_JOBS_PER_CLIENT``: admitted jobs per client (429 when exceeded)
+    * ``ADMISSION_MIN_FREE_DISK_BYTES``: free space kept on the upload volume
+    * ``ADMISSION_RETRY_AFTER``: seconds sent back in ``Retry-After``
+
+    The counts are kept per process, so the limits only hold when every
+    request goes through one threaded worker (see AZURE_CONFIGURATION.md).
+    """
+
+    def __init__(self, config, capacity, disk_path):
+        self.config = config
+        # Number of jobs that can run at once (the total lane workers)
+        self.capacity = capacity
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        self._jobs = 0
+        self._pages = 0
+        self._jobs_by_client = Counter()
+
+    def _refuse(self, reason, status_code=503):
+        metrics.increment(f'admission_rejected_{status_code}')
+        raise Overloaded(reason, status_code, self.config['ADMISSION_RETRY_AFTER'])
+
+    def admit(self, client):
+        """Admit a new job or raise Overloaded; use the result as a context manager"""
+        # Room for the largest possible upload plus the configured reserve
+        needed = self.config['ADMISSION_MIN_FREE_DISK_BYTES'] + (self.config.get('MAX_CONTENT_LENGTH') or 0)
+        if shutil.disk_usage(self.disk_path).free < needed:
+            self._refuse('Not enough free disk space to accept uploads')
+
+        with self._lock:
+            if self._jobs_by_client[client] >= self.config['ADMISSION_MAX_JOBS_PER_CLIENT']:
+                self._refuse('Too many documents in progress for this client', 429)
+            if self._jobs - self.capacity >= self.config['ADMISSION_MAX_QUEUE_DEPTH']:
+                self._refuse('Processing queue is full')
+            self._jobs += 1
+            self._jobs_by_client[client] += 1
+        metrics.increment('admission_accepted')
+        return AdmissionTicket(self, client)
+
+    def _reserve_pages(self, ticket, pages):
+        with self._lock:
+            # A single job is always allowed, however large, so big documents can't be locked out
+            if self._pages and self._pages + pages > self.config['ADMISSION_MAX_INFLIGHT_PAGES']:
+                self._refuse('Too many pages in progress')
+            self._pages += pages
+            ticket.pages += pages
+
+    def _release(self, ticket):
+        with self._lock:
+            self._jobs -= 1
+            self._pages -= ticket.pages
+            ticket.pages = 0
+            self._jobs_by_client[ticket.client] -= 1
+            if not self._jobs_by_client[ticket.client]:
+                del self._jobs_by_client[ticket.client]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'inflight_jobs': self._jobs,
+                'inflight_pages': self._pages,
+                'queue_depth': max(0, self._jobs - self.capacity),
+            }
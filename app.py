@@ -1,16 +1,42 @@
 import os
 import re
+import hashlib
+import time
 import uuid
+import random
 import tempfile
+import threading
+from contextlib import closing
 from flask import Flask, render_template, request, redirect, url_for, session, flash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 from pdfminer.high_level import extract_text
 from pdfminer.layout import LAParams
 from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfinterp import PDFPageInterpreter
 from pdfminer.converter import TextConverter
+from pdfminer.pdftypes import PDFStream, resolve1
 from io import StringIO
+from flask import jsonify
 from flask_session import Session
+import metrics
+import preflight
+from normalize import normalize_text
+from scheduler import Lane, choose_lane
+from admission import AdmissionController, Overloaded
+from query_modes import QUERY_MODES, run_query
+from boolean_query import (is_boolean_query, parse_query, evaluate, bitset_pages, positive_terms,
+                           query_page_matches, query_match_spans)
+from sampling import ApproximateCount, make_strata, sample_order, estimate_total
+from page_results import PageResults
+from page_ranges import parse_page_ranges, format_page_ranges
+from text_store import (STORE_FORMAT, document_hash, save_pages, load_pages, save_index, load_index,
+                        save_checkpoint, load_checkpoints, clear_checkpoints,
+                        save_page_text, load_page_text, prune_store)
+from page_hash import page_content_hash
+from font_cache import FontCache, CachingResourceManager
+from search_index import SearchIndex
+from page_index import PageIndex, highlight_segments, query_terms, text_words
 
 app = Flask(__name__)
 # Use a stronger secret key
@@ -23,6 +49,53 @@ app.config['SESSION_PERMANENT'] = True
 app.config['SESSION_USE_SIGNER'] = True
 app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session')
 app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes
+# Preprocessed page text (mmap-ed UTF-8 blobs), kept so a new search term or a
+# page view doesn't need re-extraction
+app.config['TEXT_STORE_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'text_store')
+# Stored documents and cached pages unused this many seconds are removed (None
+# keeps them forever), checked every TEXT_STORE_PRUNE_INTERVAL seconds by a
+# background thread in each worker
+app.config['TEXT_STORE_MAX_AGE'] = app.config['PERMANENT_SESSION_LIFETIME']
+app.config['TEXT_STORE_PRUNE_INTERVAL'] = 300
+# Reuse the extracted text of pages already seen in any document, by content hash
+app.config['PAGE_TEXT_CACHE'] = True
+# Decoded fonts kept per worker, keyed by font content hash; set the folder to
+# also keep them on disk across worker restarts
+app.config['FONT_CACHE_SIZE'] = 256
+app.config['FONT_CACHE_FOLDER'] = None
+# SQLite file of the cross-document search index (see search_index.py); None disables it
+app.config['SEARCH_INDEX_PATH'] = None
+app.config['SEARCH_INDEX_BATCH_SIZE'] = 500
+# Most frequent words of the document listed with the results
+app.config['TOP_WORDS'] = 20
+# Part of every results and page ETag; bump it when the templates change so
+# browsers don't keep pages rendered the old way
+app.config['ETAG_VERSION'] = '1'
+
+# Pre-flight cost model (see benchmark.py) and the processing lanes it routes to
+app.config['PREFLIGHT_COST_MODEL'] = dict(preflight.DEFAULT_COST_MODEL)
+app.config['SLOW_LANE_THRESHOLD_SECONDS'] = 5.0
+app.config['FAST_LANE_WORKERS'] = 4
+app.config['SLOW_LANE_WORKERS'] = 1
+# Seconds of estimated cost forgiven per second waited, so big jobs aren't starved
+app.config['LANE_AGING_RATE'] = 1.0
+# Most extraction jobs one session may have running at once in each lane
+app.config['MAX_JOBS_PER_CLIENT'] = 1
+
+# Admission control: uploads are refused with 503/429 and Retry-After when
+# these limits would be exceeded (see admission.py)
+app.config['ADMISSION_MAX_QUEUE_DEPTH'] = 20
+app.config['ADMISSION_MAX_INFLIGHT_PAGES'] = 20000
+app.config['ADMISSION_MAX_JOBS_PER_CLIENT'] = 3
+app.config['ADMISSION_MIN_FREE_DISK_BYTES'] = 256 * 1024 * 1024
+app.config['ADMISSION_RETRY_AFTER'] = 30
+# Reverse proxies in front of the app whose X-Forwarded-For is trusted, so
+# per-client limits apply to real client addresses. Set to 1 on Azure App
+# Service, where every request arrives from its front end.
+app.config['TRUSTED_PROXY_COUNT'] = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+if app.config['TRUSTED_PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
 
 # Initialize Flask-Session
 Session(app)
@@ -30,10 +103,37 @@ Session(app)
 # Create uploads folder and session folder if they don't exist
 uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), app.config['UPLOAD_FOLDER'])
 os.makedirs(uploads_dir, exist_ok=True)
+# Uploads being processed, which may wait in a lane while other requests
+# finish; cleanup_temp_files only removes files directly in the upload folder
+pending_uploads_dir = os.path.join(uploads_dir, 'pending')
+os.makedirs(pending_uploads_dir, exist_ok=True)
 
 session_dir = app.config['SESSION_FILE_DIR']
 os.makedirs(session_dir, exist_ok=True)
 
+os.makedirs(app.config['TEXT_STORE_FOLDER'], exist_ok=True)
+
+processing_lanes = {
+    name: Lane(
+        name,
+        app.config[f'{name.upper()}_LANE_WORKERS'],
+        aging_rate=app.config['LANE_AGING_RATE'],
+        max_per_client=app.config['MAX_JOBS_PER_CLIENT']
+    )
+    for name in ('fast', 'slow')
+}
+
+font_cache = FontCache(app.config['FONT_CACHE_SIZE'], app.config['FONT_CACHE_FOLDER'])
+
+# Open search indexes by path, created on first use
+search_indexes = {}
+
+admission = AdmissionController(
+    app.config,
+    capacity=sum(lane.workers for lane in processing_lanes.values()),
+    disk_path=uploads_dir
+)
+
 def allowed_file(filename):
     """Check if a filename has an allowed extension"""
     try:
@@ -44,15 +144,36 @@ def allowed_file(filename):
         # Handle edge cases like None or other non-string inputs
         return False
 
+def preflight_document(filepath, selected_pages=None):
+    """Estimate extraction cost before doing any work and pick a processing lane
+    
+    ``selected_pages`` is the number of pages to extract when not all are.
+    """
+    estimate = preflight.estimate(filepath, app.config['PREFLIGHT_COST_MODEL'])
+    if selected_pages is not None:
+        estimate = preflight.scale_to_pages(estimate, selected_pages, app.config['PREFLIGHT_COST_MODEL'])
+    lane = choose_lane(processing_lanes, estimate, app.config['SLOW_LANE_THRESHOLD_SECONDS'])
+    print(f"Pre-flight: {estimate.page_count} pages, {estimate.content_bytes} content bytes, "
+          f"~{estimate.estimated_seconds:.1f}s -> {lane.name} lane")
+    return estimate, lane
+
+def client_id():
+    """Identify the requesting client for fair-share scheduling and admission limits
+    
+    This is the remote address, not the session: a client that sends no
+    cookie gets a new session id on every request. Set TRUSTED_PROXY_COUNT
+    when behind a reverse proxy so this is the client's address.
+    """
+    return request.remote_addr
+
 def preprocess_text(text):
-    """Clean up and normalize text from PDF"""
-    # Remove hyphenation (common in PDFs for word breaks)
-    text = re.sub(r'-\s*\n\s*', '', text)
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text)
-    # Strip extra spaces
-    text = text.strip()
-    return text
+    """Clean up and normalize text from PDF
+    
+    Expands ligatures, maps Unicode hyphens, dashes and spaces, applies
+    NFKC, joins words hyphenated across lines (also by soft hyphens) and
+    collapses whitespace; see normalize.normalize_text.
+    """
+    return normalize_text(text)
 
 def count_word_occurrences(text, search_word):
     """Count occurrences of a word in text, handling word boundaries properly"""
@@ -60,154 +181,660 @@ def count_word_occurrences(text, search_word):
     if not search_word:
         return 0
         
-    # Case insensitive search with word boundaries
-    pattern = r'\b' + re.escape(search_word) + r'\b'
-    matches = re.finditer(pattern, text, re.IGNORECASE)
-    return sum(1 for _ in matches)
+    # Tokenized as for the page index, so 'ﬁnal' matches 'FINAL' and CJK
+    # words are found inside runs of text without spaces
+    return PageIndex.build([normalize_text(text)]).page_counts(search_word)[0]
 
-def extract_text_by_page(pdf_path):
-    """Extract text from each page of the PDF separately"""
+# Page kinds reported by classify_page
+PAGE_TEXT = 'text'
+PAGE_IMAGE_ONLY = 'image'
+PAGE_BLANK = 'blank'
+
+# Content-stream operators that show text (Tj, TJ, ' and ") and inline images (BI)
+TEXT_SHOW_PATTERN = re.compile(rb'(?<![A-Za-z0-9*])T[jJ](?![A-Za-z0-9*])|[)\]>\s][\'"](?=\s|$)')
+INLINE_IMAGE_PATTERN = re.compile(rb'(?<![A-Za-z0-9])BI(?![A-Za-z0-9])')
+# How deep to follow nested form XObjects before assuming a page has text
+MAX_FORM_DEPTH = 4
+
+def _scan_content(streams, resources, depth=0):
+    """Return (has_text, has_image) for content streams and the XObjects they can paint"""
+    has_image = False
+    for stream in streams:
+        stream = resolve1(stream)
+        if not isinstance(stream, PDFStream):
+            continue
+        data = stream.get_data()
+        if TEXT_SHOW_PATTERN.search(data):
+            return True, has_image
+        if INLINE_IMAGE_PATTERN.search(data):
+            has_image = True
+    
+    resources = resolve1(resources) or {}
+    xobjects = resolve1(resources.get('XObject')) if isinstance(resources, dict) else None
+    for xobject in (xobjects or {}).values():
+        xobject = resolve1(xobject)
+        if not isinstance(xobject, PDFStream):
+            continue
+        subtype = getattr(xobject.get('Subtype'), 'name', None)
+        if subtype == 'Image':
+            has_image = True
+        elif subtype == 'Form':
+            # Forms can draw text themselves, so look inside them too
+            if depth >= MAX_FORM_DEPTH:
+                return True, has_image
+            form_text, form_image = _scan_content([xobject], xobject.get('Resources', resources), depth + 1)
+            if form_text:
+                return True, has_image
+            has_image = has_image or form_image
+    return False, has_image
+
+def classify_page(page):
+    """Classify a page as text, image-only or blank from its content stream alone
+    
+    This only looks for text-show operators and XObjects, so it is far cheaper
+    than layout analysis. When in doubt the page is treated as a text page.
+    """
     try:
-        # Use custom parameters for pdfminer to better handle text extraction
-        laparams = LAParams(
-            char_margin=1.0,
-            line_margin=0.5,
-            word_margin=0.1,
-            boxes_flow=0.5,
-            detect_vertical=True
-        )
+        has_text, has_image = _scan_content(page.contents, page.resources)
+    except Exception as e:
+        print(f"Error scanning page content: {e}")
+        return PAGE_TEXT
+    if has_text:
+        return PAGE_TEXT
+    return PAGE_IMAGE_ONLY if has_image else PAGE_BLANK
+
+# Use custom parameters for pdfminer to better handle text extraction
+LAYOUT_PARAMS = {
+    'char_margin': 1.0,
+    'line_margin': 0.5,
+    'word_margin': 0.1,
+    'boxes_flow': 0.5,
+    'detect_vertical': True
+}
+
+def page_extractor():
+    """Return a function extracting (page_kind, text) from one PDFPage of a document
+    
+    Image-only and blank pages are detected up front and skipped with empty
+    text, so we don't pay interpreter cost for pages that can't contain text.
+    Text pages whose content hash has been seen before reuse the cached text.
+    Use one extractor per document, so fonts and hashes are shared by its pages.
+    """
+    laparams = LAParams(**LAYOUT_PARAMS)
+    
+    store_folder = app.config['TEXT_STORE_FOLDER'] if app.config['PAGE_TEXT_CACHE'] else None
+    # Digests of objects shared between pages, such as fonts
+    hash_memo = {}
+    resource_manager = CachingResourceManager(font_cache, hash_memo)
+    
+    def extract_page(page_num, page):
+        page_kind = classify_page(page)
+        if page_kind != PAGE_TEXT:
+            metrics.increment(f'pages_skipped_{page_kind}')
+            return page_kind, ''
         
-        pages_text = []
-        resource_manager = PDFResourceManager()
+        # Pages identical to one already extracted, in this or any other
+        # document, aren't interpreted again
+        page_hash = None
+        if store_folder:
+            try:
+                page_hash = page_content_hash(page, hash_memo, LAYOUT_PARAMS)
+            except Exception as e:
+                print(f"Error hashing page {page_num + 1}: {e}")
+            cached_text = load_page_text(store_folder, page_hash) if page_hash else None
+            if cached_text is not None:
+                metrics.increment('pages_deduplicated')
+                return page_kind, cached_text
         
-        with open(pdf_path, 'rb') as file:
-            for page_num, page in enumerate(PDFPage.get_pages(file)):
-                output_string = StringIO()
-                converter = TextConverter(resource_manager, output_string, laparams=laparams)
-                interpreter = PDFPageInterpreter(resource_manager, converter)
-                interpreter.process_page(page)
-                
-                page_text = output_string.getvalue()
-                pages_text.append(page_text)
-                
-                converter.close()
-                output_string.close()
-                
-        return pages_text
+        output_string = StringIO()
+        converter = TextConverter(resource_manager, output_string, laparams=laparams)
+        interpreter = PDFPageInterpreter(resource_manager, converter)
+        interpreter.process_page(page)
+        
+        page_text = output_string.getvalue()
+        metrics.increment('pages_extracted')
+        
+        converter.close()
+        output_string.close()
+        
+        if page_hash:
+            try:
+                save_page_text(store_folder, page_hash, page_text)
+            except OSError as e:
+                print(f"Error caching page text: {e}")
+        return page_kind, page_text
+    
+    return extract_page
+
+def iter_extracted_pages(pdf_path, start_page=0):
+    """Yield (page_kind, text) for each page of the PDF from ``start_page`` on
+    
+    Errors are left to the caller.
+    """
+    extract_page = page_extractor()
+    with open(pdf_path, 'rb') as file:
+        for page_num, page in enumerate(PDFPage.get_pages(file)):
+            if page_num < start_page:
+                continue
+            yield extract_page(page_num, page)
+
+def extract_pages(pdf_path):
+    """Extract (page_kind, text) for each page of the PDF"""
+    try:
+        return list(iter_extracted_pages(pdf_path))
     except Exception as e:
         print(f"Error extracting text by page: {e}")
         # Return an empty list for graceful handling
         return []
 
-def process_pdf(pdf_path, search_word):
-    """Process the PDF and build our data structure"""
-    # Data structure: list of tuples (page_number, preview_words, word_count)
-    pdf_data = []
-    total_count = 0
+def extract_text_by_page(pdf_path):
+    """Extract text from each page of the PDF separately"""
+    return [page_text for _, page_text in extract_pages(pdf_path)]
+
+def extract_processed_pages(pdf_path):
+    """Extract and preprocess each page, returning (pages_text, page_kinds)"""
+    pages = extract_pages(pdf_path)
+    return [preprocess_text(raw_text) for _, raw_text in pages], [page_kind for page_kind, _ in pages]
+
+def extract_with_checkpoints(pdf_path, doc_hash):
+    """Extract and preprocess each page, checkpointing pages as they complete
     
-    # Handle case where file doesn't exist
-    if not os.path.exists(pdf_path):
-        print(f"File not found: {pdf_path}")
-        return pdf_data, total_count
+    Pages checkpointed by an earlier, interrupted run are reused and
+    extraction resumes from the first missing page. Returns
+    (pages_text, page_kinds), or two empty lists if extraction fails; the
+    pages finished before the failure stay checkpointed for the retry.
+    """
+    store_folder = app.config['TEXT_STORE_FOLDER']
+    pages = load_checkpoints(store_folder, doc_hash)
+    if pages:
+        print(f"Resuming document {doc_hash} from page {len(pages) + 1}")
+        metrics.increment('pages_resumed', len(pages))
     
-    # Extract text from each page
-    pages_text = extract_text_by_page(pdf_path)
+    try:
+        for page_kind, raw_text in iter_extracted_pages(pdf_path, start_page=len(pages)):
+            page_text = preprocess_text(raw_text)
+            try:
+                save_checkpoint(store_folder, doc_hash, len(pages) + 1, page_kind, page_text)
+            except OSError as e:
+                print(f"Error checkpointing page {len(pages) + 1}: {e}")
+            pages.append((page_kind, page_text))
+    except Exception as e:
+        print(f"Error extracting text by page: {e}")
+        return [], []
+    return [page_text for _, page_text in pages], [page_kind for page_kind, _ in pages]
+
+def extract_selected_pages(pdf_path, page_numbers):
+    """Extract and preprocess only the given 1-based pages
     
-    # If no pages were extracted, return empty results
-    if not pages_text:
-        return pdf_data, total_count
+    Returns (page_numbers, pages_text, page_kinds) for the selected pages
+    that exist in the document. Only selected pages are interpreted.
+    """
+    selected = sorted(set(page_numbers))
+    pages = []
+    try:
+        extract_page = page_extractor()
+        with open(pdf_path, 'rb') as file:
+            # get_pages yields the selected pages in document order
+            for page_number, page in zip(selected, PDFPage.get_pages(file, pagenos={n - 1 for n in selected})):
+                page_kind, raw_text = extract_page(page_number - 1, page)
+                pages.append((page_number, page_kind, preprocess_text(raw_text)))
+    except Exception as e:
+        print(f"Error extracting selected pages: {e}")
+        return [], [], []
+    return [p[0] for p in pages], [p[2] for p in pages], [p[1] for p in pages]
+
+def select_pages(pdf_data, selected):
+    """Keep only the results for the selected page numbers, returning (pdf_data, total_count)"""
+    if selected is not None:
+        wanted = set(selected)
+        pdf_data = [entry for entry in pdf_data if entry[0] in wanted]
+    return pdf_data, sum(entry[2] for entry in pdf_data)
+
+def select_skipped_pages(page_index, kind, page_numbers=None, selected=None):
+    """Return the absolute numbers of selected pages of the given kind"""
+    skipped = page_index.skipped_pages(kind)
+    if page_numbers:
+        skipped = [page_numbers[i - 1] for i in skipped]
+    if selected is not None:
+        wanted = set(selected)
+        skipped = [page_number for page_number in skipped if page_number in wanted]
+    return skipped
+
+def search_syntax_error(search_word):
+    """Return why a boolean search (AND/OR/NOT) can't be parsed, or None"""
+    if not is_boolean_query(search_word):
+        return None
+    try:
+        parse_query(search_word)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def search_variants(page_index, search_word, stemming=False, limit=50):
+    """Return (term, count) for the document terms a wildcard, fuzzy or stemmed search matched"""
+    if is_boolean_query(search_word):
+        search_word = ' '.join(positive_terms(parse_query(search_word)))
+    return page_index.variants(search_word, stemming)[:limit]
+
+def page_preview(page_index, i, processed_text):
+    """Return the first few words of a page, or why it has none"""
+    preview_words = page_index.page_words(i, processed_text, limit=7)
+    if preview_words:
+        return ' '.join(preview_words)
+    if page_index.page_kind(i) == PAGE_IMAGE_ONLY:
+        return "(Image-only page, no text layer)"
+    if page_index.page_kind(i) == PAGE_BLANK:
+        return "(Blank page)"
+    return "(No text on page)"
+
+def count_pages(pages_text, search_word, page_index=None, page_numbers=None, stemming=False):
+    """Count a word, phrase or boolean search on already-preprocessed page text
     
-    for i, raw_text in enumerate(pages_text):
-        page_number = i + 1
-        
-        # Preprocess the text to handle common PDF issues
-        processed_text = preprocess_text(raw_text)
-        
-        # Get all words properly
-        all_words = re.findall(r'\b\w+\b', processed_text)
+    Counting uses the document's positional index, building one if none is
+    given. ``page_numbers`` gives the absolute number of each page when the
+    text is a selection of pages. With ``stemming`` every form of a word
+    counts ('terminate' also finds 'terminated' and 'termination').
+    """
+    # Data structure: list of tuples
+    # (page_number, preview, word_count, processed_text, preview_spans, page_words, matched)
+    pdf_data = []
+    total_count = 0
+    
+    if page_index is None:
+        page_index = PageIndex.build(pages_text)
+    # One search over the whole document gives the counts and the match offsets
+    page_counts, page_spans, matches = query_page_matches(page_index, search_word, stemming)
+    # Words per page come from the index built in the extraction pass
+    page_word_counts = page_index.page_word_counts()
+    
+    for i, processed_text in enumerate(pages_text):
+        page_number = page_numbers[i] if page_numbers else i + 1
         
-        # Get preview text (first few words)
-        preview = ' '.join(all_words[:7]) if all_words else "(No text on page)"
+        # Pages with matches show them in context (KWIC snippets), built
+        # from the index's token offsets; other pages show their first words
+        preview, preview_spans = '', []
+        if i in page_spans:
+            preview, preview_spans = page_index.snippets(i, processed_text, page_spans[i])
+        if not preview:
+            preview = page_preview(page_index, i, processed_text)
         
-        # Count occurrences of the search word
-        word_count = count_word_occurrences(processed_text, search_word)
+        # Occurrences of the search word or phrase; a page matched only
+        # through NOT in a boolean search matches with none
+        word_count = page_counts[i]
+        matched = bool(matches >> i & 1)
         
-        pdf_data.append((page_number, preview, word_count, processed_text))
+        pdf_data.append((page_number, preview, word_count, processed_text, preview_spans, page_word_counts[i], matched))
         total_count += word_count
     
     return pdf_data, total_count
 
+def iter_count_estimates(pdf_path, search_word, seed=None, page_numbers=None):
+    """Extract pages in stratified random order, yielding a refined estimate after each
+    
+    Yields (estimate, page_number, processed_text, count) where estimate is
+    an ApproximateCount for the whole document, or for the 1-based
+    ``page_numbers`` when given.
+    """
+    extract_page = page_extractor()
+    with open(pdf_path, 'rb') as file:
+        # Reading the page tree is cheap; only sampled pages are interpreted
+        pages = list(PDFPage.get_pages(file))
+        if page_numbers is None:
+            candidates = list(range(len(pages)))
+        else:
+            candidates = [n - 1 for n in sorted(set(page_numbers)) if n <= len(pages)]
+        strata = make_strata(len(candidates))
+        counts = {}
+        for sample in sample_order(strata, random.Random(seed)):
+            page_num = candidates[sample]
+            _, raw_text = extract_page(page_num, pages[page_num])
+            processed_text = preprocess_text(raw_text)
+            counts[sample] = PageIndex.build([processed_text]).page_counts(search_word)[0]
+            yield estimate_total(strata, counts), page_num + 1, processed_text, counts[sample]
+
+def estimate_pdf(pdf_path, search_word, time_budget=5.0, on_estimate=None, seed=None, page_numbers=None):
+    """Estimate a word or phrase count from a sample of pages within a time budget
+    
+    Returns (pdf_data, estimate): pdf_data covers only the sampled pages, in
+    page order, and estimate is an ApproximateCount. ``on_estimate`` is
+    called with each refined estimate as pages are processed.
+    """
+    pdf_data = []
+    estimate = ApproximateCount(0.0, 0.0, 0.0, 0, 0)
+    deadline = time.monotonic() + time_budget
+    try:
+        for estimate, page_number, processed_text, count in iter_count_estimates(
+                pdf_path, search_word, seed, page_numbers):
+            preview_words = text_words(processed_text, limit=7)
+            preview = ' '.join(preview_words) if preview_words else "(No text on page)"
+            pdf_data.append((page_number, preview, count, processed_text))
+            if on_estimate:
+                on_estimate(estimate)
+            if time.monotonic() >= deadline:
+                break
+    except Exception as e:
+        print(f"Error sampling pages: {e}")
+    
+    pdf_data.sort()
+    return pdf_data, estimate
+
+def process_pdf(pdf_path, search_word, approximate=False, time_budget=5.0, on_estimate=None, pages=None,
+                stemming=False):
+    """Process the PDF and build our data structure
+    
+    ``pages`` limits the search to the given 1-based page numbers; only
+    those pages are extracted and results keep absolute page numbers.
+    With ``approximate`` only a stratified sample of pages is extracted for
+    up to ``time_budget`` seconds, and the total is an ApproximateCount
+    (see estimate_pdf) instead of an exact count. ``stemming`` also counts
+    the other forms of each word (see count_pages).
+    """
+    # Handle case where file doesn't exist
+    if not os.path.exists(pdf_path):
+        print(f"File not found: {pdf_path}")
+        return [], 0
+    
+    if approximate:
+        return estimate_pdf(pdf_path, search_word, time_budget, on_estimate, page_numbers=pages)
+    
+    if pages is not None:
+        page_numbers, pages_text, page_kinds = extract_selected_pages(pdf_path, pages)
+        return count_pages(pages_text, search_word, PageIndex.build(pages_text, page_kinds), page_numbers, stemming)
+    
+    # Extract text from each page; an empty list gives empty results
+    pages_text, page_kinds = extract_processed_pages(pdf_path)
+    if pages_text and get_search_index() is not None:
+        index_document(document_hash(pdf_path), pages_text, os.path.basename(pdf_path))
+    return count_pages(pages_text, search_word, PageIndex.build(pages_text, page_kinds), stemming=stemming)
+
+def iter_processed_pages(pdf_path):
+    """Yield preprocessed page text lazily, ending quietly if extraction fails"""
+    try:
+        for _, raw_text in iter_extracted_pages(pdf_path):
+            yield preprocess_text(raw_text)
+    except Exception as e:
+        print(f"Error extracting text by page: {e}")
+
+def query_pdf(pdf_path, search_word, mode='exists', n=1):
+    """Answer an exists / first_n / at_least query, extracting only the pages needed
+    
+    Returns a QueryResult whose ``pages_examined`` says how many pages were
+    extracted before the answer was known. Raises FileNotFoundError if the
+    PDF is missing, rather than answering for a document with no pages.
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"File not found: {pdf_path}")
+    
+    with closing(iter_processed_pages(pdf_path)) as pages_text:
+        return run_query(pages_text, search_word, mode, n)
+
+def get_search_index():
+    """Return the cross-document search index, or None when it is disabled"""
+    path = app.config['SEARCH_INDEX_PATH']
+    if not path:
+        return None
+    if path not in search_indexes:
+        search_indexes[path] = SearchIndex(path, app.config['SEARCH_INDEX_BATCH_SIZE'])
+    return search_indexes[path]
+
+def index_document(doc_hash, pages_text, name=None):
+    """Add a whole document's preprocessed pages to the search index, if enabled and not there yet"""
+    search_index = get_search_index()
+    if search_index is None:
+        return
+    try:
+        if search_index.has_document(doc_hash):
+            return
+        search_index.add_document(doc_hash, pages_text, name)
+        # Other workers only see flushed documents
+        search_index.flush()
+    except Exception as e:
+        print(f"Error updating search index: {e}")
+
+def open_stored_document(doc_hash):
+    """Return (pages_text, page_index) for a stored document, or (None, None)"""
+    store_folder = app.config['TEXT_STORE_FOLDER']
+    pages_text = load_pages(store_folder, doc_hash)
+    if pages_text is None:
+        return None, None
+    
+    page_index = load_index(store_folder, doc_hash)
+    if page_index is None or page_index.page_count != len(pages_text):
+        # Text stored without an index, so build it once now
+        page_index = PageIndex.build(pages_text)
+        try:
+            save_index(store_folder, doc_hash, page_index)
+        except OSError as e:
+            print(f"Error storing page index: {e}")
+    return pages_text, page_index
+
+def load_document(pdf_path, doc_hash, name=None):
+    """Return (pages_text, page_index), extracting and indexing the PDF on a store miss
+    
+    Newly extracted documents are also added to the search index as ``name``.
+    """
+    pages_text, page_index = open_stored_document(doc_hash)
+    if pages_text is not None:
+        print(f"Using stored text for document {doc_hash}")
+        return pages_text, page_index
+    
+    pages_text, page_kinds = extract_with_checkpoints(pdf_path, doc_hash)
+    page_index = PageIndex.build(pages_text, page_kinds)
+    # Don't cache failed extractions so a retry gets another chance
+    if pages_text:
+        try:
+            save_pages(app.config['TEXT_STORE_FOLDER'], doc_hash, pages_text)
+            save_index(app.config['TEXT_STORE_FOLDER'], doc_hash, page_index)
+            clear_checkpoints(app.config['TEXT_STORE_FOLDER'], doc_hash)
+        except OSError as e:
+            print(f"Error storing extracted text: {e}")
+        index_document(doc_hash, pages_text, name)
+    return pages_text, page_index
+
+def selection_hash(doc_hash, selected):
+    """Return the text store key for a page selection of a document"""
+    return hashlib.sha256(f'{doc_hash}:{format_page_ranges(selected)}'.encode('utf-8')).hexdigest()
+
+def open_search_document(doc_hash, selected=None):
+    """Return (pages_text, page_index, page_numbers) for a stored document or page selection
+    
+    The whole document is used when it is stored; otherwise a stored
+    selection, whose ``page_numbers`` give each page's absolute number.
+    page_numbers is None for a whole document, and all three are None if
+    nothing is stored.
+    """
+    pages_text, page_index = open_stored_document(doc_hash)
+    if pages_text is not None or selected is None:
+        return pages_text, page_index, None
+    pages_text, page_index = open_stored_document(selection_hash(doc_hash, selected))
+    if pages_text is None:
+        return None, None, None
+    # Selected pages past the end of the document were never extracted
+    return pages_text, page_index, selected[:len(pages_text)]
+
+def load_selected_pages(pdf_path, doc_hash, selected):
+    """Extract and store only the selected pages, returning (pages_text, page_index, page_numbers)"""
+    page_numbers, pages_text, page_kinds = extract_selected_pages(pdf_path, selected)
+    page_index = PageIndex.build(pages_text, page_kinds)
+    if pages_text:
+        key = selection_hash(doc_hash, selected)
+        try:
+            save_pages(app.config['TEXT_STORE_FOLDER'], key, pages_text)
+            save_index(app.config['TEXT_STORE_FOLDER'], key, page_index)
+        except OSError as e:
+            print(f"Error storing extracted text: {e}")
+    return pages_text, page_index, page_numbers
+
+@app.errorhandler(Overloaded)
+def service_overloaded(error):
+    """Answer refused uploads quickly, telling the client when to retry"""
+    print(f"Refusing upload ({error.status_code}): {error.reason}")
+    response = app.make_response((
+        f"{error.reason}. Please try again in {error.retry_after} seconds.",
+        error.status_code
+    ))
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        # Check if the post request has the file part
-        if 'pdfFile' not in request.files:
-            flash('No file part')
-            return redirect(request.url)
-        
-        file = request.files['pdfFile']
-        search_word = request.form.get('searchWord', '').strip()
+        # Refuse before the upload is read or saved if we can't take on more work
+        with admission.admit(client_id()) as admission_ticket:
+            return process_upload(admission_ticket)
+    
+    return render_template('index.html')
+
+def process_upload(admission_ticket):
+    """Save an uploaded PDF, process it and redirect to the results"""
+    # Check if the post request has the file part
+    if 'pdfFile' not in request.files:
+        flash('No file part')
+        return redirect(request.url)
+    
+    file = request.files['pdfFile']
+    search_word = request.form.get('searchWord', '').strip()
+    stemming = 'stemming' in request.form
+    
+    # If user does not select file or word, redirect
+    if file.filename == '':
+        flash('No selected file')
+        return redirect(request.url)
+    if not search_word:
+        flash('No search word provided')
+        return redirect(request.url)
+    error = search_syntax_error(search_word)
+    if error:
+        flash(error)
+        return redirect(request.url)
+    
+    # Optional page selection, e.g. '1-40, 45'
+    try:
+        selected = parse_page_ranges(request.form.get('pages', ''))
+    except ValueError as e:
+        flash(str(e))
+        return redirect(request.url)
+    
+    if file and allowed_file(file.filename):
+        # Create a unique filename to avoid collisions
+        unique_filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
+        filepath = os.path.join(pending_uploads_dir, unique_filename)
         
-        # If user does not select file or word, redirect
-        if file.filename == '':
-            flash('No selected file')
+        print(f"Saving file to: {filepath}")
+        try:
+            file.save(filepath)
+        except Exception as e:
+            print(f"Error saving file: {e}")
+            flash('Error saving the file. Please try again.')
             return redirect(request.url)
-        if not search_word:
-            flash('No search word provided')
+        
+        if not os.path.exists(filepath):
+            print(f"ERROR: File was not saved properly at {filepath}")
+            flash('Error saving the file. Please try again.')
             return redirect(request.url)
         
-        if file and allowed_file(file.filename):
-            # Create a unique filename to avoid collisions
-            unique_filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-            filepath = os.path.join(uploads_dir, unique_filename)
-            
-            print(f"Saving file to: {filepath}")
-            try:
-                file.save(filepath)
-            except Exception as e:
-                print(f"Error saving file: {e}")
-                flash('Error saving the file. Please try again.')
+        # Process the PDF
+        try:
+            print(f"Processing PDF: {filepath}")
+            doc_hash = document_hash(filepath)
+            pages_text, page_index, page_numbers = open_search_document(doc_hash, selected)
+            if pages_text is None:
+                # Only extraction is worth scheduling; stored documents are cheap
+                estimate, lane = preflight_document(filepath, len(selected) if selected else None)
+                admission_ticket.reserve_pages(estimate.page_count)
+                with lane.slot(cost=estimate.estimated_seconds, client=client_id()):
+                    if selected is None:
+                        pages_text, page_index = load_document(filepath, doc_hash, file.filename)
+                    else:
+                        # Only the selected pages are extracted and stored
+                        pages_text, page_index, page_numbers = load_selected_pages(filepath, doc_hash, selected)
+            if not pages_text:
+                flash('Could not extract any text from the PDF. Please check the file and try again.')
                 return redirect(request.url)
+            pdf_data, total_count = select_pages(
+                count_pages(pages_text, search_word, page_index, page_numbers, stemming)[0], selected
+            )
             
-            if not os.path.exists(filepath):
-                print(f"ERROR: File was not saved properly at {filepath}")
-                flash('Error saving the file. Please try again.')
-                return redirect(request.url)
+            print(f"PDF processed. Total count: {total_count}, Pages: {len(pdf_data)}")
             
-            # Process the PDF
-            try:
-                print(f"Processing PDF: {filepath}")
-                pdf_data, total_count = process_pdf(filepath, search_word)
-                
-                print(f"PDF processed. Total count: {total_count}, Pages: {len(pdf_data)}")
-                
-                # Get the show sample text preference
-                show_sample = 'showSample' in request.form
-                
-                # Store results in session for the results page
-                session['pdf_results'] = {
-                    'filepath': filepath,
-                    'search_word': search_word,
-                    'pdf_data': [(page_num, preview, count) for page_num, preview, count, _ in pdf_data],
-                    'total_count': total_count,
-                    'show_sample': show_sample
+            # Get the show sample text preference
+            show_sample = 'showSample' in request.form
+            
+            # Store results in session for the results page
+            session['pdf_results'] = {
+                'filepath': filepath,
+                'doc_hash': doc_hash,
+                'search_word': search_word,
+                'pdf_data': PageResults.from_pdf_data(pdf_data).to_bytes(),
+                'total_count': total_count,
+                'show_sample': show_sample,
+                'pages': format_page_ranges(selected) if selected else None,
+                'stemming': stemming,
+                'variants': search_variants(page_index, search_word, stemming),
+                'top_words': page_index.top_terms(app.config['TOP_WORDS']),
+                # Pages with no extractable text, reported rather than searched
+                'skipped_pages': {
+                    kind: format_page_ranges(select_skipped_pages(page_index, kind, page_numbers, selected))
+                    for kind in (PAGE_IMAGE_ONLY, PAGE_BLANK)
                 }
-                
-                # Ensure session is saved
-                session.modified = True
-                
-                return redirect(url_for('results'))
-            except Exception as e:
-                import traceback
-                print(f"Error processing PDF: {str(e)}")
-                print(traceback.format_exc())
-                flash(f'Error processing PDF: {str(e)}')
-                return redirect(request.url)
-        else:
-            flash('Only PDF files are allowed')
+            }
+            
+            # Ensure session is saved
+            session.modified = True
+            
+            return redirect(url_for('results'))
+        except Overloaded:
+            raise
+        except Exception as e:
+            import traceback
+            print(f"Error processing PDF: {str(e)}")
+            print(traceback.format_exc())
+            flash(f'Error processing PDF: {str(e)}')
             return redirect(request.url)
+        finally:
+            # The text is stored by now, so the upload itself isn't needed
+            if os.path.exists(filepath):
+                os.remove(filepath)
+    else:
+        flash('Only PDF files are allowed')
+        return redirect(request.url)
+
+def results_etag(results, page=None):
+    """Return a strong ETag for the results page or a page view, or None if it can't be cached
     
-    return render_template('index.html')
+    The tag is derived from everything the response depends on: the
+    document hash, the normalized search and its options, the extraction
+    settings, the stored counts and the page. Nothing is cached while
+    flashed messages are waiting to be shown.
+    """
+    if not results.get('doc_hash') or session.get('_flashes'):
+        return None
+    # Counts can change without the search changing, e.g. when the same
+    # document and word are counted again by a newer worker
+    pdf_data = results.get('pdf_data')
+    if isinstance(pdf_data, bytes):
+        pdf_data = hashlib.sha256(pdf_data).hexdigest()
+    key = (
+        app.config['ETAG_VERSION'], STORE_FORMAT, sorted(LAYOUT_PARAMS.items()),
+        results['doc_hash'], normalize_text(results['search_word']), results.get('stemming', False),
+        results.get('pages'), results.get('show_sample', True), pdf_data, results.get('total_count'), page
+    )
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32]
+
+def not_modified(etag):
+    """Return a 304 response if the client's copy matches the ETag, otherwise None"""
+    if etag and request.if_none_match.contains(etag):
+        metrics.increment('not_modified')
+        return cacheable(app.response_class(status=304), etag)
+    return None
+
+def cacheable(response, etag):
+    """Tag a response with its ETag and let the browser keep a private copy it revalidates"""
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+    return response
 
 @app.route('/results')
 def results():
@@ -231,23 +858,39 @@ def results():
                 
         print(f"Results found. Search word: {results['search_word']}, Total count: {results['total_count']}")
         
-        # Filter to only show pages with occurrences
+        # A repeat view (e.g. the back button) is answered from the browser's copy
+        etag = results_etag(results)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Filter to only show matching pages
         pdf_data = results['pdf_data']
-        print(f"PDF data entries: {len(pdf_data)}")
         
         # Make sure the data structure is correct
         pages_with_occurrences = []
         try:
+            if isinstance(pdf_data, bytes):
+                # Compact representation stored by index()
+                pdf_data = PageResults.from_bytes(pdf_data)
+            print(f"PDF data entries: {len(pdf_data)}")
+            
             # Try to filter for pages with occurrences > 0
-            for entry in pdf_data:
+            for i, entry in enumerate(pdf_data):
                 if len(entry) != 3:
                     raise ValueError("Invalid data structure: entry should have 3 elements")
                 page_num, preview, count = entry
                 # Ensure count is an integer
                 if not isinstance(count, int):
                     count = 0  # Handle non-integer count values gracefully
-                if count > 0:
-                    pages_with_occurrences.append((page_num, preview, count))
+                matched = pdf_data.matched[i] if isinstance(pdf_data, PageResults) else count > 0
+                if matched:
+                    # Snippets come with the offsets of the matches to highlight
+                    if isinstance(pdf_data, PageResults):
+                        spans, words, density = pdf_data.preview_spans(i), pdf_data.word_counts[i], pdf_data.density(i)
+                    else:
+                        spans, words, density = [], None, None
+                    pages_with_occurrences.append((page_num, highlight_segments(preview, spans), count, words, density))
         except (ValueError, TypeError) as e:
             print(f"Error in data structure: {e}")
             flash('Error processing results. Please try again.')
@@ -259,14 +902,20 @@ def results():
         if len(pages_with_occurrences) == 0 and results['total_count'] == 0:
             print("No occurrences found in the document")
             
-        return render_template(
+        return cacheable(app.make_response(render_template(
             'results.html', 
             search_word=results['search_word'],
             pages=pages_with_occurrences,
             total_count=results['total_count'],
             pages_count=len(pages_with_occurrences),
-            show_sample=results.get('show_sample', True)
-        )
+            show_sample=results.get('show_sample', True),
+            can_refine='doc_hash' in results,
+            skipped_pages=results.get('skipped_pages', {}),
+            selected_pages=results.get('pages'),
+            variants=results.get('variants', []),
+            stemming=results.get('stemming', False),
+            top_words=results.get('top_words', [])
+        )), etag)
     except Exception as e:
         import traceback
         print(f"Error in results route: {str(e)}")
@@ -274,6 +923,33 @@ def results():
         flash('Error displaying results. Please try again.')
         return redirect(url_for('index'))
 
+@app.route('/results/export')
+def export_results():
+    """Download the current results as JSON: per-page counts, words and density, and the top words"""
+    results = session.get('pdf_results', None)
+    if not results or not isinstance(results.get('pdf_data'), bytes):
+        return jsonify({'error': 'No results to export. Please upload a PDF first.'}), 404
+    try:
+        pdf_data = PageResults.from_bytes(results['pdf_data'])
+    except ValueError:
+        return jsonify({'error': 'Stored results are invalid. Please search again.'}), 400
+    
+    pages = [
+        {'page': page_num, 'count': count, 'matched': bool(pdf_data.matched[i]),
+         'words': pdf_data.word_counts[i], 'density': pdf_data.density(i)}
+        for i, (page_num, _, count) in enumerate(pdf_data)
+    ]
+    response = jsonify({
+        'search_word': results['search_word'],
+        'stemming': results.get('stemming', False),
+        'total_count': results['total_count'],
+        'total_words': sum(pdf_data.word_counts),
+        'top_words': [{'word': word, 'count': count} for word, count in results.get('top_words', [])],
+        'pages': pages
+    })
+    response.headers['Content-Disposition'] = 'attachment; filename=results.json'
+    return response
+
 @app.route('/view_page/<int:page_num>')
 def view_page(page_num):
     results = session.get('pdf_results', None)
@@ -281,28 +957,323 @@ def view_page(page_num):
         flash('Session expired. Please upload the PDF again.')
         return redirect(url_for('index'))
     
-    # We need to reload the PDF to get the full text content
     filepath = results['filepath']
     search_word = results['search_word']
     
-    # Reprocess to get the full text content
-    pdf_data, _ = process_pdf(filepath, search_word)
+    etag = results_etag(results, page_num)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    # Validate page number
-    if page_num < 1 or page_num > len(pdf_data):
-        flash(f'Invalid page number: {page_num}')
-        return redirect(url_for('results'))
+    # Use the stored page text when we have it
+    pages_text = page_index = page_numbers = None
+    if results.get('doc_hash'):
+        pages_text, page_index, page_numbers = open_search_document(
+            results['doc_hash'], parse_page_ranges(results.get('pages'))
+        )
     
-    # Get the page data (zero-indexed)
-    page_data = pdf_data[page_num - 1]
+    if pages_text is not None:
+        # Position of the page in the stored text, which may be a page selection
+        if page_numbers is None:
+            position = page_num - 1
+        else:
+            position = page_numbers.index(page_num) if page_num in page_numbers else -1
+        if position < 0 or position >= len(pages_text):
+            flash(f'Invalid page number: {page_num}')
+            return redirect(url_for('results'))
+        full_text = pages_text[position]
+        match_spans = query_match_spans(page_index, search_word, position, results.get('stemming', False))
+    else:
+        # Reprocess to get the full text content
+        pdf_data, _ = process_pdf(filepath, search_word, stemming=results.get('stemming', False))
+        
+        # Validate page number
+        if page_num < 1 or page_num > len(pdf_data):
+            flash(f'Invalid page number: {page_num}')
+            return redirect(url_for('results'))
+        
+        # Get the page data (zero-indexed)
+        page_data = pdf_data[page_num - 1]
+        full_text = page_data[3]
+        match_spans = query_match_spans(PageIndex.build([full_text]), search_word, 0, results.get('stemming', False))
     
-    return render_template(
+    # Matching is done here, so the page only renders pre-segmented spans
+    return cacheable(app.make_response(render_template(
         'page_view.html',
         page_num=page_num,
         search_word=search_word,
-        word_count=page_data[2],
-        full_text=page_data[3]
+        word_count=len(match_spans),
+        segments=highlight_segments(full_text, match_spans)
+    )), etag)
+
+@app.route('/refine', methods=['POST'])
+def refine_search():
+    """Re-run only the counting step for a new word over the stored page text"""
+    results = session.get('pdf_results', None)
+    if not results:
+        flash('Session expired. Please upload the PDF again.')
+        return redirect(url_for('index'))
+    
+    search_word = request.form.get('searchWord', '').strip()
+    stemming = 'stemming' in request.form
+    if not search_word:
+        flash('No search word provided')
+        return redirect(url_for('results'))
+    error = search_syntax_error(search_word)
+    if error:
+        flash(error)
+        return redirect(url_for('results'))
+    
+    selected = parse_page_ranges(results.get('pages'))
+    pages_text = page_index = page_numbers = None
+    if results.get('doc_hash'):
+        pages_text, page_index, page_numbers = open_search_document(results['doc_hash'], selected)
+    if pages_text is None:
+        flash('The document text is no longer available. Please upload the PDF again.')
+        return redirect(url_for('index'))
+    
+    pdf_data, total_count = select_pages(
+        count_pages(pages_text, search_word, page_index, page_numbers, stemming)[0], selected
     )
+    print(f"Refined search for '{search_word}'. Total count: {total_count}")
+    
+    results['search_word'] = search_word
+    results['pdf_data'] = PageResults.from_pdf_data(pdf_data).to_bytes()
+    results['total_count'] = total_count
+    results['stemming'] = stemming
+    results['variants'] = search_variants(page_index, search_word, stemming)
+    results['top_words'] = page_index.top_terms(app.config['TOP_WORDS'])
+    session['pdf_results'] = results
+    session.modified = True
+    
+    return redirect(url_for('results'))
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Expose this worker's processing counters as JSON"""
+    return jsonify({
+        'counters': metrics.snapshot(),
+        'lanes': {name: lane.stats() for name, lane in processing_lanes.items()},
+        'admission': admission.stats(),
+        'font_cache': {'entries': len(font_cache), 'max_entries': font_cache.max_entries}
+    })
+
+@app.route('/api/search')
+def api_search():
+    """Search every indexed document for a word or phrase
+    
+    Query parameters: q, and optionally limit (most page hits returned).
+    Documents are listed with their total count, most mentions first.
+    """
+    search_index = get_search_index()
+    if search_index is None:
+        return jsonify({'error': 'The search index is not enabled'}), 404
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No search query provided'}), 400
+    try:
+        limit = int(request.args.get('limit', 0)) or None
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    try:
+        hits = search_index.search(query, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    documents = {}
+    for hit in hits:
+        document = documents.setdefault(hit.doc_hash, {
+            'doc_hash': hit.doc_hash, 'name': hit.name, 'total_count': 0, 'pages': []
+        })
+        document['total_count'] += hit.count
+        document['pages'].append({'page': hit.page_number, 'count': hit.count})
+    documents = sorted(documents.values(), key=lambda document: -document['total_count'])
+    return jsonify({
+        'query': query,
+        'total_count': sum(document['total_count'] for document in documents),
+        'documents': documents
+    })
+
+@app.route('/api/query', methods=['POST'])
+def api_query():
+    """Answer an early-terminating query about an uploaded PDF as JSON
+    
+    Form fields: pdfFile, searchWord, mode (exists, first_n or at_least) and n.
+    """
+    file = request.files.get('pdfFile')
+    search_word = request.form.get('searchWord', '').strip()
+    mode = request.form.get('mode', 'exists')
+    if not file or not file.filename or not allowed_file(file.filename):
+        return jsonify({'error': 'A PDF file is required'}), 400
+    if not search_word:
+        return jsonify({'error': 'No search word provided'}), 400
+    if mode not in QUERY_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(QUERY_MODES)}"}), 400
+    try:
+        n = int(request.form.get('n', 1))
+    except ValueError:
+        n = 0
+    if n < 1:
+        return jsonify({'error': 'n must be a positive integer'}), 400
+    
+    with admission.admit(client_id()) as admission_ticket:
+        # Kept out of the upload folder, which other requests' teardown empties
+        filepath = os.path.join(pending_uploads_dir, str(uuid.uuid4()) + '_' + secure_filename(file.filename))
+        file.save(filepath)
+        try:
+            pages_text, _ = open_stored_document(document_hash(filepath))
+            if pages_text is not None:
+                result = run_query(iter(pages_text), search_word, mode, n)
+            else:
+                estimate, lane = preflight_document(filepath)
+                admission_ticket.reserve_pages(estimate.page_count)
+                with lane.slot(cost=estimate.estimated_seconds, client=client_id()):
+                    result = query_pdf(filepath, search_word, mode, n)
+        except FileNotFoundError as e:
+            print(f"Error answering query: {e}")
+            return jsonify({'error': 'The uploaded file was lost before it could be read. Please try again.'}), 500
+        finally:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+    
+    metrics.increment('query_pages_examined', result.pages_examined)
+    return jsonify({
+        'search_word': search_word,
+        'mode': mode,
+        'n': n,
+        'answer': result.answer if mode != 'first_n' else [
+            {'page': page_number, 'count': count} for page_number, count in result.answer
+        ],
+        'total_count': result.total_count,
+        'pages_examined': result.pages_examined
+    })
+
+@app.route('/api/autocomplete')
+def api_autocomplete():
+    """Suggest terms of a processed document that start with ``prefix``
+    
+    ``doc`` is the SHA-256 hex digest of the PDF; without it the document
+    of the current results is used. Suggestions come from a binary search
+    of the document's sorted vocabulary, so they take the same time
+    however long the document is.
+    """
+    prefix = request.args.get('prefix', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    doc_hash = request.args.get('doc')
+    page_index = None
+    if doc_hash:
+        try:
+            _, page_index = open_stored_document(doc_hash)
+        except ValueError:
+            pass
+    else:
+        results = session.get('pdf_results') or {}
+        if results.get('doc_hash'):
+            _, page_index, _ = open_search_document(results['doc_hash'], parse_page_ranges(results.get('pages')))
+    if page_index is None:
+        return jsonify({'error': 'Document not found; upload it first'}), 404
+    
+    terms = page_index.terms_with_prefix(prefix, limit) if query_terms(prefix) == [prefix.casefold()] else []
+    return jsonify({
+        'prefix': prefix,
+        'suggestions': [{'term': term, 'count': len(page_index.postings[term])} for term in terms]
+    })
+
+@app.route('/api/fuzzy/<doc_hash>')
+def api_fuzzy(doc_hash):
+    """List the terms of a processed document within an edit distance of ``term``
+    
+    ``distance`` is 1 or 2; by default it follows the term's length. Each
+    variant comes with its count and page counts, and ``page_counts``
+    totals all variants per page.
+    """
+    term = request.args.get('term', '').strip()
+    if len(query_terms(term)) != 1:
+        return jsonify({'error': 'A single search term is required'}), 400
+    distance = request.args.get('distance', '')
+    if distance not in ('', '0', '1', '2'):
+        return jsonify({'error': 'distance must be 0, 1 or 2'}), 400
+    try:
+        pages_text, page_index = open_stored_document(doc_hash)
+    except ValueError:
+        pages_text = None
+    if pages_text is None:
+        return jsonify({'error': 'Document not found; upload it first'}), 404
+    
+    fuzzy_term = query_terms(term)[0].partition('~')[0] + '~' + distance
+    variants = []
+    for variant, variant_distance in page_index.fuzzy_matches(fuzzy_term):
+        page_counts = page_index.page_counts(variant)
+        variants.append({
+            'term': variant,
+            'distance': variant_distance,
+            'count': sum(page_counts),
+            'pages': {str(page + 1): count for page, count in enumerate(page_counts) if count}
+        })
+    page_counts = page_index.page_counts(fuzzy_term)
+    return jsonify({
+        'doc_hash': doc_hash,
+        'term': term,
+        'variants': variants,
+        'total_count': sum(page_counts),
+        'page_counts': {str(page + 1): count for page, count in enumerate(page_counts) if count}
+    })
+
+@app.route('/api/pages/<doc_hash>')
+def api_pages(doc_hash):
+    """List the pages of a processed document that match a boolean search
+    
+    ``q`` combines words and quoted phrases with AND, OR, NOT and
+    parentheses, e.g. ``liability AND cap AND NOT mutual``. The document
+    hash is the SHA-256 hex digest of the PDF.
+    """
+    query = request.args.get('q', '').strip()
+    try:
+        node = parse_query(query)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        pages_text, page_index = open_stored_document(doc_hash)
+    except ValueError:
+        pages_text = None
+    if pages_text is None:
+        return jsonify({'error': 'Document not found; upload it first'}), 404
+    
+    pages = [page + 1 for page in bitset_pages(evaluate(node, page_index))]
+    return jsonify({'doc_hash': doc_hash, 'query': query, 'page_count': page_index.page_count, 'pages': pages})
+
+@app.route('/api/progress/<doc_hash>')
+def api_progress(doc_hash):
+    """Report extraction progress for a document, with partial counts if ``word`` is given
+    
+    The document hash is the SHA-256 hex digest of the PDF. Until extraction
+    finishes, counts cover only the pages checkpointed so far.
+    """
+    store_folder = app.config['TEXT_STORE_FOLDER']
+    try:
+        pages_text, page_index = open_stored_document(doc_hash)
+    except ValueError:
+        return jsonify({'error': 'Invalid document hash'}), 404
+    
+    complete = pages_text is not None
+    if not complete:
+        pages = load_checkpoints(store_folder, doc_hash)
+        pages_text = [page_text for _, page_text in pages]
+        page_index = PageIndex.build(pages_text, [page_kind for page_kind, _ in pages])
+    
+    progress = {'doc_hash': doc_hash, 'complete': complete, 'pages_completed': len(pages_text)}
+    search_word = request.args.get('word', '').strip()
+    if search_word:
+        page_counts = page_index.page_counts(search_word)
+        progress['search_word'] = search_word
+        progress['total_count'] = sum(page_counts)
+        progress['page_counts'] = {str(page + 1): count for page, count in enumerate(page_counts) if count}
+    return jsonify(progress)
 
 @app.route('/new_search')
 def new_search():
@@ -320,6 +1291,27 @@ def new_search():
     
     return redirect(url_for('index'))
 
+def prune_text_store():
+    """Expire unused documents and cached pages from the text store"""
+    max_age = app.config['TEXT_STORE_MAX_AGE']
+    if max_age is None:
+        return
+    removed = prune_store(app.config['TEXT_STORE_FOLDER'], max_age)
+    if removed:
+        print(f"Pruned {removed} unused entries from the text store")
+
+def prune_text_store_periodically():
+    """Prune the text store every prune interval, off the request path"""
+    # The page cache can be large, so no request waits for a walk over it
+    while True:
+        time.sleep(app.config['TEXT_STORE_PRUNE_INTERVAL'])
+        try:
+            prune_text_store()
+        except Exception as e:
+            print(f"Error pruning the text store: {e}")
+
+threading.Thread(target=prune_text_store_periodically, name='text-store-pruner', daemon=True).start()
+
 # Clean up temporary files when the app shuts down
 @app.teardown_appcontext
 def cleanup_temp_files(exception=None):
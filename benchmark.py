@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Benchmark PDF extraction and text normalization over a corpus, and calibrate
+# the pre-flight cost model
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import preflight
+from app import app, extract_pages, preprocess_text
+
+
+def time_normalization(raw_pages):
+    """Return (characters, seconds) for normalizing the raw text of some pages"""
+    start_time = time.perf_counter()
+    for raw_text in raw_pages:
+        preprocess_text(raw_text)
+    return sum(len(raw_text) for raw_text in raw_pages), time.perf_counter() - start_time
+
+
+def benchmark_corpus(corpus_dir):
+    """Time extraction of every PDF in a directory
+
+    Returns a list of (filename, page_count, content_bytes, seconds,
+    characters, normalize_seconds): ``seconds`` covers extraction and
+    normalization, and the last two the normalization stage on its own.
+    """
+    rows = []
+    for filename in sorted(os.listdir(corpus_dir)):
+        if not filename.lower().endswith('.pdf'):
+            continue
+        path = os.path.join(corpus_dir, filename)
+        try:
+            page_count, content_bytes = preflight.read_features(path)
+        except Exception as e:
+            print(f"Skipping {filename}: {e}")
+            continue
+
+        start_time = time.perf_counter()
+        raw_pages = [raw_text for _, raw_text in extract_pages(path)]
+        extract_seconds = time.perf_counter() - start_time
+        characters, normalize_seconds = time_normalization(raw_pages)
+        rows.append((filename, page_count, content_bytes, extract_seconds + normalize_seconds,
+                     characters, normalize_seconds))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PDF extraction and calibrate the pre-flight cost model')
+    parser.add_argument('corpus', help='Directory of PDF files to benchmark')
+    args = parser.parse_args()
+    # Time real extraction, not lookups of pages cached by an earlier run
+    app.config['PAGE_TEXT_CACHE'] = False
+
+    rows = benchmark_corpus(args.corpus)
+    if not rows:
+        print("No PDF files found.")
+        return 1
+
+    print(f"{'File':40} {'Pages':>7} {'Content KB':>11} {'Seconds':>9} {'Predicted':>10} {'Norm MB/s':>10}")
+    for filename, page_count, content_bytes, seconds, characters, normalize_seconds in rows:
+        predicted = preflight.predict_seconds(page_count, content_bytes)
+        throughput = characters / normalize_seconds / 1e6 if normalize_seconds else 0.0
+        print(f"{filename[:40]:40} {page_count:>7} {content_bytes / 1024:>11.1f} {seconds:>9.3f} "
+              f"{predicted:>10.3f} {throughput:>10.1f}")
+
+    characters = sum(row[4] for row in rows)
+    normalize_seconds = sum(row[5] for row in rows)
+    if normalize_seconds:
+        print(f"\nNormalization: {characters / normalize_seconds / 1e6:.1f} million characters per second")
+
+    try:
+        model = preflight.calibrate([row[1:4] for row in rows])
+    except ValueError as e:
+        print(f"\nCould not calibrate: {e}")
+        return 1
+
+    print("\nCalibrated cost model (set app.config['PREFLIGHT_COST_MODEL']):")
+    print(json.dumps(model, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
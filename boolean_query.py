@@ -0,0 +1,216 @@
+import re
+from collections import namedtuple
+
+from page_index import query_terms
+
+# Operators are only recognised in capitals, so 'terms and conditions' is
+# still an ordinary phrase; quote a word to search for 'AND' itself
+OPERATORS = ('AND', 'OR', 'NOT')
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:([()])|"([^"]*)"?|([^\s()"]+))')
+
+Term = namedtuple('Term', ['phrase'])
+And = namedtuple('And', ['left', 'right'])
+Or = namedtuple('Or', ['left', 'right'])
+Not = namedtuple('Not', ['operand'])
+
+
+def _tokens(text):
+    # (kind, value) pairs: kind is 'paren', 'phrase', 'op' or 'word'
+    tokens = []
+    for paren, phrase, word in _TOKEN_PATTERN.findall(text):
+        if paren:
+            tokens.append(('paren', paren))
+        elif word in OPERATORS:
+            tokens.append(('op', word))
+        elif word:
+            tokens.append(('word', word))
+        elif phrase.strip():
+            tokens.append(('phrase', phrase))
+    return tokens
+
+
+def is_boolean_query(text):
+    """Return True if a search uses AND, OR or NOT
+
+    Parentheses alone don't count, so a plain search like 'C++ (beta)'
+    keeps its old meaning.
+    """
+    return any(kind == 'op' for kind, _ in _tokens(text or ''))
+
+
+class _Parser:
+    # Recursive descent, loosest first:
+    #   or  := and ('OR' and)*
+    #   and := not ('AND'? not)*
+    #   not := 'NOT' not | '(' or ')' | "quoted phrase" | word+
+    # Adjacent bare words form a phrase, as in an ordinary search
+
+    def __init__(self, text):
+        self.tokens = _tokens(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError('Empty search')
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f'Unexpected {self.peek()[1]!r} in search')
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == ('op', 'OR'):
+            self.take()
+            node = Or(node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while True:
+            kind, value = self.peek()
+            if (kind, value) == ('op', 'AND'):
+                self.take()
+            elif kind is None or value in ('OR', ')'):
+                return node
+            node = And(node, self.parse_not())
+
+    def parse_not(self):
+        kind, value = self.take()
+        if (kind, value) == ('op', 'NOT'):
+            return Not(self.parse_not())
+        if value == '(':
+            node = self.parse_or()
+            if self.take() != ('paren', ')'):
+                raise ValueError('Missing ) in search')
+            return node
+        if kind == 'phrase':
+            return self.term(value)
+        if kind == 'word':
+            words = [value]
+            while self.peek()[0] == 'word':
+                words.append(self.take()[1])
+            return self.term(' '.join(words))
+        if kind is None:
+            raise ValueError('Search ends where a word was expected')
+        raise ValueError(f'Unexpected {value!r} in search')
+
+    def term(self, phrase):
+        if not query_terms(phrase):
+            raise ValueError(f'No searchable words in {phrase!r}')
+        return Term(phrase)
+
+
+def parse_query(text):
+    """Parse a boolean search into a tree of Term, And, Or and Not nodes
+
+    Raises ValueError for malformed searches.
+    """
+    return _Parser(text or '').parse()
+
+
+def evaluate(node, page_index, universe=None, stemming=False):
+    """Return the bitset (bit i = page i) of pages matching a parsed query
+
+    NOT only selects pages that have text, so image-only and blank pages
+    never match.
+    """
+    if universe is None:
+        universe = page_index.text_page_bitset()
+    if isinstance(node, Term):
+        return page_index.page_bitset(node.phrase, stemming)
+    if isinstance(node, And):
+        left = evaluate(node.left, page_index, universe, stemming)
+        # Nothing ANDed with an empty set can match
+        return left & evaluate(node.right, page_index, universe, stemming) if left else 0
+    if isinstance(node, Or):
+        return evaluate(node.left, page_index, universe, stemming) | evaluate(node.right, page_index, universe, stemming)
+    return universe & ~evaluate(node.operand, page_index, universe, stemming)
+
+
+def positive_terms(node, negated=False):
+    """Return the phrases a query looks for, leaving out negated ones"""
+    if isinstance(node, Term):
+        return [] if negated else [node.phrase]
+    if isinstance(node, Not):
+        return positive_terms(node.operand, not negated)
+    return positive_terms(node.left, negated) + positive_terms(node.right, negated)
+
+
+def bitset_pages(bits):
+    """Return the zero-based page indexes set in a bitset, in order"""
+    # One pass over the binary digits, lowest page first
+    return [page for page, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
+
+
+def query_page_counts(page_index, query, stemming=False):
+    """Return per-page counts for a word, phrase or boolean search
+
+    For a boolean search only matching pages count; each counts the
+    occurrences of the terms it looks for, so a page matched only through
+    NOT counts 0 (query_page_matches tells which pages match).
+    """
+    if not is_boolean_query(query):
+        return page_index.page_counts(query, stemming)
+    node = parse_query(query)
+    counts = [0] * page_index.page_count
+    matching = bitset_pages(evaluate(node, page_index, stemming=stemming))
+    if not matching:
+        return counts
+    for phrase in positive_terms(node):
+        phrase_counts = page_index.page_counts(phrase, stemming)
+        for page in matching:
+            counts[page] += phrase_counts[page]
+    return counts
+
+
+def query_page_matches(page_index, query, stemming=False):
+    """Return (counts, spans, matches) for a word, phrase or boolean search in one pass over the document
+
+    ``counts`` is as for query_page_counts, ``spans`` maps each page
+    index with highlights to its sorted (start, end) match offsets and
+    ``matches`` is the bitset of matching pages, which includes pages
+    matched only through NOT.
+    """
+    if not is_boolean_query(query):
+        spans = page_index.document_match_spans(query, stemming)
+        counts = [0] * page_index.page_count
+        matches = 0
+        for page, page_spans in spans.items():
+            counts[page] = len(page_spans)
+            matches |= 1 << page
+        return counts, spans, matches
+    node = parse_query(query)
+    counts = [0] * page_index.page_count
+    matches = evaluate(node, page_index, stemming=stemming)
+    matching = bitset_pages(matches)
+    spans = {}
+    if not matching:
+        return counts, spans, matches
+    matching_set = set(matching)
+    for phrase in positive_terms(node):
+        for page, page_spans in page_index.document_match_spans(phrase, stemming).items():
+            if page in matching_set:
+                spans.setdefault(page, []).extend(page_spans)
+    for page, page_spans in spans.items():
+        page_spans.sort()
+        counts[page] = len(page_spans)
+    return counts, spans, matches
+
+
+def query_match_spans(page_index, query, page, stemming=False):
+    """Return the sorted (start, end) offsets to highlight on a page"""
+    if not is_boolean_query(query):
+        return page_index.match_spans(query, page, stemming)
+    spans = []
+    for phrase in positive_terms(parse_query(query)):
+        spans.extend(page_index.match_spans(phrase, page, stemming))
+    return sorted(spans)
@@ -0,0 +1,138 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+import metrics
+from page_hash import object_digest
+
+
+class _DetachingPickler(pickle.Pickler):
+    # Decoded fonts still point back into their source document (file
+    # handle, parser, xref) through their descriptor. Nothing reads those
+    # after the font is built, so they are dropped rather than kept alive.
+    def reducer_override(self, obj):
+        if isinstance(obj, (PDFObjRef, PDFStream)):
+            return type(None), ()
+        return NotImplemented
+
+
+def _dumps(font):
+    buffer = BytesIO()
+    _DetachingPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(font)
+    return buffer.getvalue()
+
+
+class FontCache:
+    """Process-wide LRU of decoded pdfminer fonts, keyed by font content hash.
+
+    Building a font parses its embedded font program, encoding and ToUnicode
+    CMap; documents that share fonts reuse the decoded object instead. With
+    a ``folder`` the fonts are also pickled to disk, so a restarted worker
+    starts warm.
+    """
+
+    def __init__(self, max_entries=256, folder=None):
+        self.max_entries = max_entries
+        self.folder = folder
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.font')
+
+    def get(self, key):
+        """Return the cached font for a key, or None"""
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+
+        if not self.folder:
+            return None
+        # Only fonts this cache wrote are ever unpickled
+        try:
+            with open(self._path(key), 'rb') as f:
+                font = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading cached font {key}: {e}")
+            return None
+        self._remember(key, font)
+        return font
+
+    def put(self, key, font):
+        """Cache a newly built font and return the copy that is kept"""
+        try:
+            data = _dumps(font)
+        except Exception as e:
+            print(f"Error caching font: {e}")
+            return font
+        font = pickle.loads(data)
+        self._remember(key, font)
+
+        if self.folder:
+            path = self._path(key)
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except OSError as e:
+                print(f"Error writing cached font: {e}")
+        return font
+
+    def _remember(self, key, font):
+        with self._lock:
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.max_entries:
+                self._fonts.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._fonts)
+
+    def clear(self):
+        """Forget the fonts held in memory (files on disk are kept)"""
+        with self._lock:
+            self._fonts.clear()
+
+
+class CachingResourceManager(PDFResourceManager):
+    """Resource manager that looks fonts up in a shared FontCache
+
+    pdfminer only caches fonts per document by object number; this keys
+    them by a hash of the font dictionary and the streams it references.
+    Pass the page-hash ``memo`` of the document to share hashing work.
+    """
+
+    def __init__(self, font_cache, memo=None):
+        super().__init__(caching=True)
+        self.font_cache = font_cache
+        self.memo = {} if memo is None else memo
+
+    def get_font(self, objid, spec):
+        # Every page of a document asks for its fonts again
+        if objid and objid in self._cached_fonts:
+            return self._cached_fonts[objid]
+
+        key = object_digest(spec, self.memo).hex()
+        font = self.font_cache.get(key)
+        if font is not None:
+            metrics.increment('font_cache_hits')
+        else:
+            metrics.increment('font_cache_misses')
+            # Type0 fonts recurse into get_font for their descendant font
+            font = self.font_cache.put(key, super().get_font(None, spec))
+        if objid:
+            self._cached_fonts[objid] = font
+        return font
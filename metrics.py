@@ -0,0 +1,25 @@
+import threading
+from collections import Counter
+
+# Simple in-process counters. Each gunicorn worker keeps its own set, so
+# scrape every worker (or sum them) to get service-wide numbers.
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def increment(name, amount=1):
+    """Add ``amount`` to the named counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot():
+    """Return a copy of all counters"""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """Clear all counters (used by tests)"""
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,42 @@
+import re
+import unicodedata
+
+# Characters that survive NFKC but split or hide words in extracted PDF
+# text. (NFKC itself expands ligatures such as U+FB01 'fi' and turns
+# no-break spaces into plain spaces.)
+_REPLACEMENTS = {
+    # Hyphen, non-breaking hyphen, figure dash, en dash, em dash, horizontal bar
+    '\u2010': '-', '\u2011': '-', '\u2012': '-', '\u2013': '-', '\u2014': '-', '\u2015': '-',
+    # Soft hyphen, zero-width space, word joiner, byte order mark
+    '\u00ad': '', '\u200b': '', '\u2060': '', '\ufeff': '',
+}
+
+# A hyphen of any kind before a line break joins the two halves of a word
+_LINE_BREAK_HYPHENS = '-\u00ad\u2010\u2011'
+
+# Everything after NFKC happens in this one pass: hyphenated line breaks,
+# whitespace other than single spaces, and the replacements above
+_CLEANUP_PATTERN = re.compile(
+    '[' + _LINE_BREAK_HYPHENS + r']\s*\n\s*|[^\S ]\s*| \s+|[' + ''.join(_REPLACEMENTS) + ']'
+)
+
+
+def _cleanup(match):
+    text = match.group()
+    if len(text) > 1 and text[0] in _LINE_BREAK_HYPHENS:
+        return ''
+    # Whitespace runs are the only matches without a replacement
+    return _REPLACEMENTS.get(text, ' ')
+
+
+def normalize_text(text):
+    """Normalize the extracted text of a page for display and indexing
+
+    NFKC (skipped for pure ASCII text), then a single regex pass that
+    joins words hyphenated across lines, maps Unicode hyphens and dashes,
+    drops soft hyphens and zero-width characters and collapses whitespace.
+    Case is kept; the index casefolds terms itself.
+    """
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return _CLEANUP_PATTERN.sub(_cleanup, text).strip()
@@ -0,0 +1,79 @@
+import hashlib
+
+from pdfminer.psparser import PSKeyword, PSLiteral
+from pdfminer.pdftypes import PDFObjRef, PDFStream, resolve1
+
+# Bump when the hashing scheme changes so text cached under old hashes is ignored
+PAGE_HASH_VERSION = b'page-hash-1'
+
+# Resource graphs are walked no deeper than this
+MAX_DEPTH = 16
+
+# Page attributes besides content and resources that change the extracted text
+_LAYOUT_KEYS = ('MediaBox', 'CropBox', 'Rotate')
+
+
+def object_digest(obj, memo, depth=0):
+    """Return a digest of a PDF object's content, independent of object numbers
+
+    Streams are hashed by their decoded data, except images, whose pixels
+    can't change the extracted text. ``memo`` maps object ids to digests
+    so objects shared between pages are only hashed once per document.
+    """
+    objid = obj.objid if isinstance(obj, PDFObjRef) else None
+    if objid is not None:
+        if objid in memo:
+            return memo[objid]
+        # Placeholder that breaks reference cycles
+        memo[objid] = b'cycle'
+
+    digest = hashlib.sha256()
+    value = resolve1(obj)
+    if depth > MAX_DEPTH:
+        digest.update(b'deep')
+    elif isinstance(value, PDFStream):
+        digest.update(b's')
+        digest.update(object_digest(value.attrs, memo, depth + 1))
+        if getattr(value.get('Subtype'), 'name', None) != 'Image':
+            digest.update(value.get_data())
+    elif isinstance(value, dict):
+        digest.update(b'd')
+        for key in sorted(value, key=str):
+            digest.update(str(key).encode('utf-8'))
+            digest.update(object_digest(value[key], memo, depth + 1))
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'l')
+        for item in value:
+            digest.update(object_digest(item, memo, depth + 1))
+    elif isinstance(value, (PSLiteral, PSKeyword)):
+        digest.update(b'n')
+        digest.update(repr(value.name).encode('utf-8'))
+    else:
+        digest.update(repr(value).encode('utf-8'))
+
+    result = digest.digest()
+    if objid is not None:
+        memo[objid] = result
+    return result
+
+
+def page_content_hash(page, memo=None, settings=None):
+    """Return a hex digest identifying the text a page will extract to
+
+    Covers the decoded content streams, the resources they can use (fonts,
+    Form XObjects) and the page geometry, but no object numbers, so the
+    same page in another document or revision gets the same hash. Pass one
+    ``memo`` dict for all pages of a document, and the layout ``settings``
+    the text is extracted with.
+    """
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256(PAGE_HASH_VERSION)
+    digest.update(repr(sorted((settings or {}).items())).encode('utf-8'))
+    for key in _LAYOUT_KEYS:
+        digest.update(object_digest(page.attrs.get(key), memo))
+    for stream in page.contents:
+        stream = resolve1(stream)
+        if isinstance(stream, PDFStream):
+            digest.update(stream.get_data())
+    digest.update(object_digest(page.resources, memo))
+    return digest.hexdigest()
@@ -0,0 +1,465 @@
+import heapq
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from fuzzy import MAX_DISTANCE, auto_distance, deletion_index
+from normalize import normalize_text
+from stemmer import stem, term_families
+
+# Scripts written without spaces between words: Hiragana, Katakana, CJK
+# ideographs (with extensions and compatibility forms) and Hangul
+CJK_CHARS = '\u3005\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\U00020000-\U0003134f'
+CJK_PATTERN = re.compile('[' + CJK_CHARS + ']')
+
+# A token is a run of word characters, the same unit `\b\w+\b` matches,
+# except that a run of CJK characters is kept apart from its neighbours
+# and split into overlapping bigrams (see tokenize)
+TOKEN_PATTERN = re.compile('([' + CJK_CHARS + ']+)|[^\\W' + CJK_CHARS + ']+')
+
+# Search terms may also contain wildcards: * for any run of characters and
+# ? for exactly one ('indemnif*', 'organi?ation'), or end in ~ to match
+# terms within an edit distance, ~1 or ~2 to set it ('indemnity~')
+QUERY_TOKEN_PATTERN = re.compile(r'[\w*?]+(?:~\d*)?')
+WILDCARD_CHARS = re.compile(r'[*?]')
+
+# Sorts after every character, so prefix + it bounds the terms with that prefix
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def _cjk_terms(run):
+    # Overlapping bigrams, then the last character on its own, so a run of
+    # n characters gives n terms and each term starts at its own character
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize(text):
+    """Yield (term, start, end) for each token in text; terms are casefolded
+
+    CJK runs, which have no spaces between words, give one token per
+    character: the bigram starting there, or the character alone at the
+    end of the run. A CJK word is then a phrase of consecutive bigrams.
+    """
+    for match in TOKEN_PATTERN.finditer(text):
+        if match.group(1) is None:
+            yield match.group().casefold(), match.start(), match.end()
+        else:
+            for offset, term in enumerate(_cjk_terms(match.group()), match.start()):
+                yield term, offset, offset + len(term)
+
+
+def query_terms(query):
+    """Split a search word or phrase into the terms the index matches on
+
+    Terms keep any wildcards and fuzzy suffix; a trailing ? is taken as
+    punctuation, and tokens with no word characters are dropped.
+    """
+    terms = []
+    # Set when the last term is the closing character of a CJK run
+    run_end = False
+    # Queries are normalized like page text, so 'ﬁnal' finds 'final'
+    for match in QUERY_TOKEN_PATTERN.finditer(normalize_text(query or '')):
+        term, tilde, distance = match.group().partition('~')
+        term = term.rstrip('?')
+        if CJK_PATTERN.search(term):
+            # Tokenized like page text; wildcards and fuzzy suffixes don't apply
+            tokens = list(tokenize(term))
+            terms.extend(token for token, _, _ in tokens)
+            # A lone character ending where the bigram before it ends
+            run_end = len(tokens) > 1 and tokens[-1][2] == tokens[-2][2]
+        elif TOKEN_PATTERN.search(term):
+            terms.append(term.casefold() + tilde + distance)
+            run_end = False
+    # A run's last character is matched by the bigram ending the run; it
+    # only needs a term of its own when more of the query follows
+    if run_end:
+        terms.pop()
+    return terms
+
+
+def is_wildcard(term):
+    return WILDCARD_CHARS.search(term) is not None
+
+
+def is_fuzzy(term):
+    return '~' in term
+
+
+def is_cjk(term):
+    return CJK_PATTERN.match(term) is not None
+
+
+def _is_cjk_character(term):
+    return len(term) == 1 and is_cjk(term)
+
+
+# Keyword-in-context snippets: tokens shown either side of a match, and
+# the most snippets kept per page
+SNIPPET_CONTEXT = 6
+SNIPPET_LIMIT = 3
+SNIPPET_ELLIPSIS = '\u2026'
+
+# How many of the most frequent terms an index keeps, and the words left
+# out of them: English function words and numbers say nothing about a document
+TOP_TERMS = 50
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can for from had has have he her his i if in into is it its
+may must no not of on or our shall she should that the their them there these they this those
+to was we were which will with would you your
+""".split())
+
+_PAGE_KIND_NAMES = {'t': 'text', 'i': 'image', 'b': 'blank'}
+
+
+class PageIndex:
+    """Positional token index over the pages of one document.
+
+    Every token in the document gets a global position; ``postings`` maps
+    each term to the sorted positions where it occurs and ``starts``/``ends``
+    hold each token's character offsets within its page. Phrase queries are
+    answered by merging position lists, and the same positions give the
+    character offsets used for highlighting.
+    """
+
+    # One letter per page for the kind reported by the extractor
+    # ('t'ext, 'i'mage-only, 'b'lank); None means every page had text
+    page_kinds = None
+
+    # Sorted distinct terms, for prefix and wildcard lookups; indexes stored
+    # before it existed build it on first use
+    vocabulary = None
+
+    # The TOP_TERMS most frequent (term, count) pairs, most frequent first,
+    # computed with the index and stored with it
+    frequent_terms = None
+
+    def __init__(self):
+        self.postings = {}
+        self.starts = array('I')
+        self.ends = array('I')
+        # Global position of the first token of each page, plus the total
+        self.page_starts = array('I', [0])
+
+    @classmethod
+    def build(cls, pages_text, page_kinds=None):
+        """Build an index from the preprocessed text of each page"""
+        index = cls()
+        if page_kinds is not None:
+            index.page_kinds = ''.join(kind[0] for kind in page_kinds)
+        postings = {}
+        position = 0
+        for page_text in pages_text:
+            for term, start, end in tokenize(page_text):
+                positions = postings.get(term)
+                if positions is None:
+                    positions = postings[term] = array('I')
+                positions.append(position)
+                index.starts.append(start)
+                index.ends.append(end)
+                position += 1
+            index.page_starts.append(position)
+        index.postings = postings
+        index.vocabulary = sorted(postings)
+        index.top_terms()
+        return index
+
+    @property
+    def page_count(self):
+        return len(self.page_starts) - 1
+
+    def page_kind(self, page_index):
+        """Return 'text', 'image' or 'blank' for a page"""
+        if not self.page_kinds:
+            return 'text'
+        return _PAGE_KIND_NAMES[self.page_kinds[page_index]]
+
+    def skipped_pages(self, kind):
+        """Return the 1-based numbers of pages of the given kind"""
+        code = kind[0]
+        return [i + 1 for i, page_code in enumerate(self.page_kinds or '') if page_code == code]
+
+    def text_page_bitset(self):
+        """Return an int whose bit i is set when page i has text"""
+        if not self.page_kinds:
+            return (1 << self.page_count) - 1
+        return int(''.join('1' if code == 't' else '0' for code in reversed(self.page_kinds)) or '0', 2)
+
+    def page_of(self, position):
+        """Return the zero-based page index that a global token position is on"""
+        return bisect_right(self.page_starts, position) - 1
+
+    def terms(self):
+        """Return the sorted, distinct terms of the document"""
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        return self.vocabulary
+
+    def top_terms(self, limit=TOP_TERMS):
+        """Return the most frequent (term, count) pairs, leaving out STOP_WORDS and numbers
+
+        Counts are the lengths of the postings lists, so this needs no pass
+        over the text.
+        """
+        if self.frequent_terms is not None and limit <= TOP_TERMS:
+            return self.frequent_terms[:limit]
+        counts = ((term, len(positions)) for term, positions in self.postings.items()
+                  if term not in STOP_WORDS and not term.isdigit())
+        # Ties keep the order in which the terms first appear
+        top = heapq.nlargest(max(limit, TOP_TERMS), counts, key=lambda item: item[1])
+        self.frequent_terms = top[:TOP_TERMS]
+        return top[:limit]
+
+    def page_word_counts(self):
+        """Return the number of tokens on each page"""
+        return [self.page_starts[i + 1] - self.page_starts[i] for i in range(self.page_count)]
+
+    def terms_with_prefix(self, prefix, limit=None):
+        """Return the terms starting with a prefix, in order, by binary search"""
+        vocabulary = self.terms()
+        prefix = prefix.casefold()
+        low = bisect_left(vocabulary, prefix)
+        high = bisect_left(vocabulary, prefix + _MAX_CHAR, low)
+        if limit is not None:
+            high = min(high, low + limit)
+        return vocabulary[low:high]
+
+    def expand_wildcard(self, pattern):
+        """Return the terms matching a pattern with * and ? wildcards"""
+        pattern = pattern.casefold()
+        # Only terms sharing the literal prefix can match
+        literal = WILDCARD_CHARS.split(pattern, 1)[0]
+        candidates = self.terms_with_prefix(literal)
+        if pattern == literal + '*':
+            return candidates
+        regex = re.compile(''.join(
+            '.*' if char == '*' else '.' if char == '?' else re.escape(char) for char in pattern
+        ), re.DOTALL)
+        return [term for term in candidates if regex.fullmatch(term)]
+
+    def fuzzy_matches(self, term):
+        """Return (term, distance) for the terms within a fuzzy term's edit distance
+
+        ``term`` is a word followed by ~ and, optionally, the distance.
+        """
+        word, _, distance = term.casefold().partition('~')
+        distance = min(int(distance), MAX_DISTANCE) if distance else auto_distance(word)
+        return deletion_index(self, distance).lookup(word, distance)
+
+    def expand_term(self, term, stemming=False):
+        """Return the terms of the document a query term matches
+
+        With ``stemming`` a plain term matches every term with its stem.
+        """
+        if is_fuzzy(term):
+            return [match for match, _ in self.fuzzy_matches(term)]
+        if _is_cjk_character(term):
+            # Every occurrence of a CJK character starts a term beginning with it
+            return self.terms_with_prefix(term)
+        if is_wildcard(term):
+            return self.expand_wildcard(term)
+        if stemming:
+            return term_families(self).get(stem(term), [])
+        return [term] if term in self.postings else []
+
+    def variants(self, query, stemming=False):
+        """Return (term, count) for each term the wildcard, fuzzy or stemmed terms of a query matched"""
+        counts = {}
+        for term in query_terms(query):
+            if stemming or is_fuzzy(term) or is_wildcard(term):
+                for match in self.expand_term(term, stemming):
+                    counts[match] = len(self.postings[match])
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def _positions(self, term, page_index=None, stemming=False):
+        if stemming or is_wildcard(term) or is_fuzzy(term) or _is_cjk_character(term):
+            # Merge the sorted postings of every matching term
+            matches = [self.postings[match] for match in self.expand_term(term, stemming)]
+            if len(matches) > 1:
+                positions = array('I', heapq.merge(*matches))
+            else:
+                positions = matches[0] if matches else None
+        else:
+            positions = self.postings.get(term)
+        if positions is None or page_index is None:
+            return positions
+        # Postings are sorted, so one page's positions are a contiguous slice
+        low = bisect_left(positions, self.page_starts[page_index])
+        high = bisect_left(positions, self.page_starts[page_index + 1])
+        return positions[low:high]
+
+    def find(self, query, page_index=None, stemming=False):
+        """Return the global start positions of every match of a word or phrase.
+
+        If ``page_index`` is given only that page is searched. With
+        ``stemming`` each term also matches the other forms of the word.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        first = self._positions(terms[0], page_index, stemming)
+        if not first:
+            return []
+        if len(terms) == 1:
+            return list(first)
+
+        # Shift each later term's positions back by its offset in the phrase
+        # and intersect, so only runs of consecutive tokens survive
+        candidates = set(first)
+        for offset, term in enumerate(terms[1:], 1):
+            positions = self._positions(term, page_index, stemming)
+            if not positions:
+                return []
+            candidates.intersection_update(p - offset for p in positions)
+            if not candidates:
+                return []
+
+        # A phrase must not run across a page boundary
+        last = len(terms) - 1
+        return sorted(p for p in candidates if self.page_of(p) == self.page_of(p + last))
+
+    def page_counts(self, query, stemming=False):
+        """Return the number of matches on each page"""
+        counts = [0] * self.page_count
+        for position in self.find(query, stemming=stemming):
+            counts[self.page_of(position)] += 1
+        return counts
+
+    def page_bitset(self, query, stemming=False):
+        """Return an int whose bit i is set when page i matches the word or phrase"""
+        bitmap = bytearray((self.page_count + 7) // 8)
+        page_end = 0
+        for position in self.find(query, stemming=stemming):
+            # Positions are sorted, so only look the page up on leaving the last one
+            if position >= page_end:
+                page = self.page_of(position)
+                bitmap[page >> 3] |= 1 << (page & 7)
+                page_end = self.page_starts[page + 1]
+        return int.from_bytes(bitmap, 'little')
+
+    def _span(self, terms, position):
+        # Character offsets of the match of terms starting at a global position
+        last = position + len(terms) - 1
+        if _is_cjk_character(terms[-1]):
+            # The last token matched may be a bigram, of which only the first character counts
+            return self.starts[position], self.starts[last] + 1
+        return self.starts[position], self.ends[last]
+
+    def match_spans(self, query, page_index, stemming=False):
+        """Return (start, end) character offsets of the matches on one page"""
+        terms = query_terms(query)
+        return [self._span(terms, p) for p in self.find(query, page_index, stemming)]
+
+    def document_match_spans(self, query, stemming=False):
+        """Return {page index: [(start, end), ...]} for every page with a match
+
+        The whole document is searched once, so this costs the same as
+        page_counts however many pages match.
+        """
+        terms = query_terms(query)
+        spans = {}
+        page, page_end = -1, 0
+        for position in self.find(query, stemming=stemming):
+            # Positions are sorted, so only look the page up on leaving the last one
+            if position >= page_end:
+                page = self.page_of(position)
+                page_end = self.page_starts[page + 1]
+                spans[page] = []
+            spans[page].append(self._span(terms, position))
+        return spans
+
+    def snippets(self, page_index, page_text, spans, context=SNIPPET_CONTEXT, limit=SNIPPET_LIMIT):
+        """Return (text, spans) for keyword-in-context snippets around matches on a page
+
+        Each match is shown with ``context`` tokens either side, taken from
+        the token offsets in the index. Overlapping windows are merged,
+        at most ``limit`` windows are kept and they are joined with an
+        ellipsis. ``spans`` are the page's sorted match offsets; the
+        returned spans locate the matches in the snippet text.
+        """
+        first, last = self.page_starts[page_index], self.page_starts[page_index + 1]
+        windows = []
+        for start, end in spans:
+            # Tokens from the match's first to the last one starting inside it
+            low = max(bisect_left(self.starts, start, first, last) - context, first)
+            high = min(bisect_left(self.starts, end, first, last) - 1 + context, last - 1)
+            if windows and low <= windows[-1][1] + 1:
+                window = windows[-1]
+                window[1] = max(window[1], high)
+                window[2].append((start, end))
+            elif len(windows) < limit:
+                windows.append([low, high, [(start, end)]])
+            else:
+                break
+
+        parts = []
+        snippet_spans = []
+        length = 0
+        for low, high, matches in windows:
+            text_start, text_end = self.starts[low], self.ends[high]
+            if parts:
+                prefix = f' {SNIPPET_ELLIPSIS} '
+            else:
+                prefix = f'{SNIPPET_ELLIPSIS} ' if text_start > 0 else ''
+            offset = length + len(prefix) - text_start
+            snippet_spans.extend((start + offset, min(end, text_end) + offset) for start, end in matches)
+            parts.append(prefix + page_text[text_start:text_end])
+            length += len(parts[-1])
+        if windows and self.ends[windows[-1][1]] < len(page_text):
+            parts.append(f' {SNIPPET_ELLIPSIS}')
+        return ''.join(parts), snippet_spans
+
+    def page_words(self, page_index, page_text, limit=None):
+        """Return the words of a page in their original case"""
+        first, last = self.page_starts[page_index], self.page_starts[page_index + 1]
+        if limit is not None:
+            last = min(last, first + limit)
+        return _words(page_text, zip(self.starts[first:last], self.ends[first:last]))
+
+
+def _words(text, spans):
+    # Words from token offsets; the tokens of a CJK run overlap, so each
+    # gives its first character and together they make up the run
+    words = []
+    run_end = None
+    for start, end in spans:
+        if CJK_PATTERN.match(text, start):
+            if start == run_end:
+                words[-1] += text[start]
+            else:
+                words.append(text[start])
+            run_end = start + 1
+        else:
+            words.append(text[start:end])
+            run_end = None
+    return words
+
+
+def text_words(text, limit=None):
+    """Return the words of a text in their original case, up to limit tokens"""
+    spans = ((start, end) for _, start, end in tokenize(text))
+    return _words(text, islice(spans, limit))
+
+
+def highlight_segments(text, spans):
+    """Split text into (segment, is_match) pairs from sorted match offsets
+
+    Overlapping spans, as a repeated phrase can produce, are merged.
+    """
+    segments = []
+    position = 0
+    for start, end in spans:
+        if start < position:
+            # Overlaps the previous match, so extend it
+            if end > position:
+                previous, _ = segments.pop()
+                segments.append((previous + text[position:end], True))
+                position = end
+            continue
+        if start > position:
+            segments.append((text[position:start], False))
+        segments.append((text[start:end], True))
+        position = end
+    if position < len(text) or not segments:
+        segments.append((text[position:], False))
+    return segments
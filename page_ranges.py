@@ -0,0 +1,53 @@
+# Highest page number a selection may name; ranges are expanded into lists,
+# so an unbounded '1-999999999' would exhaust memory
+MAX_PAGE_NUMBER = 100000
+
+
+def parse_page_ranges(text, page_count=None):
+    """Parse a page selection like '1-10, 15, 20-' into sorted 1-based page numbers
+
+    Open-ended ranges need ``page_count``. Returns None for an empty
+    selection (meaning every page) and raises ValueError if it is malformed
+    or names a page above MAX_PAGE_NUMBER.
+    """
+    if not text or not text.strip():
+        return None
+
+    pages = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition('-')
+        try:
+            first = int(first)
+            if not dash:
+                last = first
+            elif last.strip():
+                last = int(last)
+            elif page_count is not None:
+                last = page_count
+            else:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f'Invalid page range: {part!r}')
+        if first < 1 or last < first:
+            raise ValueError(f'Invalid page range: {part!r}')
+        # Checked before expanding the range
+        if last > MAX_PAGE_NUMBER:
+            raise ValueError(f'Page numbers above {MAX_PAGE_NUMBER} are not supported: {part!r}')
+        pages.update(range(first, last + 1))
+    if not pages:
+        raise ValueError('No pages selected')
+    return sorted(pages)
+
+
+def format_page_ranges(page_numbers):
+    """Format sorted page numbers compactly, e.g. [1, 2, 3, 7] -> '1-3, 7'"""
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and ranges[-1][1] == page_number - 1:
+            ranges[-1][1] = page_number
+        else:
+            ranges.append([page_number, page_number])
+    return ', '.join(str(first) if first == last else f'{first}-{last}' for first, last in ranges)
@@ -0,0 +1,168 @@
+import struct
+import sys
+from array import array
+
+
+class PageResults:
+    """Compact container for per-page search results.
+
+    Page numbers, counts and words per page are stored in ``array('I')``
+    buffers and the previews are kept as one joined string plus an offset
+    table, so a large document costs a handful of objects instead of one
+    tuple per page.
+    The (start, end) offsets of the matches within each preview, used to
+    highlight snippets, are one flat array with a per-page index.
+    Iterating yields ``(page_num, preview, count)`` tuples, which is the
+    shape the results template expects. A page can match with a count of
+    0, e.g. through NOT in a boolean search, so matching is flagged apart.
+    """
+
+    # Header: magic, byte order flag, page count, preview length in bytes,
+    # number of highlight spans
+    _MAGIC = b'PGR4'
+    _HEADER = struct.Struct('<4sBIII')
+
+    __slots__ = ('page_numbers', 'counts', 'matched', 'word_counts', '_offsets', '_preview_parts', '_previews', '_span_starts', '_spans')
+
+    def __init__(self):
+        self.page_numbers = array('I')
+        self.counts = array('I')
+        # 1 for each page that matches the search, even without occurrences
+        self.matched = array('B')
+        # Words on each page, for match density
+        self.word_counts = array('I')
+        # Character offsets of each preview in the joined string (len + 1 entries)
+        self._offsets = array('I', [0])
+        self._preview_parts = []
+        self._previews = ''
+        # Index of each page's first span in _spans (len + 1 entries)
+        self._span_starts = array('I', [0])
+        # start, end, start, end, ... for every page in turn
+        self._spans = array('I')
+
+    @classmethod
+    def from_pdf_data(cls, pdf_data):
+        """Build from the tuples returned by process_pdf (3 to 7 elements each)
+
+        A fifth element holds the highlight spans of the preview, a sixth
+        the number of words on the page and a seventh whether the page
+        matches; without it pages with occurrences match.
+        """
+        results = cls()
+        for entry in pdf_data:
+            results.append(entry[0], entry[1], entry[2], entry[4] if len(entry) > 4 else (),
+                           entry[5] if len(entry) > 5 else 0, entry[6] if len(entry) > 6 else None)
+        return results
+
+    def append(self, page_num, preview, count, spans=(), words=0, matched=None):
+        """Add a single page result, with the (start, end) offsets of matches in its preview"""
+        preview = preview or ''
+        self.page_numbers.append(page_num)
+        self.counts.append(count)
+        self.matched.append(count > 0 if matched is None else bool(matched))
+        self.word_counts.append(words)
+        self._preview_parts.append(preview)
+        self._offsets.append(self._offsets[-1] + len(preview))
+        for start, end in spans:
+            self._spans.append(start)
+            self._spans.append(end)
+        self._span_starts.append(len(self._spans) // 2)
+
+    def _joined_previews(self):
+        # Fold any pending parts into the single joined string
+        if self._preview_parts:
+            self._previews += ''.join(self._preview_parts)
+            self._preview_parts = []
+        return self._previews
+
+    def preview(self, index):
+        """Return the preview text for the page at position ``index``"""
+        return self._joined_previews()[self._offsets[index]:self._offsets[index + 1]]
+
+    def preview_spans(self, index):
+        """Return the (start, end) offsets of the matches in a page's preview"""
+        spans = self._spans[2 * self._span_starts[index]:2 * self._span_starts[index + 1]]
+        return list(zip(spans[::2], spans[1::2]))
+
+    def density(self, index):
+        """Return the matches per 1,000 words on the page at position ``index``"""
+        words = self.word_counts[index]
+        return round(self.counts[index] * 1000 / words, 2) if words else 0.0
+
+    @property
+    def total_count(self):
+        return sum(self.counts)
+
+    def with_occurrences(self):
+        """Yield only the pages that match the search"""
+        for entry, matched in zip(self, self.matched):
+            if matched:
+                yield entry
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('page result index out of range')
+        return (self.page_numbers[index], self.preview(index), self.counts[index])
+
+    def __iter__(self):
+        previews = self._joined_previews()
+        offsets = self._offsets
+        for i, (page_num, count) in enumerate(zip(self.page_numbers, self.counts)):
+            yield (page_num, previews[offsets[i]:offsets[i + 1]], count)
+
+    def to_bytes(self):
+        """Serialize to a compact byte string suitable for session storage"""
+        encoded_previews = self._joined_previews().encode('utf-8')
+        byteorder = 0 if sys.byteorder == 'little' else 1
+        header = self._HEADER.pack(self._MAGIC, byteorder, len(self), len(encoded_previews), len(self._spans) // 2)
+        return b''.join((
+            header,
+            self.page_numbers.tobytes(),
+            self.counts.tobytes(),
+            self.matched.tobytes(),
+            self.word_counts.tobytes(),
+            self._offsets.tobytes(),
+            self._span_starts.tobytes(),
+            self._spans.tobytes(),
+            encoded_previews,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a PageResults from the output of ``to_bytes``"""
+        if len(data) < cls._HEADER.size:
+            raise ValueError('Invalid page results data')
+        magic, byteorder, count, preview_len, span_count = cls._HEADER.unpack_from(data, 0)
+        if magic != cls._MAGIC:
+            raise ValueError('Invalid page results data')
+
+        results = cls()
+        itemsize = results.page_numbers.itemsize
+        if len(data) != cls._HEADER.size + (5 * count + 2 + 2 * span_count) * itemsize + count + preview_len:
+            raise ValueError('Truncated page results data')
+        position = cls._HEADER.size
+        swap = byteorder != (0 if sys.byteorder == 'little' else 1)
+
+        def read_array(length, typecode='I'):
+            nonlocal position
+            values = array(typecode)
+            values.frombytes(data[position:position + length * values.itemsize])
+            position += length * values.itemsize
+            if swap:
+                values.byteswap()
+            return values
+
+        results.page_numbers = read_array(count)
+        results.counts = read_array(count)
+        results.matched = read_array(count, 'B')
+        results.word_counts = read_array(count)
+        results._offsets = read_array(count + 1)
+        results._span_starts = read_array(count + 1)
+        results._spans = read_array(2 * span_count)
+        results._previews = bytes(data[position:position + preview_len]).decode('utf-8')
+        return results
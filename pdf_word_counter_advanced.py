@@ -1,8 +1,13 @@
+import argparse
 import os
-import re
 from pdfminer.high_level import extract_text
 from pdfminer.layout import LAParams
 
+from normalize import normalize_text
+from page_index import PageIndex, text_words
+from page_ranges import parse_page_ranges
+from query_modes import run_query
+
 def get_pdf_path():
     while True:
         path = input("Enter the path to the PDF file: ").strip()
@@ -36,99 +41,145 @@ def extract_text_from_pdf(pdf_path):
         print(f"Error extracting text: {e}")
         return ""
 
+def iter_pages_text(pdf_path, page_numbers=None):
+    """
+    Yield (page_number, text) for each page of the PDF, or only for the
+    given 1-based page numbers, extracting pages only as they are requested
+    """
+    # Use custom parameters for pdfminer to better handle text extraction
+    laparams = LAParams(
+        char_margin=1.0,
+        line_margin=0.5,
+        word_margin=0.1,
+        boxes_flow=0.5,
+        detect_vertical=True
+    )
+    
+    # Extract text page by page
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.converter import TextConverter
+    from io import StringIO
+    
+    resource_manager = PDFResourceManager()
+    
+    if page_numbers is None:
+        from itertools import count
+        numbers = count(1)
+        pagenos = None
+    else:
+        numbers = sorted(set(page_numbers))
+        pagenos = {n - 1 for n in numbers}
+    
+    with open(pdf_path, 'rb') as file:
+        # get_pages yields the selected pages in document order
+        for page_number, page in zip(numbers, PDFPage.get_pages(file, pagenos=pagenos)):
+            output_string = StringIO()
+            converter = TextConverter(resource_manager, output_string, laparams=laparams)
+            interpreter = PDFPageInterpreter(resource_manager, converter)
+            interpreter.process_page(page)
+            
+            page_text = output_string.getvalue()
+            
+            converter.close()
+            output_string.close()
+            yield page_number, page_text
+
 def extract_text_by_page(pdf_path):
     """
     Extract text from each page of the PDF separately
     """
     try:
-        # Use custom parameters for pdfminer to better handle text extraction
-        laparams = LAParams(
-            char_margin=1.0,
-            line_margin=0.5,
-            word_margin=0.1,
-            boxes_flow=0.5,
-            detect_vertical=True
-        )
-        
-        # Extract text page by page
-        from pdfminer.pdfpage import PDFPage
-        from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-        from pdfminer.converter import TextConverter
-        from io import StringIO
-        
-        pages_text = []
-        resource_manager = PDFResourceManager()
-        
-        with open(pdf_path, 'rb') as file:
-            for page_num, page in enumerate(PDFPage.get_pages(file)):
-                output_string = StringIO()
-                converter = TextConverter(resource_manager, output_string, laparams=laparams)
-                interpreter = PDFPageInterpreter(resource_manager, converter)
-                interpreter.process_page(page)
-                
-                page_text = output_string.getvalue()
-                pages_text.append(page_text)
-                
-                converter.close()
-                output_string.close()
-                
-        return pages_text
+        return [page_text for _, page_text in iter_pages_text(pdf_path)]
     except Exception as e:
         print(f"Error extracting text by page: {e}")
         return []
 
 def preprocess_text(text):
     """
-    Clean up and normalize text from PDF
+    Clean up and normalize text from PDF (see normalize.normalize_text)
     """
-    # Remove hyphenation (common in PDFs for word breaks)
-    text = re.sub(r'-\s*\n\s*', '', text)
-    
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Strip extra spaces
-    text = text.strip()
-    
-    return text
+    return normalize_text(text)
 
 def count_word_occurrences(text, search_word):
     """
     Count occurrences of a word in text, handling word boundaries properly
     """
-    # Case insensitive search with word boundaries
-    pattern = r'\b' + re.escape(search_word) + r'\b'
-    matches = re.finditer(pattern, text, re.IGNORECASE)
-    return sum(1 for _ in matches)
+    # Tokenized as for the page index, so 'ﬁnal' matches 'FINAL' and CJK
+    # words are found inside runs of text without spaces
+    return PageIndex.build([normalize_text(text)]).page_counts(search_word)[0]
 
-def process_pdf(pdf_path, search_word):
+def process_pdf(pdf_path, search_word, page_numbers=None):
     """
-    Process the PDF and build our data structure
+    Process the PDF and build our data structure.
+    With page_numbers only those pages are extracted; page numbers stay absolute.
     """
-    # Data structure: list of tuples (page_number, all_words, word_count)
+    # Data structure: list of tuples (page_number, preview, word_count)
     pdf_data = []
     total_count = 0
     
     # Extract text from each page
-    pages_text = extract_text_by_page(pdf_path)
+    if page_numbers is None:
+        pages = enumerate(extract_text_by_page(pdf_path), 1)
+    else:
+        try:
+            pages = list(iter_pages_text(pdf_path, page_numbers))
+        except Exception as e:
+            print(f"Error extracting text by page: {e}")
+            pages = []
     
-    for i, raw_text in enumerate(pages_text):
-        page_number = i + 1
-        
+    for page_number, raw_text in pages:
         # Preprocess the text to handle common PDF issues
         processed_text = preprocess_text(raw_text)
         
-        # Get all words properly
-        all_words = re.findall(r'\b\w+\b', processed_text)
-        
-        # Count occurrences of the search word
-        word_count = count_word_occurrences(processed_text, search_word)
+        # Count occurrences of the search word, and show them in context
+        page_index = PageIndex.build([processed_text])
+        match_spans = page_index.match_spans(search_word, 0) if search_word else []
+        word_count = len(match_spans)
+        preview, _ = page_index.snippets(0, processed_text, match_spans)
+        if not preview:
+            preview = ' '.join(text_words(processed_text, limit=7))
         
-        pdf_data.append((page_number, all_words, word_count))
+        pdf_data.append((page_number, preview, word_count))
         total_count += word_count
     
     return pdf_data, total_count
 
+def query_pdf(pdf_path, search_word, mode, n=1, page_numbers=None):
+    """
+    Answer an 'exists', 'first_n' or 'at_least' query, stopping extraction
+    as soon as the answer is known.
+    Returns (found, matches, total_count, pages_examined) where matches
+    lists (page_number, word_count) for pages with occurrences.
+    """
+    # iter_pages_text yields the selected pages in order, numbered the same way
+    numbers = None if page_numbers is None else sorted(set(page_numbers))
+    pages = iter_pages_text(pdf_path, page_numbers)
+    try:
+        result = run_query((preprocess_text(raw_text) for _, raw_text in pages), search_word, mode, n, numbers)
+    except Exception as e:
+        print(f"Error extracting text by page: {e}")
+        result = run_query([], search_word, mode, n)
+    finally:
+        pages.close()
+    
+    found = result.total_count >= (1 if mode == 'exists' else n)
+    return found, result.matches, result.total_count, result.pages_examined
+
+def display_query_results(mode, n, search_word, found, matches, total_count, pages_examined):
+    """
+    Display the answer to an early-terminating query
+    """
+    if mode == 'exists':
+        print(f"'{search_word}' {'occurs' if found else 'does not occur'} in the document.")
+    elif mode == 'at_least':
+        print(f"'{search_word}' occurs {'at least' if found else 'fewer than'} {n} time(s).")
+    else:
+        print(f"First {min(n, total_count)} occurrence(s) of '{search_word}':")
+        for page_number, word_count in matches:
+            print(f"Page {page_number}: {word_count} occurrence(s)")
+    print(f"Pages examined: {pages_examined}")
+
 def display_results(pdf_data, search_word, total_count):
     """
     Display the results of the search
@@ -136,9 +187,9 @@ def display_results(pdf_data, search_word, total_count):
     print(f"\nResults for word: '{search_word}'\n")
     
     pages_with_occurrences = 0
-    for page_number, all_words, word_count in pdf_data:
+    for page_number, preview, word_count in pdf_data:
         if word_count > 0:
-            preview = ' '.join(all_words[:7]) if all_words else "(No text on page)"
+            preview = preview or "(No text on page)"
             print(f"Page {page_number}: {word_count} occurrence(s) | Preview: {preview}")
             pages_with_occurrences += 1
     
@@ -149,7 +200,47 @@ def display_results(pdf_data, search_word, total_count):
     
     print(f"Total occurrences in document: {total_count}")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Count a word in a PDF. Run without arguments for interactive mode.'
+    )
+    parser.add_argument('pdf', nargs='?', help='PDF file to search')
+    parser.add_argument('word', nargs='?', help='Word to search for')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--exists', action='store_true',
+                      help='Stop at the first occurrence and report whether the word occurs')
+    mode.add_argument('--first', type=int, metavar='N',
+                      help='Stop once the first N occurrences have been found')
+    mode.add_argument('--at-least', type=int, metavar='K',
+                      help='Stop once K occurrences have been found and report whether there are K')
+    parser.add_argument('--pages', metavar='RANGES',
+                        help="Only search these pages, e.g. '1-40,45'; page numbers in results stay absolute")
+    args = parser.parse_args(argv)
+    for value in (args.first, args.at_least):
+        if value is not None and value < 1:
+            parser.error('N and K must be at least 1')
+    if args.pages:
+        try:
+            args.pages = parse_page_ranges(args.pages)
+        except ValueError:
+            parser.error(f"invalid page ranges: {args.pages}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    if args.pdf and args.word:
+        if args.exists or args.first or args.at_least:
+            mode, n = (('exists', 1) if args.exists else
+                       ('first_n', args.first) if args.first else
+                       ('at_least', args.at_least))
+            found, matches, total_count, pages_examined = query_pdf(args.pdf, args.word, mode, n, args.pages)
+            display_query_results(mode, n, args.word, found, matches, total_count, pages_examined)
+        else:
+            pdf_data, total_count = process_pdf(args.pdf, args.word, args.pages)
+            display_results(pdf_data, args.word, total_count)
+        return
+    
     print("Advanced PDF Word Counter\n------------------------")
     print("This program uses advanced PDF text extraction to maintain word integrity.")
     
@@ -0,0 +1,96 @@
+from collections import namedtuple
+
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import PDFStream, resolve1
+
+PreflightEstimate = namedtuple('PreflightEstimate', ['page_count', 'content_bytes', 'estimated_seconds'])
+
+# Linear extraction cost model:
+#   seconds = base + per_page * pages + per_mb * content-stream megabytes
+# The defaults are uncalibrated placeholders, not measurements. Run
+# benchmark.py over a representative corpus on the deployment hardware and
+# put its fitted model in PREFLIGHT_COST_MODEL in app.py.
+DEFAULT_COST_MODEL = {'base': 0.05, 'per_page': 0.03, 'per_mb': 0.8}
+
+
+def read_features(pdf_path):
+    """Return (page_count, content_bytes) without interpreting any page
+
+    The page count comes from the page tree's /Count and the content size
+    from each page's content stream /Length, so this only parses the object
+    structure of the file.
+    """
+    with open(pdf_path, 'rb') as f:
+        document = PDFDocument(PDFParser(f))
+        pages_root = resolve1(document.catalog.get('Pages')) or {}
+        page_count = int(resolve1(pages_root.get('Count', 0)) or 0)
+
+        content_bytes = 0
+        for page in PDFPage.create_pages(document):
+            for stream in page.contents:
+                stream = resolve1(stream)
+                if isinstance(stream, PDFStream):
+                    length = resolve1(stream.attrs.get('Length'))
+                    content_bytes += length if isinstance(length, int) else len(stream.rawdata or b'')
+    return page_count, content_bytes
+
+
+def predict_seconds(page_count, content_bytes, cost_model=None):
+    """Predict extraction time from document features"""
+    model = cost_model or DEFAULT_COST_MODEL
+    return model['base'] + model['per_page'] * page_count + model['per_mb'] * content_bytes / (1024 * 1024)
+
+
+def estimate(pdf_path, cost_model=None):
+    """Cheaply estimate the cost of extracting a PDF
+
+    Files that can't be parsed are reported as zero pages; extraction fails
+    fast on them anyway.
+    """
+    try:
+        page_count, content_bytes = read_features(pdf_path)
+    except Exception as e:
+        print(f"Error reading PDF features: {e}")
+        page_count, content_bytes = 0, 0
+    return PreflightEstimate(page_count, content_bytes, predict_seconds(page_count, content_bytes, cost_model))
+
+
+def scale_to_pages(estimate, selected_pages, cost_model=None):
+    """Re-estimate when only ``selected_pages`` of the document will be extracted
+
+    Content size is scaled by the selected fraction of pages.
+    """
+    page_count = min(selected_pages, estimate.page_count)
+    fraction = page_count / estimate.page_count if estimate.page_count else 0
+    content_bytes = int(estimate.content_bytes * fraction)
+    return PreflightEstimate(page_count, content_bytes, predict_seconds(page_count, content_bytes, cost_model))
+
+
+def calibrate(samples):
+    """Fit a cost model to (page_count, content_bytes, seconds) measurements
+
+    Solves the least-squares normal equations for base, per_page and per_mb.
+    """
+    rows = [(1.0, float(pages), content / (1024 * 1024), float(seconds)) for pages, content, seconds in samples]
+    if len(rows) < 3:
+        raise ValueError('At least 3 samples are needed to calibrate the cost model')
+
+    # Build the augmented normal-equation matrix [X^T X | X^T y]
+    matrix = [[sum(r[i] * r[j] for r in rows) for j in range(3)] + [sum(r[i] * r[3] for r in rows)]
+              for i in range(3)]
+
+    # Gaussian elimination with partial pivoting
+    for col in range(3):
+        pivot = max(range(col, 3), key=lambda r: abs(matrix[r][col]))
+        if abs(matrix[pivot][col]) < 1e-12:
+            raise ValueError('Samples are too similar to calibrate the cost model')
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        for r in range(3):
+            if r != col:
+                factor = matrix[r][col] / matrix[col][col]
+                matrix[r] = [a - factor * b for a, b in zip(matrix[r], matrix[col])]
+
+    base, per_page, per_mb = (matrix[i][3] / matrix[i][i] for i in range(3))
+    return {'base': base, 'per_page': per_page, 'per_mb': per_mb}
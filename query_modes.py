@@ -0,0 +1,46 @@
+from collections import namedtuple
+from itertools import count
+
+from page_index import PageIndex
+
+# Queries that can stop reading pages as soon as their answer is known:
+#   exists    does the term occur at all?
+#   first_n   the pages holding the first n occurrences
+#   at_least  does the term occur at least n times?
+QUERY_MODES = ('exists', 'first_n', 'at_least')
+
+QueryResult = namedtuple('QueryResult', [
+    'mode', 'answer', 'total_count', 'matches', 'pages_examined'
+])
+
+
+def run_query(pages_text, search_word, mode, n=1, page_numbers=None):
+    """Answer an early-terminating query over an iterable of page text
+
+    Pages are consumed lazily and iteration stops once the answer is known,
+    so pass a generator to avoid extracting the remaining pages. ``matches``
+    lists (page_number, count) for pages with occurrences, ``total_count``
+    the occurrences on the pages examined. Pages are numbered 1, 2, ...
+    unless ``page_numbers`` gives their numbers, e.g. for a page selection.
+    """
+    if mode not in QUERY_MODES:
+        raise ValueError(f'Unknown query mode: {mode!r}')
+    target = 1 if mode == 'exists' else n
+    if target < 1:
+        raise ValueError('n must be at least 1')
+
+    matches = []
+    total_count = 0
+    pages_examined = 0
+    numbers = count(1) if page_numbers is None else page_numbers
+    for page_number, page_text in zip(numbers, pages_text):
+        pages_examined += 1
+        page_count = PageIndex.build([page_text]).page_counts(search_word)[0]
+        if page_count:
+            matches.append((page_number, page_count))
+            total_count += page_count
+            if total_count >= target:
+                break
+
+    answer = matches if mode == 'first_n' else total_count >= target
+    return QueryResult(mode, answer, total_count, matches, pages_examined)
@@ -1,5 +1,5 @@
 import unittest
-from tests import PDFWordCounterTests, IntegrationTests, PerformanceTests, SecurityTests, DeploymentTests
+from tests import PDFWordCounterTests, IntegrationTests, PerformanceTests, SecurityTests, DeploymentTests, PageResultsTests, RefineSearchTests, TextStoreTests, PageIndexTests, PageClassificationTests, PreflightTests, SchedulerTests, AdmissionControlTests, CheckpointTests, PageDedupTests, FontCacheTests, SamplingTests, QueryModeTests, PageSelectionTests, SearchIndexTests, BooleanQueryTests, VocabularyTests, FuzzyMatchTests, StemmingTests, NormalizationTests, CJKTokenizationTests, SnippetTests, DocumentStatisticsTests, HttpCachingTests
 from additional_tests import AdditionalCoverageTests
 
 if __name__ == '__main__':
@@ -12,6 +12,30 @@ if __name__ == '__main__':
     suite.addTest(unittest.makeSuite(PerformanceTests))
     suite.addTest(unittest.makeSuite(SecurityTests))
     suite.addTest(unittest.makeSuite(DeploymentTests))
+    suite.addTest(unittest.makeSuite(PageResultsTests))
+    suite.addTest(unittest.makeSuite(RefineSearchTests))
+    suite.addTest(unittest.makeSuite(TextStoreTests))
+    suite.addTest(unittest.makeSuite(PageIndexTests))
+    suite.addTest(unittest.makeSuite(PageClassificationTests))
+    suite.addTest(unittest.makeSuite(PreflightTests))
+    suite.addTest(unittest.makeSuite(SchedulerTests))
+    suite.addTest(unittest.makeSuite(AdmissionControlTests))
+    suite.addTest(unittest.makeSuite(CheckpointTests))
+    suite.addTest(unittest.makeSuite(PageDedupTests))
+    suite.addTest(unittest.makeSuite(FontCacheTests))
+    suite.addTest(unittest.makeSuite(SamplingTests))
+    suite.addTest(unittest.makeSuite(QueryModeTests))
+    suite.addTest(unittest.makeSuite(PageSelectionTests))
+    suite.addTest(unittest.makeSuite(SearchIndexTests))
+    suite.addTest(unittest.makeSuite(BooleanQueryTests))
+    suite.addTest(unittest.makeSuite(VocabularyTests))
+    suite.addTest(unittest.makeSuite(FuzzyMatchTests))
+    suite.addTest(unittest.makeSuite(StemmingTests))
+    suite.addTest(unittest.makeSuite(NormalizationTests))
+    suite.addTest(unittest.makeSuite(CJKTokenizationTests))
+    suite.addTest(unittest.makeSuite(SnippetTests))
+    suite.addTest(unittest.makeSuite(DocumentStatisticsTests))
+    suite.addTest(unittest.makeSuite(HttpCachingTests))
     
     # Add new test cases for additional coverage
     suite.addTest(unittest.makeSuite(AdditionalCoverageTests))
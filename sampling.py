@@ -0,0 +1,88 @@
+import math
+import random
+from collections import namedtuple
+
+# Two-sided 95% normal quantile used for confidence intervals
+CONFIDENCE_Z = 1.96
+
+# Pages are split into at most this many contiguous strata
+MAX_STRATA = 20
+
+
+class ApproximateCount(namedtuple('ApproximateCount', ['estimate', 'low', 'high', 'pages_sampled', 'page_count'])):
+    """Estimated total occurrences with a 95% confidence interval"""
+    __slots__ = ()
+
+    @property
+    def exact(self):
+        return self.pages_sampled == self.page_count
+
+
+def make_strata(page_count, max_strata=MAX_STRATA):
+    """Split pages 0..page_count-1 into contiguous (start, end) strata of near-equal size"""
+    strata_count = min(page_count, max_strata)
+    bounds = [page_count * i // strata_count for i in range(strata_count + 1)] if strata_count else [0]
+    return list(zip(bounds, bounds[1:]))
+
+
+def sample_order(strata, rng=None):
+    """Return every page index in stratified random order
+
+    Each round takes one not-yet-sampled page from every stratum, so any
+    prefix of the order is a stratified sample of the document.
+    """
+    rng = rng or random.Random()
+    shuffled = []
+    for start, end in strata:
+        pages = list(range(start, end))
+        rng.shuffle(pages)
+        shuffled.append(pages)
+
+    order = []
+    for round_number in range(max((len(pages) for pages in shuffled), default=0)):
+        order.extend(pages[round_number] for pages in shuffled if round_number < len(pages))
+    return order
+
+
+def _mean_and_variance(values):
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, None
+    return mean, sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+def estimate_total(strata, counts):
+    """Estimate the document total from sampled page counts
+
+    ``counts`` maps sampled page index to its count. Uses the stratified
+    estimator sum(N_h * mean_h); strata with fewer than two samples borrow
+    the pooled mean and variance of the whole sample.
+    """
+    page_count = strata[-1][1] if strata else 0
+    observed = sum(counts.values())
+    if not counts:
+        return ApproximateCount(0.0, 0.0, math.inf if page_count else 0.0, 0, page_count)
+
+    pooled_mean, pooled_variance = _mean_and_variance(list(counts.values()))
+    if pooled_variance is None:
+        # A single page says nothing about spread; fall back to a Poisson guess
+        pooled_variance = pooled_mean
+
+    estimate = 0.0
+    variance = 0.0
+    for start, end in strata:
+        size = end - start
+        values = [counts[page] for page in range(start, end) if page in counts]
+        if values:
+            mean, stratum_variance = _mean_and_variance(values)
+        else:
+            mean, stratum_variance = pooled_mean, None
+        if stratum_variance is None:
+            stratum_variance = pooled_variance
+        estimate += size * mean
+        # Finite population correction: a fully sampled stratum is exact
+        variance += size ** 2 * (1 - len(values) / size) * stratum_variance / max(len(values), 1)
+
+    margin = CONFIDENCE_Z * math.sqrt(variance)
+    # Occurrences already seen are a hard lower bound
+    return ApproximateCount(estimate, max(observed, estimate - margin), estimate + margin, len(counts), page_count)
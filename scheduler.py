@@ -0,0 +1,122 @@
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import metrics
+
+
+class _Ticket:
+    __slots__ = ('cost', 'client', 'queued_at', 'sequence')
+
+    def __init__(self, cost, client, queued_at, sequence):
+        self.cost = cost
+        self.client = client
+        self.queued_at = queued_at
+        self.sequence = sequence
+
+
+class Lane:
+    """A pool of processing slots for one class of jobs.
+
+    Small and large documents get separate lanes, so a 5-page memo never
+    queues behind a 2,000-page manual. Within a lane waiting jobs run
+    shortest-estimated-cost first; every second spent waiting takes
+    ``aging_rate`` seconds off a job's cost so big jobs still progress, and
+    a client may hold at most ``max_per_client`` running slots. Lanes are
+    shared by the threads of a worker process, so deploy one gunicorn
+    worker with ``--threads`` (see AZURE_CONFIGURATION.md).
+    """
+
+    def __init__(self, name, workers, aging_rate=1.0, max_per_client=None):
+        self.name = name
+        self.workers = workers
+        self.aging_rate = aging_rate
+        self.max_per_client = max_per_client
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._running = 0
+        self._running_by_client = Counter()
+        self._sequence = itertools.count()
+        # Totals for the stats exposed at /api/metrics
+        self._started = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_service = 0.0
+
+    def _priority(self, ticket, now):
+        # Lower runs first: estimated cost minus credit for time spent waiting
+        return (ticket.cost - self.aging_rate * (now - ticket.queued_at), ticket.sequence)
+
+    def _next_ticket(self):
+        if self._running >= self.workers:
+            return None
+        eligible = [
+            ticket for ticket in self._waiting
+            if self.max_per_client is None or self._running_by_client[ticket.client] < self.max_per_client
+        ]
+        if not eligible:
+            return None
+        now = time.monotonic()
+        return min(eligible, key=lambda ticket: self._priority(ticket, now))
+
+    @contextmanager
+    def slot(self, cost=0.0, client=None):
+        """Wait for this job's turn in the lane and hold a slot for the block"""
+        with self._condition:
+            ticket = _Ticket(cost, client, time.monotonic(), next(self._sequence))
+            self._waiting.append(ticket)
+            while self._next_ticket() is not ticket:
+                self._condition.wait()
+            self._waiting.remove(ticket)
+            self._running += 1
+            self._running_by_client[client] += 1
+            started_at = time.monotonic()
+            waited = started_at - ticket.queued_at
+            self._started += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            # Another slot may still be free for the next job in line
+            self._condition.notify_all()
+
+        metrics.increment(f'lane_{self.name}_jobs')
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._running_by_client[client] -= 1
+                if not self._running_by_client[client]:
+                    del self._running_by_client[client]
+                self._completed += 1
+                self._total_service += time.monotonic() - started_at
+                self._condition.notify_all()
+
+    @property
+    def queue_depth(self):
+        with self._condition:
+            return len(self._waiting)
+
+    def stats(self):
+        """Return queue depth, wait and service time figures for this lane"""
+        with self._condition:
+            started, completed = self._started, self._completed
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'queue_depth': len(self._waiting),
+                'started': started,
+                'completed': completed,
+                'avg_wait_ms': round(self._total_wait / started * 1000, 1) if started else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 1),
+                'avg_service_ms': round(self._total_service / completed * 1000, 1) if completed else 0.0,
+            }
+
+
+def choose_lane(lanes, estimate, slow_threshold_seconds):
+    """Route a job to the fast or slow lane from its pre-flight estimate"""
+    if estimate.estimated_seconds >= slow_threshold_seconds:
+        return lanes['slow']
+    return lanes['fast']
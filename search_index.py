@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# Persistent full-text index of every processed document, in SQLite FTS5
+
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from page_index import WILDCARD_CHARS, PageIndex, is_cjk, is_fuzzy, is_wildcard, query_terms, tokenize
+
+PageHit = namedtuple('PageHit', ['doc_hash', 'name', 'page_number', 'count'])
+DocumentCount = namedtuple('DocumentCount', ['doc_hash', 'name', 'count', 'pages'])
+
+# Bumped when the layout of the pages table changes; older indexes are
+# rebuilt from their stored page text when opened
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    doc_hash TEXT NOT NULL UNIQUE,
+    name TEXT,
+    page_count INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+-- terms holds the page's PageIndex tokens (casefolded, CJK runs as bigrams)
+-- separated by spaces; text is the page itself, for recounting phrases.
+-- Underscores are token characters so FTS5 keeps each token whole.
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+    terms, text UNINDEXED, doc_id UNINDEXED, page_number UNINDEXED,
+    tokenize="unicode61 remove_diacritics 0 tokenchars '_'"
+);
+-- One row per term occurrence, for counting single terms without reading page text
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_terms USING fts5vocab(pages, 'instance');
+"""
+
+
+# Sorts after every character, so prefix + it bounds the terms with that prefix
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def _index_terms(page_text):
+    return ' '.join(term for term, _, _ in tokenize(page_text))
+
+
+def _prefix(term):
+    # The literal prefix every matching term starts with, or None if the
+    # term matches itself only. A lone CJK character matches every term
+    # starting with it, as in PageIndex.
+    if is_wildcard(term):
+        return WILDCARD_CHARS.split(term, 1)[0]
+    if len(term) == 1 and is_cjk(term):
+        return term
+    return None
+
+
+def _term_condition(term):
+    # A condition on the vocabulary's term column, and its parameters, that
+    # uses the term index: literal prefixes become a range, not a scan
+    prefix = _prefix(term)
+    if prefix is None:
+        return 'v.term = ?', [term]
+    condition, parameters = [], []
+    if prefix:
+        condition.append('v.term >= ? AND v.term < ?')
+        parameters += [prefix, prefix + _MAX_CHAR]
+    if is_wildcard(term):
+        condition.append('v.term GLOB ?')
+        parameters.append(term)
+    return ' AND '.join(condition), parameters
+
+
+def _match_expression(terms):
+    # An FTS5 query finding every page that could hold the phrase. Prefix
+    # terms only narrow the search by their literal prefix, if they have one.
+    if all(_prefix(term) is None for term in terms):
+        return '"{}"'.format(' '.join(terms))
+    parts = []
+    for term in terms:
+        prefix = _prefix(term)
+        if prefix is None:
+            parts.append(f'"{term}"')
+        elif prefix:
+            parts.append(f'"{prefix}"*')
+    return ' AND '.join(parts)
+
+
+class SearchIndex:
+    """Cross-document page index stored in an SQLite FTS5 table.
+
+    Pages are buffered and written in batches of ``batch_size`` pages, one
+    transaction each, so indexing keeps up with extraction; call ``flush``
+    (or ``close``) to write what is left. Searches see flushed pages only.
+    Single terms are counted from the FTS5 vocabulary; phrases use FTS5 to
+    find candidate pages and are counted with the same tokenizer as
+    PageIndex, so counts agree with a per-document search. Pages are
+    indexed by their PageIndex tokens, so matching is casefolded and CJK
+    text is searched by bigrams. Terms may use * and ? wildcards, but not
+    the ~ fuzzy suffix.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending = []
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            # WAL lets other worker processes read while one of them writes
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+            if version < _SCHEMA_VERSION:
+                self._upgrade()
+            self._connection.executescript(_SCHEMA)
+            self._connection.execute(f'PRAGMA user_version = {_SCHEMA_VERSION}')
+            self._connection.commit()
+
+    def _upgrade(self):
+        # Version 1 indexed the page text itself, which FTS5 lowercases
+        # without casefolding and keeps CJK runs whole; reindex its pages
+        exists = self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'pages'"
+        ).fetchone()
+        if not exists:
+            return
+        rows = self._connection.execute('SELECT text, doc_id, page_number FROM pages').fetchall()
+        with self._connection:
+            self._connection.execute('DROP TABLE IF EXISTS pages_terms')
+            self._connection.execute('DROP TABLE pages')
+        self._connection.executescript(_SCHEMA)
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO pages (terms, text, doc_id, page_number) VALUES (?, ?, ?, ?)',
+                ((_index_terms(page_text), page_text, doc_id, page_number) for page_text, doc_id, page_number in rows)
+            )
+
+    def add_document(self, doc_hash, pages_text, name=None):
+        """Queue a document's preprocessed page text for indexing, replacing any earlier copy"""
+        with self._lock:
+            self._pending.append((doc_hash, name, list(pages_text)))
+            pending_pages = sum(len(pages) for _, _, pages in self._pending)
+        if pending_pages >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all queued documents in a single transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            with self._connection:
+                for doc_hash, name, pages_text in pending:
+                    self._remove(doc_hash)
+                    cursor = self._connection.execute(
+                        'INSERT INTO documents (doc_hash, name, page_count, indexed_at) VALUES (?, ?, ?, ?)',
+                        (doc_hash, name, len(pages_text), time.time())
+                    )
+                    doc_id = cursor.lastrowid
+                    self._connection.executemany(
+                        'INSERT INTO pages (terms, text, doc_id, page_number) VALUES (?, ?, ?, ?)',
+                        ((_index_terms(page_text), page_text, doc_id, page_number)
+                         for page_number, page_text in enumerate(pages_text, 1))
+                    )
+
+    def _remove(self, doc_hash):
+        row = self._connection.execute('SELECT doc_id FROM documents WHERE doc_hash = ?', (doc_hash,)).fetchone()
+        if row:
+            self._connection.execute('DELETE FROM pages WHERE doc_id = ?', row)
+            self._connection.execute('DELETE FROM documents WHERE doc_id = ?', row)
+
+    def has_document(self, doc_hash):
+        """Return whether a document is indexed or queued for indexing"""
+        with self._lock:
+            if any(pending_hash == doc_hash for pending_hash, _, _ in self._pending):
+                return True
+            row = self._connection.execute('SELECT 1 FROM documents WHERE doc_hash = ?', (doc_hash,)).fetchone()
+        return row is not None
+
+    def remove_document(self, doc_hash):
+        """Drop a document from the index"""
+        self.flush()
+        with self._lock, self._connection:
+            self._remove(doc_hash)
+
+    def search(self, query, limit=None):
+        """Return a PageHit for every indexed page containing the word or phrase
+
+        Raises ValueError for fuzzy terms, which the index can't match.
+        """
+        terms = query_terms(query)
+        if any(is_fuzzy(term) for term in terms):
+            raise ValueError('Fuzzy (~) terms are not supported by the search index')
+        if not terms:
+            return []
+        self.flush()
+
+        with self._lock:
+            if len(terms) == 1:
+                condition, parameters = _term_condition(terms[0])
+                rows = self._connection.execute(
+                    'SELECT d.doc_hash, d.name, p.page_number, COUNT(*) '
+                    'FROM pages_terms v JOIN pages p ON p.rowid = v.doc JOIN documents d ON d.doc_id = p.doc_id '
+                    'WHERE {} GROUP BY v.doc ORDER BY d.doc_id, p.page_number'.format(condition),
+                    parameters
+                ).fetchall()
+                hits = [PageHit(*row) for row in rows]
+            else:
+                match = _match_expression(terms)
+                condition, parameters = ('pages MATCH ?', [match]) if match else ('1', [])
+                rows = self._connection.execute(
+                    'SELECT d.doc_hash, d.name, p.page_number, p.text '
+                    'FROM pages p JOIN documents d ON d.doc_id = p.doc_id '
+                    'WHERE {} ORDER BY d.doc_id, p.page_number'.format(condition),
+                    parameters
+                ).fetchall()
+                hits = []
+                for doc_hash, name, page_number, page_text in rows:
+                    count = PageIndex.build([page_text]).page_counts(query)[0]
+                    if count:
+                        hits.append(PageHit(doc_hash, name, page_number, count))
+        return hits[:limit] if limit else hits
+
+    def document_counts(self, query):
+        """Return a DocumentCount per document mentioning the word or phrase, most mentions first"""
+        documents = {}
+        for hit in self.search(query):
+            entry = documents.setdefault(hit.doc_hash, DocumentCount(hit.doc_hash, hit.name, 0, []))
+            entry.pages.append((hit.page_number, hit.count))
+            documents[hit.doc_hash] = entry._replace(count=entry.count + hit.count)
+        return sorted(documents.values(), key=lambda entry: (-entry.count, entry.doc_hash))
+
+    def stats(self):
+        """Return the number of indexed documents and pages"""
+        self.flush()
+        with self._lock:
+            documents, pages = self._connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(page_count), 0) FROM documents'
+            ).fetchone()
+        return {'documents': documents, 'pages': pages}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the cross-document search index')
+    parser.add_argument('index', help='SQLite index file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='Extract and index PDF files')
+    add.add_argument('pdfs', nargs='+', help='PDF files to index')
+    search = commands.add_parser('search', help='List documents and pages mentioning a word or phrase')
+    search.add_argument('query', help='Word or phrase to search for')
+    args = parser.parse_args()
+
+    index = SearchIndex(args.index)
+    try:
+        if args.command == 'add':
+            # Extraction lives in the web app module
+            import os
+            from app import extract_processed_pages
+            from text_store import document_hash
+
+            for path in args.pdfs:
+                pages_text, _ = extract_processed_pages(path)
+                if not pages_text:
+                    print(f"Skipping {path}: no pages extracted")
+                    continue
+                index.add_document(document_hash(path), pages_text, os.path.basename(path))
+                print(f"Indexed {path} ({len(pages_text)} pages)")
+        else:
+            try:
+                results = index.document_counts(args.query)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 1
+            for entry in results:
+                pages = ', '.join(f'{page} ({count})' for page, count in entry.pages)
+                print(f"{entry.name or entry.doc_hash}: {entry.count} occurrence(s) on pages {pages}")
+            print(f"{sum(entry.count for entry in results)} occurrence(s) in {len(results)} document(s)")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
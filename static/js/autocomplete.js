@@ -0,0 +1,42 @@
+// Suggests terms from a processed document for the word being typed.
+// getDocHash() returns the document's SHA-256, '' for the document of the
+// current results, or null when there is nothing to suggest from yet.
+function attachAutocomplete(input, getDocHash) {
+    const list = document.createElement('datalist');
+    list.id = input.id + 'Suggestions';
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    input.after(list);
+
+    let latestRequest = 0;
+    input.addEventListener('input', async function() {
+        const docHash = getDocHash();
+        const match = input.value.match(/^(.*?)([\p{L}\p{N}_]+)$/u);
+        if (docHash === null || !match) {
+            list.replaceChildren();
+            return;
+        }
+
+        const requestNumber = ++latestRequest;
+        const params = new URLSearchParams({prefix: match[2], limit: 10});
+        if (docHash) {
+            params.set('doc', docHash);
+        }
+        try {
+            const response = await fetch('/api/autocomplete?' + params);
+            if (!response.ok || requestNumber !== latestRequest) {
+                return;
+            }
+            const data = await response.json();
+            // Each option is the whole input with the last word completed
+            list.replaceChildren(...data.suggestions.map(function(suggestion) {
+                const option = document.createElement('option');
+                option.value = match[1] + suggestion.term;
+                option.label = suggestion.count + ' occurrence(s)';
+                return option;
+            }));
+        } catch (e) {
+            list.replaceChildren();
+        }
+    });
+}
@@ -0,0 +1,147 @@
+import weakref
+from functools import lru_cache
+
+# The Porter (1980) suffix-stripping algorithm, as published. Only
+# lower-case ASCII words are stemmed; anything else is its own stem.
+
+_VOWELS = frozenset('aeiou')
+
+
+def _is_consonant(word, i):
+    char = word[i]
+    if char in _VOWELS:
+        return False
+    if char == 'y':
+        # 'y' after a consonant acts as a vowel ('happy'), otherwise not ('toy')
+        return i == 0 or not _is_consonant(word, i - 1)
+    return True
+
+
+def _measure(stem):
+    # m in [C](VC)^m[V]: the number of vowel-consonant sequences
+    m = 0
+    previous_vowel = False
+    for i in range(len(stem)):
+        vowel = not _is_consonant(stem, i)
+        if previous_vowel and not vowel:
+            m += 1
+        previous_vowel = vowel
+    return m
+
+
+def _has_vowel(stem):
+    return any(not _is_consonant(stem, i) for i in range(len(stem)))
+
+
+def _ends_double_consonant(word):
+    return len(word) >= 2 and word[-1] == word[-2] and _is_consonant(word, len(word) - 1)
+
+
+def _ends_cvc(word):
+    # consonant-vowel-consonant, where the last consonant isn't w, x or y
+    return (len(word) >= 3 and _is_consonant(word, len(word) - 3) and not _is_consonant(word, len(word) - 2)
+            and _is_consonant(word, len(word) - 1) and word[-1] not in 'wxy')
+
+
+def _replace(word, rules, min_measure):
+    # Apply the first rule whose suffix matches; the stem must have m > min_measure
+    for suffix, replacement in rules:
+        if word.endswith(suffix):
+            stem = word[:len(word) - len(suffix)]
+            return stem + replacement if _measure(stem) > min_measure else word
+    return word
+
+
+_STEP_2 = (
+    ('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'), ('izer', 'ize'),
+    ('abli', 'able'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous'),
+    ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'), ('alism', 'al'), ('iveness', 'ive'),
+    ('fulness', 'ful'), ('ousness', 'ous'), ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'),
+)
+_STEP_3 = (
+    ('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'), ('ical', 'ic'), ('ful', ''), ('ness', ''),
+)
+_STEP_4 = (
+    'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent',
+    'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize',
+)
+
+
+def _step_1(word):
+    # 1a: plurals
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # 1b: -ed and -ing
+    stripped = False
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    elif word.endswith('ed') and _has_vowel(word[:-2]):
+        word, stripped = word[:-2], True
+    elif word.endswith('ing') and _has_vowel(word[:-3]):
+        word, stripped = word[:-3], True
+    if stripped:
+        if word.endswith(('at', 'bl', 'iz')):
+            word += 'e'
+        elif _ends_double_consonant(word) and word[-1] not in 'lsz':
+            word = word[:-1]
+        elif _measure(word) == 1 and _ends_cvc(word):
+            word += 'e'
+
+    # 1c: terminal y after a vowel-containing stem
+    if word.endswith('y') and _has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+    return word
+
+
+def _step_4(word):
+    for suffix in sorted(_STEP_4, key=len, reverse=True):
+        if word.endswith(suffix):
+            stem = word[:len(word) - len(suffix)]
+            if _measure(stem) > 1 and (suffix != 'ion' or stem.endswith(('s', 't'))):
+                return stem
+            return word
+    return word
+
+
+def _step_5(word):
+    if word.endswith('e'):
+        stem = word[:-1]
+        m = _measure(stem)
+        if m > 1 or (m == 1 and not _ends_cvc(stem)):
+            word = stem
+    if _measure(word) > 1 and _ends_double_consonant(word) and word.endswith('l'):
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def stem(word):
+    """Return the Porter stem of a casefolded word"""
+    if len(word) <= 2 or not word.isascii() or not word.isalpha():
+        return word
+    word = _step_1(word)
+    word = _replace(word, _STEP_2, 0)
+    word = _replace(word, _STEP_3, 0)
+    word = _step_4(word)
+    return _step_5(word)
+
+
+# stem -> terms of the document with that stem, built once per document
+_families = weakref.WeakKeyDictionary()
+
+
+def term_families(page_index):
+    """Return a dict mapping each stem to the document terms that share it"""
+    families = _families.get(page_index)
+    if families is None:
+        families = {}
+        for term in page_index.terms():
+            families.setdefault(stem(term), []).append(term)
+        _families[page_index] = families
+    return families
@@ -873,6 +873,2039 @@ class DeploymentTests(unittest.TestCase):
         self.assertIn('werkzeug', requirements.lower())
         self.assertIn('gunicorn', requirements.lower())
         self.assertIn('flask-session', requirements.lower())
+    
+    def test_startup_command_uses_one_threaded_worker(self):
+        """Test that every documented startup command shares the lanes and admission limits between threads"""
+        from app import processing_lanes, admission
+        
+        for path in ['AZURE_DEPLOYMENT.md', 'AZURE_CONFIGURATION.md']:
+            with open(path, 'r') as f:
+                commands = re.findall(r'gunicorn --[^`"\n]*', f.read())
+            self.assertTrue(commands, path)
+            for command in commands:
+                self.assertIn('--workers 1 --worker-class gthread', command)
+                threads = int(re.search(r'--threads (\d+)', command).group(1))
+                self.assertGreater(threads, sum(lane.workers for lane in processing_lanes.values()))
+                # Enough threads for a full queue, so the queue limit is what refuses uploads
+                self.assertGreater(threads, admission.capacity + app.config['ADMISSION_MAX_QUEUE_DEPTH'])
+
+
+class PageResultsTests(unittest.TestCase):
+    """Tests for the compact PageResults container"""
+    
+    def test_round_trip(self):
+        """Test that results survive serialization to bytes"""
+        from page_results import PageResults
+        
+        pdf_data = [(1, 'First page preview', 2, 'full text'),
+                    (2, '', 0, ''),
+                    (3, 'Ünïcödé preview', 5, 'full text')]
+        page_results = PageResults.from_pdf_data(pdf_data)
+        restored = PageResults.from_bytes(page_results.to_bytes())
+        
+        self.assertEqual(list(restored), [(1, 'First page preview', 2), (2, '', 0), (3, 'Ünïcödé preview', 5)])
+        self.assertEqual(restored.total_count, 7)
+        self.assertEqual(restored[-1], (3, 'Ünïcödé preview', 5))
+        self.assertEqual([entry[0] for entry in restored.with_occurrences()], [1, 3])
+        
+        # Pages can match without occurrences
+        restored = PageResults.from_bytes(PageResults.from_pdf_data(
+            [(1, 'one', 0, '', (), 10, True), (2, 'two', 0, '', (), 10, False)]
+        ).to_bytes())
+        self.assertEqual(list(restored.matched), [1, 0])
+        self.assertEqual([entry[0] for entry in restored.with_occurrences()], [1])
+    
+    def test_invalid_bytes(self):
+        """Test that corrupted data is rejected with ValueError"""
+        from page_results import PageResults
+        
+        data = PageResults.from_pdf_data([(1, 'preview', 1)]).to_bytes()
+        with self.assertRaises(ValueError):
+            PageResults.from_bytes(b'junk')
+        with self.assertRaises(ValueError):
+            PageResults.from_bytes(data[:-3])
+    
+    def test_results_route_with_compact_data(self):
+        """Test that the results page renders data stored as bytes"""
+        from page_results import PageResults
+        
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['pdf_results'] = {
+                'filepath': 'test.pdf',
+                'search_word': 'test',
+                'pdf_data': PageResults.from_pdf_data([(1, 'preview one', 0), (2, 'preview two', 3)]).to_bytes(),
+                'total_count': 3,
+                'show_sample': True
+            }
+        
+        response = client.get('/results')
+        self.assertIn(b'Pages with occurrences:</span> <span class="value">1', response.data)
+        self.assertIn(b'preview two', response.data)
+        self.assertNotIn(b'preview one', response.data)
+
+
+class TempStoreMixin:
+    """Runs each test against an empty text store in ``self.temp_dir``, with a test client in ``self.app``"""
+    
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.temp_dir = tempfile.mkdtemp()
+        self.store_backup = app.config['TEXT_STORE_FOLDER']
+        app.config['TEXT_STORE_FOLDER'] = self.temp_dir
+        self.app = app.test_client()
+    
+    def tearDown(self):
+        # Drop this test's sessions so the session store stays under its prune threshold
+        app.session_interface.cache.clear()
+        app.config['TEXT_STORE_FOLDER'] = self.store_backup
+        shutil.rmtree(self.temp_dir)
+
+
+class RefineSearchTests(TempStoreMixin, unittest.TestCase):
+    """Tests for re-counting a new word over stored page text"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        super().setUp()
+        
+        # Two pages with known content
+        self.pdf_path = os.path.join(self.temp_dir, 'refine.pdf')
+        c = canvas.Canvas(self.pdf_path, pagesize=letter)
+        c.drawString(100, 750, "The contract covers liability and payment terms.")
+        c.showPage()
+        c.drawString(100, 750, "Liability is capped. The contract ends in May.")
+        c.showPage()
+        c.save()
+    
+    def upload(self, word):
+        with open(self.pdf_path, 'rb') as f:
+            return self.app.post('/', data={
+                'pdfFile': (f, 'refine.pdf'),
+                'searchWord': word
+            }, follow_redirects=True)
+    
+    def test_refine_does_not_extract_again(self):
+        """Test that refining only re-runs counting over the stored text"""
+        from unittest.mock import patch
+        
+        response = self.upload('contract')
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">2', response.data)
+        self.assertIn(b'Refine Search', response.data)
+        
+        with patch('app.iter_extracted_pages', side_effect=AssertionError('extraction should not run')):
+            response = self.app.post('/refine', data={'searchWord': 'liability'}, follow_redirects=True)
+            self.assertIn(b'<span class="value">liability</span>', response.data)
+            self.assertIn(b'Total Occurrences:</span> <span class="value highlight">2', response.data)
+            
+            # Page views are served from the stored text as well
+            response = self.app.get('/view_page/2')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'<span class="highlight-word">Liability</span> is capped', response.data)
+    
+    def test_reupload_uses_stored_text(self):
+        """Test that uploading the same document twice extracts it only once"""
+        from unittest.mock import patch
+        
+        self.upload('contract')
+        with patch('app.iter_extracted_pages', side_effect=AssertionError('extraction should not run')):
+            response = self.upload('payment')
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">1', response.data)
+    
+    def test_refine_without_session(self):
+        """Test refining when there is nothing to refine"""
+        response = self.app.post('/refine', data={'searchWord': 'test'}, follow_redirects=True)
+        self.assertIn(b'Session expired', response.data)
+    
+    def test_refine_with_missing_text(self):
+        """Test refining when the stored text has been removed"""
+        with self.app.session_transaction() as sess:
+            sess['pdf_results'] = {
+                'filepath': self.pdf_path,
+                'doc_hash': 'ab' * 32,
+                'search_word': 'test',
+                'pdf_data': [(1, 'preview', 0)],
+                'total_count': 0
+            }
+        
+        response = self.app.post('/refine', data={'searchWord': 'other'}, follow_redirects=True)
+        self.assertIn(b'no longer available', response.data)
+
+
+class TextStoreTests(unittest.TestCase):
+    """Tests for the memory-mapped page text store"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_round_trip(self):
+        """Test that stored pages come back unchanged"""
+        from text_store import save_pages, load_pages
+        
+        pages = ['First page text', '', 'Ünïcödé — third page', 'last']
+        doc_hash = 'a' * 64
+        save_pages(self.temp_dir, doc_hash, pages)
+        document = load_pages(self.temp_dir, doc_hash)
+        
+        self.assertEqual(len(document), 4)
+        self.assertEqual(list(document), pages)
+        self.assertEqual(document[2], 'Ünïcödé — third page')
+        self.assertEqual(document[-1], 'last')
+        self.assertIsInstance(document.page_bytes(0), memoryview)
+        self.assertEqual(bytes(document.page_bytes(0)), b'First page text')
+        with self.assertRaises(IndexError):
+            document.page_text(4)
+        
+        # Each process maps a document once and reuses the mapping
+        self.assertIs(load_pages(self.temp_dir, doc_hash), document)
+    
+    def test_empty_document(self):
+        """Test storing a document whose pages are all empty"""
+        from text_store import save_pages, load_pages
+        
+        save_pages(self.temp_dir, 'b' * 64, ['', ''])
+        self.assertEqual(list(load_pages(self.temp_dir, 'b' * 64)), ['', ''])
+    
+    def test_missing_and_invalid(self):
+        """Test lookups of unknown or malformed document hashes"""
+        from text_store import load_pages
+        
+        self.assertIsNone(load_pages(self.temp_dir, 'c' * 64))
+        with self.assertRaises(ValueError):
+            load_pages(self.temp_dir, '../../etc/passwd')
+
+    def test_prune_store(self):
+        """Test that documents and cached pages unused for too long are removed"""
+        from text_store import (save_pages, load_pages, save_index, save_checkpoint, save_page_text,
+                                load_page_text, prune_store)
+
+        old, recent = 'd' * 64, 'e' * 64
+        for doc_hash in (old, recent):
+            save_pages(self.temp_dir, doc_hash, ['text'])
+            save_index(self.temp_dir, doc_hash, {'pages': 1})
+        save_checkpoint(self.temp_dir, old, 1, 'text', 'text')
+        save_page_text(self.temp_dir, old, 'old page')
+        save_page_text(self.temp_dir, recent, 'recent page')
+        other = os.path.join(self.temp_dir, 'notes.pdf')
+        open(other, 'w').close()
+
+        # Backdate everything, then read one document and one cached page
+        hour_ago = time.time() - 3600
+        for root, dirs, files in os.walk(self.temp_dir):
+            for name in dirs + files:
+                os.utime(os.path.join(root, name), (hour_ago, hour_ago))
+        load_pages(self.temp_dir, recent)
+        load_page_text(self.temp_dir, recent)
+
+        self.assertEqual(prune_store(self.temp_dir, 1800), 2)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         [recent + '.idx', recent + '.off', recent + '.txt', 'notes.pdf', 'pages'])
+        self.assertIsNone(load_page_text(self.temp_dir, old))
+        self.assertEqual(load_page_text(self.temp_dir, recent), 'recent page')
+
+        # Nothing is old enough the second time round
+        self.assertEqual(prune_store(self.temp_dir, 1800), 0)
+    
+    def test_requests_do_not_prune(self):
+        """Test that pruning runs in the background thread, never in a request"""
+        from unittest.mock import patch
+        import threading
+        from app import prune_text_store
+        
+        self.assertIn('text-store-pruner', [thread.name for thread in threading.enumerate()])
+        app.config['TESTING'] = True
+        with patch('app.prune_store', side_effect=AssertionError('requests should not prune')):
+            self.assertEqual(app.test_client().get('/').status_code, 200)
+        
+        store_backup = app.config['TEXT_STORE_FOLDER']
+        app.config['TEXT_STORE_FOLDER'] = self.temp_dir
+        try:
+            with patch('app.prune_store', return_value=0) as prune_store:
+                prune_text_store()
+            prune_store.assert_called_once_with(self.temp_dir, app.config['TEXT_STORE_MAX_AGE'])
+        finally:
+            app.config['TEXT_STORE_FOLDER'] = store_backup
+
+
+class PageIndexTests(unittest.TestCase):
+    """Tests for the positional page index and phrase matching"""
+    
+    def setUp(self):
+        from page_index import PageIndex
+        self.pages = [
+            "Force majeure applies. The force\nmajeure clause, see FORCE-MAJEURE.",
+            "Nothing here but force",
+            "majeure starts this page. Test test_case test1 test.",
+        ]
+        self.index = PageIndex.build(self.pages)
+    
+    def test_single_word_matches_regex_count(self):
+        """Test that single-word counts agree with count_word_occurrences"""
+        for word in ['force', 'majeure', 'test', 'TEST', 'missing', '']:
+            expected = [count_word_occurrences(page, word) for page in self.pages]
+            self.assertEqual(self.index.page_counts(word), expected)
+    
+    def test_phrase_counts(self):
+        """Test phrase matching across whitespace, punctuation and case"""
+        self.assertEqual(self.index.page_counts('force majeure'), [3, 0, 0])
+        self.assertEqual(self.index.page_counts('Force   Majeure'), [3, 0, 0])
+        self.assertEqual(self.index.page_counts('majeure clause see'), [1, 0, 0])
+        self.assertEqual(self.index.page_counts('majeure force'), [0, 0, 0])
+    
+    def test_phrase_does_not_cross_pages(self):
+        """Test that a phrase split over two pages is not counted"""
+        self.assertEqual(self.index.page_counts('but force majeure'), [0, 0, 0])
+    
+    def test_match_spans(self):
+        """Test that match offsets point at the matched text"""
+        page = self.pages[0]
+        spans = self.index.match_spans('force majeure', 0)
+        self.assertEqual([page[start:end] for start, end in spans],
+                         ['Force majeure', 'force\nmajeure', 'FORCE-MAJEURE'])
+        self.assertEqual(self.index.match_spans('force majeure', 1), [])
+    
+    def test_highlight_segments(self):
+        """Test splitting page text into highlighted and plain segments"""
+        from page_index import PageIndex, highlight_segments
+        
+        text = "a b a b a b"
+        index = PageIndex.build([text])
+        spans = index.match_spans('a b a', 0)
+        self.assertEqual(highlight_segments(text, spans), [('a b a b a', True), (' b', False)])
+        self.assertEqual(highlight_segments('plain', []), [('plain', False)])
+        self.assertEqual(highlight_segments('', []), [('', False)])
+    
+    def test_view_page_highlights_on_server(self):
+        """Test that view_page escapes text and highlights without client-side regex"""
+        from unittest.mock import patch
+        
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['pdf_results'] = {
+                'filepath': 'test.pdf',
+                'search_word': 'c++ (beta',
+                'pdf_data': [(1, 'preview', 1)],
+                'total_count': 1
+            }
+        
+        page_data = [(1, 'preview', 1, 'Use <b>C++ (beta)</b> here')]
+        with patch('app.process_pdf', return_value=(page_data, 1)):
+            response = client.get('/view_page/1')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'&lt;b&gt;<span class="highlight-word">C++ (beta</span>)&lt;/b&gt;', response.data)
+        self.assertNotIn(b'new RegExp', response.data)
+    
+    def test_phrase_through_process_pdf(self):
+        """Test phrase counting end to end on a generated PDF"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pdf_path = os.path.join(temp_dir, 'phrase.pdf')
+            c = canvas.Canvas(pdf_path, pagesize=letter)
+            c.drawString(100, 750, "Neither party is liable for force")
+            c.drawString(100, 730, "majeure events. Force majeure includes floods.")
+            c.showPage()
+            c.save()
+            
+            pdf_data, total_count = process_pdf(pdf_path, 'force majeure')
+            self.assertEqual(total_count, 2)
+            # The preview shows both matches in context
+            self.assertEqual(pdf_data[0][1], 'Neither party is liable for force majeure events. Force majeure includes floods \u2026')
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class PageClassificationTests(TempStoreMixin, unittest.TestCase):
+    """Tests for detecting and skipping image-only and blank pages"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        import metrics
+        from reportlab.lib.utils import ImageReader
+        from PIL import Image
+        
+        metrics.reset()
+        super().setUp()
+        self.pdf_path = os.path.join(self.temp_dir, 'scanned.pdf')
+        image_path = os.path.join(self.temp_dir, 'scan.png')
+        Image.new('RGB', (20, 20), 'white').save(image_path)
+        
+        # Page 1: text, page 2: image only, page 3: blank, page 4: text in a form XObject
+        c = canvas.Canvas(self.pdf_path, pagesize=letter)
+        c.drawString(100, 750, "Appendix follows the test.")
+        c.showPage()
+        c.drawImage(ImageReader(image_path), 100, 500, width=200, height=200)
+        c.showPage()
+        c.showPage()
+        c.beginForm('stamp')
+        c.drawString(100, 700, "Stamped test text")
+        c.endForm()
+        c.doForm('stamp')
+        c.showPage()
+        c.save()
+    
+    def test_classify_pages(self):
+        """Test that pages are classified from their content streams"""
+        from app import extract_pages, PAGE_TEXT, PAGE_IMAGE_ONLY, PAGE_BLANK
+        import metrics
+        
+        pages = extract_pages(self.pdf_path)
+        self.assertEqual([kind for kind, _ in pages], [PAGE_TEXT, PAGE_IMAGE_ONLY, PAGE_BLANK, PAGE_TEXT])
+        self.assertIn('Stamped test text', pages[3][1])
+        
+        counters = metrics.snapshot()
+        self.assertEqual(counters['pages_extracted'], 2)
+        self.assertEqual(counters['pages_skipped_image'], 1)
+        self.assertEqual(counters['pages_skipped_blank'], 1)
+    
+    def test_skipped_pages_in_results(self):
+        """Test that skipped pages are labelled and reported"""
+        pdf_data, total_count = process_pdf(self.pdf_path, 'test')
+        self.assertEqual(total_count, 2)
+        self.assertEqual(pdf_data[1][1], '(Image-only page, no text layer)')
+        self.assertEqual(pdf_data[2][1], '(Blank page)')
+        
+        import metrics
+        metrics.reset()
+        with open(self.pdf_path, 'rb') as f:
+            response = self.app.post('/', data={
+                'pdfFile': (f, 'scanned.pdf'),
+                'searchWord': 'test'
+            }, follow_redirects=True)
+        self.assertIn(b'Image-only pages (no text layer, not searched):</span> 2', response.data)
+        self.assertIn(b'Blank pages:</span> 3', response.data)
+        
+        response = self.app.get('/api/metrics')
+        self.assertEqual(response.json['counters']['pages_skipped_image'], 1)
+    
+    def test_format_page_ranges(self):
+        """Test compact page range formatting"""
+        from app import format_page_ranges
+        
+        self.assertEqual(format_page_ranges([1, 2, 3, 7, 9, 10]), '1-3, 7, 9-10')
+        self.assertEqual(format_page_ranges([]), '')
+
+
+class PreflightTests(unittest.TestCase):
+    """Tests for pre-flight cost estimation and lane routing"""
+    
+    def test_read_features(self):
+        """Test reading the page count and content size without extraction"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        import preflight
+        
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pdf_path = os.path.join(temp_dir, 'pages.pdf')
+            c = canvas.Canvas(pdf_path, pagesize=letter)
+            for i in range(5):
+                c.drawString(100, 750, f"Page {i + 1} text")
+                c.showPage()
+            c.save()
+            
+            page_count, content_bytes = preflight.read_features(pdf_path)
+            self.assertEqual(page_count, 5)
+            self.assertGreater(content_bytes, 0)
+            
+            estimate = preflight.estimate(pdf_path)
+            self.assertEqual(estimate.page_count, 5)
+            self.assertGreater(estimate.estimated_seconds, 0)
+        finally:
+            shutil.rmtree(temp_dir)
+    
+    def test_estimate_invalid_pdf(self):
+        """Test that unparseable files are estimated as empty"""
+        import preflight
+        
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as f:
+            f.write(b'not a pdf')
+            f.flush()
+            estimate = preflight.estimate(f.name)
+        self.assertEqual(estimate.page_count, 0)
+    
+    def test_calibrate(self):
+        """Test that calibration recovers a known linear cost model"""
+        import preflight
+        
+        mb = 1024 * 1024
+        samples = [(pages, mb * size, 0.1 + 0.02 * pages + 0.5 * size)
+                   for pages, size in [(1, 0.1), (10, 2), (100, 1), (500, 20), (50, 8)]]
+        model = preflight.calibrate(samples)
+        self.assertAlmostEqual(model['base'], 0.1, places=6)
+        self.assertAlmostEqual(model['per_page'], 0.02, places=6)
+        self.assertAlmostEqual(model['per_mb'], 0.5, places=6)
+        
+        with self.assertRaises(ValueError):
+            preflight.calibrate(samples[:2])
+    
+    def test_choose_lane(self):
+        """Test routing jobs to the fast and slow lanes"""
+        from preflight import PreflightEstimate
+        from scheduler import Lane, choose_lane
+        
+        lanes = {'fast': Lane('fast', 2), 'slow': Lane('slow', 1)}
+        self.assertIs(choose_lane(lanes, PreflightEstimate(5, 1000, 0.2), 5.0), lanes['fast'])
+        self.assertIs(choose_lane(lanes, PreflightEstimate(2000, 10 ** 8, 90.0), 5.0), lanes['slow'])
+    
+    def test_queued_upload_survives_other_requests(self):
+        """Test that another request's cleanup doesn't delete an upload waiting in a lane"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        from unittest.mock import patch
+        import app as app_module
+        
+        temp_dir = tempfile.mkdtemp()
+        store_backup = app.config['TEXT_STORE_FOLDER']
+        app.config['TEXT_STORE_FOLDER'] = temp_dir
+        try:
+            pdf_path = os.path.join(temp_dir, 'queued.pdf')
+            c = canvas.Canvas(pdf_path, pagesize=letter)
+            c.drawString(100, 750, "The queued contract")
+            c.showPage()
+            c.save()
+            
+            real_load_document = app_module.load_document
+            
+            def load_after_other_request(filepath, doc_hash, name=None):
+                # What a request finishing while this upload is queued does
+                with app.app_context():
+                    app_module.cleanup_temp_files()
+                self.assertTrue(os.path.exists(filepath))
+                return real_load_document(filepath, doc_hash, name)
+            
+            client = app.test_client()
+            with patch('app.load_document', side_effect=load_after_other_request):
+                with open(pdf_path, 'rb') as f:
+                    response = client.post('/', data={'pdfFile': (f, 'queued.pdf'), 'searchWord': 'contract'},
+                                           follow_redirects=True)
+            self.assertIn(b'Total Occurrences:</span> <span class="value highlight">1', response.data)
+            
+            # An extraction that yields nothing is an error, not zero results
+            c = canvas.Canvas(pdf_path, pagesize=letter)
+            c.drawString(100, 750, "A document that is not stored yet")
+            c.showPage()
+            c.save()
+            with patch('app.load_document', return_value=([], app_module.PageIndex.build([]))):
+                with open(pdf_path, 'rb') as f:
+                    response = client.post('/', data={'pdfFile': (f, 'queued.pdf'), 'searchWord': 'other'},
+                                           follow_redirects=True)
+            self.assertIn(b'Could not extract any text', response.data)
+            self.assertNotIn(b'Total Occurrences', response.data)
+        finally:
+            app.session_interface.cache.clear()
+            app.config['TEXT_STORE_FOLDER'] = store_backup
+            shutil.rmtree(temp_dir)
+
+
+class SchedulerTests(unittest.TestCase):
+    """Tests for shortest-job-first scheduling with aging and fair share"""
+    
+    def run_jobs(self, lane, jobs, blocker_client='blocker'):
+        """Run (name, cost, client) jobs behind a blocking job and return their start order"""
+        import threading
+        
+        order = []
+        release = threading.Event()
+        blocker_started = threading.Event()
+        
+        def blocker():
+            with lane.slot(cost=0, client=blocker_client):
+                blocker_started.set()
+                release.wait(5)
+        
+        def job(name, cost, client):
+            with lane.slot(cost=cost, client=client):
+                order.append(name)
+        
+        threads = [threading.Thread(target=blocker)]
+        threads[0].start()
+        blocker_started.wait(5)
+        for submitted, (name, cost, client) in enumerate(jobs, 1):
+            thread = threading.Thread(target=job, args=(name, cost, client))
+            thread.start()
+            threads.append(thread)
+            # Submit jobs one at a time so their arrival order is fixed
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                stats = lane.stats()
+                if stats['started'] - 1 + stats['queue_depth'] >= submitted:
+                    break
+                time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return order
+    
+    def test_shortest_job_first(self):
+        """Test that cheaper jobs run before expensive ones"""
+        from scheduler import Lane
+        
+        lane = Lane('test', 1, aging_rate=0)
+        order = self.run_jobs(lane, [('big', 100, 'a'), ('medium', 10, 'b'), ('small', 1, 'c')])
+        self.assertEqual(order, ['small', 'medium', 'big'])
+        
+        stats = lane.stats()
+        self.assertEqual(stats['completed'], 4)
+        self.assertEqual(stats['queue_depth'], 0)
+    
+    def test_aging_prevents_starvation(self):
+        """Test that a long-waiting big job overtakes newer small ones"""
+        from scheduler import Lane
+        
+        lane = Lane('test', 1, aging_rate=10 ** 9)
+        order = self.run_jobs(lane, [('big', 100, 'a'), ('small', 1, 'b')])
+        self.assertEqual(order, ['big', 'small'])
+    
+    def test_fair_share_limit(self):
+        """Test that one client can't take every slot"""
+        from scheduler import Lane
+        
+        lane = Lane('test', 2, aging_rate=0, max_per_client=1)
+        # Client 'a' already holds a slot, so its cheap job waits while 'b' gets the free one
+        order = self.run_jobs(lane, [('a2', 1, 'a'), ('b1', 50, 'b')], blocker_client='a')
+        self.assertEqual(order, ['b1', 'a2'])
+
+
+class AdmissionControlTests(TempStoreMixin, unittest.TestCase):
+    """Tests and a small load test for admission control"""
+    
+    CONFIG_KEYS = ['ADMISSION_MAX_QUEUE_DEPTH', 'ADMISSION_MAX_INFLIGHT_PAGES',
+                   'ADMISSION_MAX_JOBS_PER_CLIENT', 'ADMISSION_MIN_FREE_DISK_BYTES',
+                   'ADMISSION_RETRY_AFTER']
+    
+    def setUp(self):
+        super().setUp()
+        self.config_backup = {key: app.config[key] for key in self.CONFIG_KEYS}
+        self.valid_pdf_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_files/valid.pdf')
+    
+    def tearDown(self):
+        app.config.update(self.config_backup)
+        super().tearDown()
+    
+    def upload(self, client=None, remote_addr='127.0.0.1'):
+        client = client or app.test_client()
+        with open(self.valid_pdf_path, 'rb') as f:
+            return client.post('/', data={
+                'pdfFile': (f, 'valid.pdf'),
+                'searchWord': 'test'
+            }, environ_overrides={'REMOTE_ADDR': remote_addr})
+    
+    def test_load_sheds_excess_uploads(self):
+        """Load test: a burst beyond capacity gets fast 503s with Retry-After"""
+        import threading
+        from unittest.mock import patch
+        from app import admission
+        from page_index import PageIndex
+        
+        app.config['ADMISSION_MAX_QUEUE_DEPTH'] = 0
+        app.config['ADMISSION_RETRY_AFTER'] = 7
+        burst = admission.capacity + 7
+        release = threading.Event()
+        
+        def blocked_load_document(pdf_path, doc_hash, name=None):
+            release.wait(10)
+            return [''], PageIndex.build([''])
+        
+        results = []
+        def worker(remote_addr):
+            # Each thread is a different client, so per-client limits don't apply
+            response = self.upload(remote_addr=remote_addr)
+            results.append((response.status_code, response.headers.get('Retry-After')))
+        
+        with patch('app.load_document', side_effect=blocked_load_document):
+            threads = [threading.Thread(target=worker, args=(f'10.0.0.{i + 1}',)) for i in range(burst)]
+            for thread in threads:
+                thread.start()
+            
+            # The excess is refused while every admitted upload is still blocked
+            deadline = time.monotonic() + 10
+            while len(results) < burst - admission.capacity and time.monotonic() < deadline:
+                time.sleep(0.01)
+            shed = list(results)
+            release.set()
+            for thread in threads:
+                thread.join(10)
+        
+        self.assertEqual(len(shed), burst - admission.capacity)
+        self.assertEqual(shed, [(503, '7')] * len(shed))
+        
+        accepted = [r for r in results if r[0] == 302]
+        refused = [r for r in results if r[0] == 503]
+        self.assertEqual(len(accepted) + len(refused), burst)
+        self.assertLessEqual(len(accepted), admission.capacity)
+        
+        # Everything admitted has been released again
+        self.assertEqual(admission.stats()['inflight_jobs'], 0)
+    
+    def test_per_client_limit(self):
+        """Test that a client over its job limit gets a 429"""
+        app.config['ADMISSION_MAX_JOBS_PER_CLIENT'] = 0
+        response = self.upload()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], str(app.config['ADMISSION_RETRY_AFTER']))
+    
+    def test_clients_without_cookies_share_one_identity(self):
+        """Test that per-client limits key on the address, not a fresh session per request"""
+        from app import client_id
+        
+        ids = set()
+        for _ in range(3):
+            with app.test_request_context('/', environ_overrides={'REMOTE_ADDR': '10.1.2.3'}):
+                ids.add(client_id())
+        self.assertEqual(ids, {'10.1.2.3'})
+    
+    def test_client_id_behind_proxy(self):
+        """Test that behind a trusted proxy the forwarded client address is used"""
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        from werkzeug.test import EnvironBuilder
+        from app import client_id
+        
+        environs = []
+        proxied = ProxyFix(lambda environ, start_response: environs.append(environ) or [], x_for=1)
+        environ = EnvironBuilder('/', environ_overrides={'REMOTE_ADDR': '10.0.0.1'},
+                                 headers={'X-Forwarded-For': '203.0.113.7'}).get_environ()
+        proxied(environ, None)
+        with app.request_context(environs[0]):
+            self.assertEqual(client_id(), '203.0.113.7')
+    
+    def test_low_disk_space(self):
+        """Test that uploads are refused when the disk is nearly full"""
+        from unittest.mock import patch
+        from collections import namedtuple
+        
+        usage = namedtuple('usage', 'total used free')(10 ** 9, 10 ** 9 - 1024, 1024)
+        with patch('admission.shutil.disk_usage', return_value=usage):
+            response = self.upload()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(b'disk space', response.data)
+    
+    def test_inflight_pages_limit(self):
+        """Test the in-flight page budget, which always lets one job through"""
+        from admission import AdmissionController, Overloaded
+        
+        config = {
+            'ADMISSION_MAX_QUEUE_DEPTH': 10, 'ADMISSION_MAX_INFLIGHT_PAGES': 100,
+            'ADMISSION_MAX_JOBS_PER_CLIENT': 5, 'ADMISSION_MIN_FREE_DISK_BYTES': 0,
+            'ADMISSION_RETRY_AFTER': 5
+        }
+        controller = AdmissionController(config, capacity=2, disk_path=self.temp_dir)
+        with controller.admit('a') as first:
+            first.reserve_pages(500)
+            with controller.admit('b') as second:
+                with self.assertRaises(Overloaded) as context:
+                    second.reserve_pages(10)
+                self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(controller.stats(), {'inflight_jobs': 0, 'inflight_pages': 0, 'queue_depth': 0})
+
+
+class CheckpointTests(TempStoreMixin, unittest.TestCase):
+    """Tests for per-page checkpoints and resuming interrupted extraction"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        super().setUp()
+        
+        self.pdf_path = os.path.join(self.temp_dir, 'checkpoint.pdf')
+        c = canvas.Canvas(self.pdf_path, pagesize=letter)
+        for page_number in range(1, 5):
+            c.drawString(100, 750, f"Clause {page_number} of the contract.")
+            c.showPage()
+        c.save()
+    
+    def interrupt_after(self, pages):
+        """Patch extraction so it fails after yielding ``pages`` pages"""
+        from unittest.mock import patch
+        import app as app_module
+        
+        original = app_module.iter_extracted_pages
+        
+        def interrupted(pdf_path, start_page=0):
+            for done, page in enumerate(original(pdf_path, start_page)):
+                if done == pages:
+                    raise MemoryError('worker killed')
+                yield page
+        
+        return patch('app.iter_extracted_pages', side_effect=interrupted)
+    
+    def test_checkpoint_round_trip(self):
+        """Test that only the pages up to the first gap are loaded"""
+        from text_store import save_checkpoint, load_checkpoints, clear_checkpoints
+        
+        doc_hash = 'd' * 64
+        save_checkpoint(self.temp_dir, doc_hash, 1, 'text', 'first page\nsecond line')
+        save_checkpoint(self.temp_dir, doc_hash, 2, 'blank', '')
+        save_checkpoint(self.temp_dir, doc_hash, 4, 'text', 'after a gap')
+        self.assertEqual(load_checkpoints(self.temp_dir, doc_hash), [('text', 'first page\nsecond line'), ('blank', '')])
+        
+        clear_checkpoints(self.temp_dir, doc_hash)
+        self.assertEqual(load_checkpoints(self.temp_dir, doc_hash), [])
+    
+    def test_resume_after_interruption(self):
+        """Test that a retried job only extracts the pages it hadn't finished"""
+        from unittest.mock import patch
+        import app as app_module
+        from app import load_document
+        from text_store import document_hash, load_checkpoints
+        
+        doc_hash = document_hash(self.pdf_path)
+        with self.interrupt_after(3):
+            pages_text, _ = load_document(self.pdf_path, doc_hash)
+        self.assertEqual(pages_text, [])
+        self.assertEqual(len(load_checkpoints(self.temp_dir, doc_hash)), 3)
+        
+        with patch('app.iter_extracted_pages', wraps=app_module.iter_extracted_pages) as spy:
+            pages_text, page_index = load_document(self.pdf_path, doc_hash)
+        spy.assert_called_once_with(self.pdf_path, start_page=3)
+        self.assertEqual(len(pages_text), 4)
+        self.assertIn('Clause 4', pages_text[3])
+        self.assertEqual(page_index.page_counts('contract'), [1, 1, 1, 1])
+        
+        # Checkpoints are dropped once the full text is stored
+        self.assertEqual(load_checkpoints(self.temp_dir, doc_hash), [])
+    
+    def test_partial_progress(self):
+        """Test that progress and partial counts are reported while pages are missing"""
+        from app import load_document
+        from text_store import document_hash
+        
+        doc_hash = document_hash(self.pdf_path)
+        with self.interrupt_after(2):
+            load_document(self.pdf_path, doc_hash)
+        
+        response = self.app.get(f'/api/progress/{doc_hash}?word=clause')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'doc_hash': doc_hash,
+            'complete': False,
+            'pages_completed': 2,
+            'search_word': 'clause',
+            'total_count': 2,
+            'page_counts': {'1': 1, '2': 1}
+        })
+        
+        load_document(self.pdf_path, doc_hash)
+        progress = self.app.get(f'/api/progress/{doc_hash}').get_json()
+        self.assertTrue(progress['complete'])
+        self.assertEqual(progress['pages_completed'], 4)
+        
+        self.assertEqual(self.app.get('/api/progress/not-a-hash').status_code, 404)
+
+
+class PageDedupTests(TempStoreMixin, unittest.TestCase):
+    """Tests for reusing extracted text of pages seen before, by content hash"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        super().setUp()
+    
+    def make_pdf(self, name, pages):
+        path = os.path.join(self.temp_dir, name)
+        c = canvas.Canvas(path, pagesize=letter)
+        for text in pages:
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+        return path
+    
+    def test_hash_ignores_object_numbers(self):
+        """Test that the same page hashes alike in different documents"""
+        from pdfminer.pdfpage import PDFPage
+        from page_hash import page_content_hash
+        
+        def page_hashes(path):
+            with open(path, 'rb') as f:
+                return [page_content_hash(page) for page in PDFPage.get_pages(f)]
+        
+        v1 = page_hashes(self.make_pdf('v1.pdf', ['Boilerplate terms.', 'Price: 100']))
+        v2 = page_hashes(self.make_pdf('v2.pdf', ['Cover letter.', 'Boilerplate terms.', 'Price: 120']))
+        self.assertEqual(v1[0], v2[1])
+        self.assertNotEqual(v1[1], v2[2])
+        self.assertEqual(len(set(v2)), 3)
+
+    def test_layout_settings_change_invalidates_pages(self):
+        """Test that cached page text isn't reused under other layout settings"""
+        from unittest.mock import patch
+        from pdfminer.pdfinterp import PDFPageInterpreter
+        import app as app_module
+
+        path = self.make_pdf('doc.pdf', ['Definitions apply.', 'Governing law.'])
+        app_module.extract_text_by_page(path)
+
+        settings = dict(app_module.LAYOUT_PARAMS, char_margin=app_module.LAYOUT_PARAMS['char_margin'] + 1)
+        with patch.dict(app_module.LAYOUT_PARAMS, settings), \
+             patch.object(PDFPageInterpreter, 'process_page', autospec=True,
+                          side_effect=PDFPageInterpreter.process_page) as process_page:
+            app_module.extract_text_by_page(path)
+        self.assertEqual(process_page.call_count, 2)
+
+    def test_new_revision_only_interprets_changed_pages(self):
+        """Test that re-extracting a revision only pays for pages that changed"""
+        from unittest.mock import patch
+        from pdfminer.pdfinterp import PDFPageInterpreter
+        from app import extract_text_by_page
+        
+        v1 = self.make_pdf('v1.pdf', ['Definitions apply.', 'Payment within 30 days.', 'Governing law.'])
+        v2 = self.make_pdf('v2.pdf', ['Definitions apply.', 'Payment within 60 days.', 'Governing law.'])
+        v1_text = extract_text_by_page(v1)
+        
+        with patch.object(PDFPageInterpreter, 'process_page', autospec=True,
+                          side_effect=PDFPageInterpreter.process_page) as process_page:
+            v2_text = extract_text_by_page(v2)
+        self.assertEqual(process_page.call_count, 1)
+        self.assertEqual(v2_text[0], v1_text[0])
+        self.assertEqual(v2_text[2], v1_text[2])
+        self.assertIn('60 days', v2_text[1])
+    
+    def test_cache_can_be_disabled(self):
+        """Test that every page is interpreted when the page cache is off"""
+        from unittest.mock import patch
+        from pdfminer.pdfinterp import PDFPageInterpreter
+        from app import extract_text_by_page
+        
+        path = self.make_pdf('doc.pdf', ['Same page.', 'Same page.'])
+        app.config['PAGE_TEXT_CACHE'] = False
+        try:
+            with patch.object(PDFPageInterpreter, 'process_page', autospec=True,
+                              side_effect=PDFPageInterpreter.process_page) as process_page:
+                extract_text_by_page(path)
+        finally:
+            app.config['PAGE_TEXT_CACHE'] = True
+        self.assertEqual(process_page.call_count, 2)
+
+
+class FontCacheTests(TempStoreMixin, unittest.TestCase):
+    """Tests for the process-wide decoded font cache"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        import metrics
+        
+        metrics.reset()
+        super().setUp()
+        # An embedded TrueType font, like a corporate font shared between documents
+        pdfmetrics.registerFont(TTFont('Vera', 'Vera.ttf'))
+    
+    def make_pdf(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        c = canvas.Canvas(path, pagesize=letter)
+        c.setFont('Vera', 12)
+        c.drawString(100, 750, text)
+        c.showPage()
+        c.save()
+        return path
+    
+    def test_documents_share_decoded_fonts(self):
+        """Test that a second document using the same font doesn't decode it again"""
+        from unittest.mock import patch
+        from font_cache import FontCache
+        from app import extract_text_by_page
+        import metrics
+        
+        # Same glyphs in the same order, so the embedded font subsets are identical
+        first = self.make_pdf('first.pdf', 'Quarterly report')
+        second = self.make_pdf('second.pdf', 'Quarterly report report')
+        with patch('app.font_cache', FontCache()) as cache:
+            self.assertIn('Quarterly report', extract_text_by_page(first)[0])
+            fonts = metrics.snapshot().get('font_cache_misses')
+            self.assertEqual(len(cache), fonts)
+            
+            self.assertIn('Quarterly report report', extract_text_by_page(second)[0])
+            counters = metrics.snapshot()
+            self.assertEqual(counters.get('font_cache_misses'), fonts)
+            self.assertEqual(counters.get('font_cache_hits'), fonts)
+    
+    def test_disk_cache_and_size_limit(self):
+        """Test that fonts survive a new cache via disk and memory stays bounded"""
+        from pdfminer.pdfinterp import PDFResourceManager
+        from font_cache import FontCache
+        
+        font_dir = os.path.join(self.temp_dir, 'fonts')
+        cache = FontCache(max_entries=2, folder=font_dir)
+        manager = PDFResourceManager()
+        for name in ('Helvetica', 'Courier', 'Times-Roman'):
+            spec = {'Type': 'Font', 'Subtype': 'Type1', 'BaseFont': name}
+            cache.put(name.lower(), manager.get_font(None, spec))
+        self.assertEqual(len(cache), 2)
+        
+        restarted = FontCache(folder=font_dir)
+        font = restarted.get('helvetica')
+        self.assertIsNotNone(font)
+        self.assertEqual(font.fontname, 'Helvetica')
+        self.assertIsNone(restarted.get('missing'))
+
+
+class SamplingTests(TempStoreMixin, unittest.TestCase):
+    """Tests for the sampling-based approximate count mode"""
+    
+    def make_pdf(self, page_counts):
+        """Create a PDF whose pages mention 'audit' the given number of times"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        path = os.path.join(self.temp_dir, 'dump.pdf')
+        c = canvas.Canvas(path, pagesize=letter)
+        for page_number, count in enumerate(page_counts, 1):
+            c.drawString(100, 750, f"Page {page_number} " + "audit " * count)
+            c.showPage()
+        c.save()
+        return path
+    
+    def test_sample_order_is_stratified(self):
+        """Test that every prefix of the order spreads across the strata"""
+        import random
+        from sampling import make_strata, sample_order
+        
+        strata = make_strata(95, max_strata=10)
+        self.assertEqual(len(strata), 10)
+        self.assertEqual(strata[0][0], 0)
+        self.assertEqual(strata[-1][1], 95)
+        
+        order = sample_order(strata, random.Random(1))
+        self.assertEqual(sorted(order), list(range(95)))
+        first_round = order[:10]
+        self.assertEqual(sorted(self.stratum_of(strata, page) for page in first_round), list(range(10)))
+    
+    def stratum_of(self, strata, page):
+        return next(i for i, (start, end) in enumerate(strata) if start <= page < end)
+    
+    def test_estimate_total(self):
+        """Test the stratified estimator and its confidence interval"""
+        from sampling import make_strata, estimate_total
+        
+        strata = make_strata(10, max_strata=2)
+        # Fully sampled: exact, with no uncertainty
+        exact = estimate_total(strata, {page: page % 3 for page in range(10)})
+        self.assertTrue(exact.exact)
+        self.assertEqual((exact.estimate, exact.low, exact.high), (9, 9, 9))
+        
+        # Half sampled: scaled up, and never below what was already seen
+        partial = estimate_total(strata, {0: 2, 1: 4, 5: 1, 6: 3})
+        self.assertFalse(partial.exact)
+        self.assertEqual(partial.estimate, 25)
+        self.assertGreaterEqual(partial.low, 10)
+        self.assertLess(partial.low, partial.estimate)
+        self.assertGreater(partial.high, partial.estimate)
+    
+    def test_approximate_process_pdf(self):
+        """Test that approximate mode stops at the time budget and refines as it goes"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        from app import process_pdf
+        from sampling import ApproximateCount
+        
+        path = self.make_pdf([1] * 30)
+        pdf_data, estimate = process_pdf(path, 'audit', approximate=True, time_budget=0)
+        self.assertIsInstance(estimate, ApproximateCount)
+        self.assertEqual(estimate.pages_sampled, 1)
+        self.assertEqual(estimate.page_count, 30)
+        self.assertEqual(estimate.estimate, 30)
+        self.assertEqual(len(pdf_data), 1)
+        
+        estimates = []
+        pdf_data, estimate = process_pdf(path, 'audit', approximate=True, time_budget=60,
+                                         on_estimate=estimates.append)
+        self.assertEqual(len(estimates), 30)
+        self.assertTrue(estimate.exact)
+        self.assertEqual(estimate.estimate, 30)
+        self.assertEqual([entry[0] for entry in pdf_data], list(range(1, 31)))
+    
+    def test_interval_covers_true_total(self):
+        """Test that a partial sample's interval contains the true count"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        from app import estimate_pdf
+        
+        page_counts = [(page * 7) % 4 for page in range(40)]
+        path = self.make_pdf(page_counts)
+        estimates = []
+        estimate_pdf(path, 'audit', time_budget=60, on_estimate=estimates.append, seed=3)
+        
+        halfway = estimates[19]
+        self.assertEqual(halfway.pages_sampled, 20)
+        self.assertLessEqual(halfway.low, sum(page_counts))
+        self.assertGreaterEqual(halfway.high, sum(page_counts))
+        self.assertEqual(estimates[-1].estimate, sum(page_counts))
+
+
+class QueryModeTests(TempStoreMixin, unittest.TestCase):
+    """Tests for the exists, first_n and at_least query modes"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        super().setUp()
+        
+        # 'indemnification' on pages 2 (twice) and 4 of 6
+        self.pdf_path = os.path.join(self.temp_dir, 'contract.pdf')
+        c = canvas.Canvas(self.pdf_path, pagesize=letter)
+        for text in ["Definitions.", "Indemnification and indemnification caps.", "Payment terms.",
+                     "Mutual indemnification.", "Term.", "Signatures."]:
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+    
+    def test_run_query_stops_reading_pages(self):
+        """Test that no page is read after the answer is known"""
+        from query_modes import run_query
+        
+        read = []
+        def pages():
+            for text in ['no', 'yes here', 'yes yes', 'yes']:
+                read.append(text)
+                yield text
+        
+        result = run_query(pages(), 'yes', 'exists')
+        self.assertTrue(result.answer)
+        self.assertEqual(result.pages_examined, 2)
+        self.assertEqual(len(read), 2)
+        
+        result = run_query(pages(), 'yes', 'at_least', 5)
+        self.assertFalse(result.answer)
+        self.assertEqual((result.total_count, result.pages_examined), (4, 4))
+        
+        result = run_query(pages(), 'yes', 'first_n', 2)
+        self.assertEqual(result.answer, [(2, 1), (3, 2)])
+        
+        with self.assertRaises(ValueError):
+            run_query([], 'yes', 'sometimes')
+    
+    def test_query_pdf(self):
+        """Test that query_pdf only extracts the pages it needs"""
+        from app import query_pdf
+        
+        result = query_pdf(self.pdf_path, 'indemnification', 'exists')
+        self.assertTrue(result.answer)
+        self.assertEqual(result.pages_examined, 2)
+        
+        result = query_pdf(self.pdf_path, 'indemnification', 'at_least', 3)
+        self.assertTrue(result.answer)
+        self.assertEqual(result.pages_examined, 4)
+        
+        result = query_pdf(self.pdf_path, 'arbitration', 'exists')
+        self.assertFalse(result.answer)
+        self.assertEqual(result.pages_examined, 6)
+        
+        # A missing file is an error, not a document without matches
+        with self.assertRaises(FileNotFoundError):
+            query_pdf(os.path.join(self.temp_dir, 'missing.pdf'), 'indemnification', 'exists')
+    
+    def test_queued_query_survives_other_requests(self):
+        """Test that another request's cleanup doesn't delete a query's upload"""
+        from unittest.mock import patch
+        import app as app_module
+        
+        real_query_pdf = app_module.query_pdf
+        
+        def query_after_other_request(filepath, *args):
+            # What a request finishing while this query waits in a lane does
+            with app.app_context():
+                app_module.cleanup_temp_files()
+            return real_query_pdf(filepath, *args)
+        
+        with patch('app.query_pdf', side_effect=query_after_other_request):
+            with open(self.pdf_path, 'rb') as f:
+                response = self.app.post('/api/query', data={
+                    'pdfFile': (f, 'contract.pdf'), 'searchWord': 'indemnification'
+                })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['pages_examined'], 2)
+        
+        def query_lost_file(filepath, *args):
+            os.remove(filepath)
+            return real_query_pdf(filepath, *args)
+        
+        with patch('app.query_pdf', side_effect=query_lost_file):
+            with open(self.pdf_path, 'rb') as f:
+                response = self.app.post('/api/query', data={
+                    'pdfFile': (f, 'contract.pdf'), 'searchWord': 'indemnification'
+                })
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('error', response.get_json())
+    
+    def test_api_query(self):
+        """Test the JSON query route"""
+        with open(self.pdf_path, 'rb') as f:
+            response = self.app.post('/api/query', data={
+                'pdfFile': (f, 'contract.pdf'),
+                'searchWord': 'indemnification',
+                'mode': 'first_n',
+                'n': '1'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'search_word': 'indemnification',
+            'mode': 'first_n',
+            'n': 1,
+            'answer': [{'page': 2, 'count': 2}],
+            'total_count': 2,
+            'pages_examined': 2
+        })
+        
+        with open(self.pdf_path, 'rb') as f:
+            response = self.app.post('/api/query', data={
+                'pdfFile': (f, 'contract.pdf'),
+                'searchWord': 'indemnification',
+                'mode': 'maybe'
+            })
+        self.assertEqual(response.status_code, 400)
+    
+    def test_cli(self):
+        """Test the query options of the command-line script"""
+        import io
+        from contextlib import redirect_stdout
+        import pdf_word_counter_advanced
+        
+        output = io.StringIO()
+        with redirect_stdout(output):
+            pdf_word_counter_advanced.main([self.pdf_path, 'indemnification', '--at-least', '2'])
+        self.assertIn("occurs at least 2 time(s)", output.getvalue())
+        self.assertIn("Pages examined: 2", output.getvalue())
+
+
+class PageSelectionTests(TempStoreMixin, unittest.TestCase):
+    """Tests for searching a range or set of pages"""
+    
+    def setUp(self):
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        super().setUp()
+        
+        # 'clause' on every page; the appendix (pages 5-6) also says 'schedule'
+        self.pdf_path = os.path.join(self.temp_dir, 'agreement.pdf')
+        c = canvas.Canvas(self.pdf_path, pagesize=letter)
+        for page_number in range(1, 7):
+            text = f"Clause {page_number}." + (" Schedule appendix." if page_number > 4 else "")
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+    
+    def test_parse_page_ranges(self):
+        """Test parsing of page selections"""
+        from page_ranges import parse_page_ranges, format_page_ranges
+        
+        self.assertEqual(parse_page_ranges('1-3, 7,2'), [1, 2, 3, 7])
+        self.assertEqual(parse_page_ranges('5-', page_count=7), [5, 6, 7])
+        self.assertIsNone(parse_page_ranges(' '))
+        self.assertEqual(parse_page_ranges(format_page_ranges([1, 2, 3, 7])), [1, 2, 3, 7])
+        for text in ['0-2', '4-2', 'x', '5-', '1-999999999']:
+            with self.assertRaises(ValueError):
+                parse_page_ranges(text)
+        
+        # The web app and the command line share one parser
+        import app as app_module
+        import pdf_word_counter_advanced
+        self.assertIs(app_module.parse_page_ranges, parse_page_ranges)
+        self.assertIs(pdf_word_counter_advanced.parse_page_ranges, parse_page_ranges)
+    
+    def test_only_selected_pages_are_extracted(self):
+        """Test that cost follows the selection and page numbers stay absolute"""
+        from unittest.mock import patch
+        from pdfminer.pdfinterp import PDFPageInterpreter
+        from app import process_pdf
+        
+        with patch.object(PDFPageInterpreter, 'process_page', autospec=True,
+                          side_effect=PDFPageInterpreter.process_page) as process_page:
+            pdf_data, total_count = process_pdf(self.pdf_path, 'clause', pages=[2, 4, 9])
+        self.assertEqual(process_page.call_count, 2)
+        self.assertEqual([entry[0] for entry in pdf_data], [2, 4])
+        self.assertEqual(total_count, 2)
+    
+    def test_upload_with_page_range(self):
+        """Test the page selection field of the upload form"""
+        with open(self.pdf_path, 'rb') as f:
+            response = self.app.post('/', data={
+                'pdfFile': (f, 'agreement.pdf'),
+                'searchWord': 'clause',
+                'pages': '3-4'
+            }, follow_redirects=True)
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">2', response.data)
+        self.assertIn(b'Pages searched:</span> <span class="value">3-4', response.data)
+        self.assertIn(b'href="/view_page/4"', response.data)
+        self.assertNotIn(b'href="/view_page/1"', response.data)
+        
+        # Refining and page views stay within the selection
+        response = self.app.post('/refine', data={'searchWord': 'schedule'}, follow_redirects=True)
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">0', response.data)
+        response = self.app.get('/view_page/4')
+        self.assertIn(b'Clause 4.', response.data)
+        response = self.app.get('/view_page/1', follow_redirects=True)
+        self.assertIn(b'Invalid page number: 1', response.data)
+    
+    def test_invalid_page_range(self):
+        """Test that a malformed selection is reported"""
+        with open(self.pdf_path, 'rb') as f:
+            response = self.app.post('/', data={
+                'pdfFile': (f, 'agreement.pdf'),
+                'searchWord': 'clause',
+                'pages': 'ten-twenty'
+            }, follow_redirects=True)
+        self.assertIn(b'Invalid page range', response.data)
+    
+    def test_cli_pages(self):
+        """Test the --pages option of the command-line script"""
+        import io
+        from contextlib import redirect_stdout
+        import pdf_word_counter_advanced
+        
+        output = io.StringIO()
+        with redirect_stdout(output):
+            pdf_word_counter_advanced.main([self.pdf_path, 'schedule', '--pages', '4-6'])
+        self.assertIn("Page 5: 1 occurrence(s)", output.getvalue())
+        self.assertIn("Total occurrences in document: 2", output.getvalue())
+        
+        # Early-terminating queries report absolute page numbers too
+        output = io.StringIO()
+        with redirect_stdout(output):
+            pdf_word_counter_advanced.main([self.pdf_path, 'schedule', '--pages', '4-6', '--first', '1'])
+        self.assertIn("Page 5: 1 occurrence(s)", output.getvalue())
+        self.assertIn("Pages examined: 2", output.getvalue())
+
+
+class SearchIndexTests(TempStoreMixin, unittest.TestCase):
+    """Tests for the cross-document SQLite FTS5 search index"""
+    
+    def setUp(self):
+        super().setUp()
+        app.config['SEARCH_INDEX_PATH'] = os.path.join(self.temp_dir, 'search.db')
+    
+    def tearDown(self):
+        from app import search_indexes
+        for search_index in search_indexes.values():
+            search_index.close()
+        search_indexes.clear()
+        app.config['SEARCH_INDEX_PATH'] = None
+        super().tearDown()
+    
+    def test_terms_and_phrases_across_documents(self):
+        """Test page hits and per-document counts for words and phrases"""
+        from search_index import SearchIndex
+        
+        search_index = SearchIndex(os.path.join(self.temp_dir, 'terms.db'))
+        search_index.add_document('a' * 64, ['force majeure applies', 'Force Majeure, force majeure'], 'a.pdf')
+        search_index.add_document('b' * 64, ['no majeure force here', 'force majeure'], 'b.pdf')
+        
+        self.assertEqual(search_index.search('MAJEURE'), [
+            ('a' * 64, 'a.pdf', 1, 1), ('a' * 64, 'a.pdf', 2, 2),
+            ('b' * 64, 'b.pdf', 1, 1), ('b' * 64, 'b.pdf', 2, 1)
+        ])
+        # 'majeure force' on page 1 of b.pdf is not the phrase
+        self.assertEqual([(hit.name, hit.page_number, hit.count) for hit in search_index.search('force majeure')],
+                         [('a.pdf', 1, 1), ('a.pdf', 2, 2), ('b.pdf', 2, 1)])
+        self.assertEqual([(entry.name, entry.count, entry.pages) for entry in search_index.document_counts('force majeure')],
+                         [('a.pdf', 3, [(1, 1), (2, 2)]), ('b.pdf', 1, [(2, 1)])])
+        self.assertEqual(search_index.search('arbitration'), [])
+        
+        # Re-indexing a document replaces its pages
+        search_index.add_document('b' * 64, ['arbitration'], 'b.pdf')
+        self.assertEqual(search_index.stats(), {'documents': 2, 'pages': 3})
+        self.assertEqual(len(search_index.search('arbitration')), 1)
+        self.assertTrue(search_index.has_document('b' * 64))
+        self.assertFalse(search_index.has_document('c' * 64))
+        search_index.close()
+    
+    def test_counts_agree_with_page_index(self):
+        """Test that casefolding gives the same counts as a per-document search"""
+        from page_index import PageIndex
+        from search_index import SearchIndex
+        
+        pages = ['Die Straße heißt STRASSE', 'Strasse und Straße']
+        search_index = SearchIndex(os.path.join(self.temp_dir, 'casefold.db'))
+        search_index.add_document('a' * 64, pages, 'a.pdf')
+        page_index = PageIndex.build(pages)
+        for query in ['straße', 'STRASSE', 'die straße', 'stra*']:
+            self.assertEqual([(hit.page_number, hit.count) for hit in search_index.search(query)],
+                             [(page + 1, count) for page, count in enumerate(page_index.page_counts(query)) if count],
+                             query)
+        search_index.close()
+    
+    def test_older_indexes_are_upgraded(self):
+        """Test that an index written by the first schema is reindexed when opened"""
+        import sqlite3
+        from contextlib import closing
+        from search_index import SearchIndex
+        
+        path = os.path.join(self.temp_dir, 'old.db')
+        with closing(sqlite3.connect(path)) as connection, connection:
+            connection.executescript("""
+                CREATE TABLE documents (doc_id INTEGER PRIMARY KEY, doc_hash TEXT NOT NULL UNIQUE, name TEXT,
+                                        page_count INTEGER NOT NULL, indexed_at REAL NOT NULL);
+                CREATE VIRTUAL TABLE pages USING fts5(text, doc_id UNINDEXED, page_number UNINDEXED,
+                                                      tokenize="unicode61 remove_diacritics 0 tokenchars '_'");
+                CREATE VIRTUAL TABLE pages_terms USING fts5vocab(pages, 'instance');
+                INSERT INTO documents VALUES (1, 'aaaa', 'old.pdf', 1, 0);
+                INSERT INTO pages VALUES ('Die Straße, STRASSE', 1, 1);
+            """)
+        search_index = SearchIndex(path)
+        self.assertEqual([(hit.name, hit.count) for hit in search_index.search('straße')], [('old.pdf', 2)])
+        search_index.close()
+    
+    def test_documents_are_indexed_once(self):
+        """Test that processing a document again doesn't rewrite its index entries"""
+        from unittest.mock import patch
+        from app import index_document, get_search_index
+        
+        index_document('a' * 64, ['rent'], 'a.pdf')
+        with patch.object(get_search_index(), 'add_document') as add_document:
+            index_document('a' * 64, ['rent'], 'a.pdf')
+        add_document.assert_not_called()
+    
+    def test_pages_are_written_in_batches(self):
+        """Test that queued pages are written once a batch is full"""
+        import sqlite3
+        from search_index import SearchIndex
+        
+        path = os.path.join(self.temp_dir, 'batches.db')
+        search_index = SearchIndex(path, batch_size=3)
+        
+        def stored_pages():
+            with sqlite3.connect(path) as connection:
+                return connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+        
+        search_index.add_document('a' * 64, ['one', 'two'])
+        self.assertEqual(stored_pages(), 0)
+        search_index.add_document('b' * 64, ['three'])
+        self.assertEqual(stored_pages(), 3)
+        search_index.add_document('c' * 64, ['four'])
+        search_index.close()
+        self.assertEqual(stored_pages(), 4)
+    
+    def test_uploads_are_indexed_and_searchable(self):
+        """Test that uploaded documents can be searched through the API"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        for name, lines in [('lease.pdf', ['Rent is due monthly.', 'Late rent incurs a fee.']),
+                            ('loan.pdf', ['Interest and rent.'])]:
+            pdf_path = os.path.join(self.temp_dir, name)
+            c = canvas.Canvas(pdf_path, pagesize=letter)
+            for line in lines:
+                c.drawString(100, 750, line)
+                c.showPage()
+            c.save()
+            with open(pdf_path, 'rb') as f:
+                self.app.post('/', data={'pdfFile': (f, name), 'searchWord': 'rent'})
+        
+        response = self.app.get('/api/search?q=rent')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['total_count'], 3)
+        self.assertEqual([(document['name'], document['total_count']) for document in data['documents']],
+                         [('lease.pdf', 2), ('loan.pdf', 1)])
+        self.assertEqual(data['documents'][0]['pages'], [{'page': 1, 'count': 1}, {'page': 2, 'count': 1}])
+        
+        self.assertEqual(self.app.get('/api/search?q=').status_code, 400)
+        # Fuzzy terms are refused rather than silently matching nothing
+        response = self.app.get('/api/search?q=rnet~')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Fuzzy', response.get_json()['error'])
+        app.config['SEARCH_INDEX_PATH'] = None
+        self.assertEqual(self.app.get('/api/search?q=rent').status_code, 404)
+
+
+class BooleanQueryTests(TempStoreMixin, unittest.TestCase):
+    """Tests for AND/OR/NOT page queries evaluated on page bitsets"""
+    
+    def test_parse_query(self):
+        """Test operator precedence, phrases and syntax errors"""
+        from boolean_query import parse_query, is_boolean_query, Term, And, Or, Not
+        
+        self.assertEqual(parse_query('liability AND cap OR NOT mutual'),
+                         Or(And(Term('liability'), Term('cap')), Not(Term('mutual'))))
+        self.assertEqual(parse_query('force majeure AND (act OR "act of god")'),
+                         And(Term('force majeure'), Or(Term('act'), Term('act of god'))))
+        # Lower-case operators are ordinary words
+        self.assertFalse(is_boolean_query('terms and conditions'))
+        self.assertTrue(is_boolean_query('cap NOT mutual'))
+        self.assertFalse(is_boolean_query('C++ (beta)'))
+        self.assertEqual(parse_query('cap NOT mutual'), And(Term('cap'), Not(Term('mutual'))))
+        for query in ['cap OR', 'AND cap', '(cap', 'cap)', 'NOT', '"" AND cap']:
+            with self.assertRaises(ValueError):
+                parse_query(query)
+    
+    def test_bitset_evaluation(self):
+        """Test that AND/OR/NOT select the right pages"""
+        from page_index import PageIndex
+        from boolean_query import parse_query, evaluate, bitset_pages, query_page_counts
+        
+        page_index = PageIndex.build(
+            ['liability cap', 'mutual liability cap', 'cap only', '', 'Liability, cap and cap'],
+            ['text', 'text', 'text', 'blank', 'text']
+        )
+        self.assertEqual(page_index.page_bitset('cap'), 0b10111)
+        self.assertEqual(page_index.text_page_bitset(), 0b10111)
+        
+        def pages(query):
+            return bitset_pages(evaluate(parse_query(query), page_index))
+        
+        self.assertEqual(pages('liability AND cap AND NOT mutual'), [0, 4])
+        self.assertEqual(pages('mutual OR only'), [1, 2])
+        # NOT never selects pages without text
+        self.assertEqual(pages('NOT liability'), [2])
+        self.assertEqual(pages('liability AND NOT liability'), [])
+        
+        # Matching pages count the terms looked for, so a page matched
+        # only through NOT counts none
+        self.assertEqual(query_page_counts(page_index, 'liability AND cap AND NOT mutual'), [2, 0, 0, 0, 3])
+        self.assertEqual(query_page_counts(page_index, 'NOT liability'), [0, 0, 0, 0, 0])
+    
+    def test_boolean_search_in_web_ui_and_api(self):
+        """Test boolean searches through the upload form and the pages API"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        pdf_path = os.path.join(self.temp_dir, 'terms.pdf')
+        c = canvas.Canvas(pdf_path, pagesize=letter)
+        for text in ["Liability cap of fees.", "Mutual liability cap.", "Liability is unlimited."]:
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+        
+        with open(pdf_path, 'rb') as f:
+            response = self.app.post('/', data={
+                'pdfFile': (f, 'terms.pdf'),
+                'searchWord': 'liability AND cap AND NOT mutual'
+            }, follow_redirects=True)
+        self.assertIn(b'href="/view_page/1"', response.data)
+        self.assertNotIn(b'href="/view_page/2"', response.data)
+        self.assertNotIn(b'href="/view_page/3"', response.data)
+        response = self.app.get('/view_page/1')
+        self.assertIn(b'<span class="highlight-word">Liability</span>', response.data)
+        self.assertIn(b'<span class="highlight-word">cap</span>', response.data)
+        
+        # A page matched only through NOT is listed, with no occurrences
+        response = self.app.post('/refine', data={'searchWord': 'NOT cap'}, follow_redirects=True)
+        self.assertIn(b'href="/view_page/3" class="page-link">3</a></td>\n                                    <td class="count">0</td>',
+                      response.data)
+        self.assertNotIn(b'href="/view_page/1"', response.data)
+        response = self.app.get('/view_page/3')
+        self.assertIn(b'Occurrences on this page:</span> <span class="value highlight">0</span>', response.data)
+        
+        response = self.app.post('/refine', data={'searchWord': 'cap AND'}, follow_redirects=True)
+        self.assertIn(b'Search ends where a word was expected', response.data)
+        
+        from text_store import document_hash
+        doc_hash = document_hash(pdf_path)
+        response = self.app.get(f'/api/pages/{doc_hash}?q=liability AND NOT cap')
+        self.assertEqual(response.get_json(), {
+            'doc_hash': doc_hash, 'query': 'liability AND NOT cap', 'page_count': 3, 'pages': [3]
+        })
+        self.assertEqual(self.app.get(f'/api/pages/{doc_hash}?q=(cap').status_code, 400)
+        self.assertEqual(self.app.get(f'/api/pages/{"0" * 64}?q=cap').status_code, 404)
+
+
+class VocabularyTests(TempStoreMixin, unittest.TestCase):
+    """Tests for prefix and wildcard searches and term autocomplete"""
+    
+    def test_prefix_and_wildcard_expansion(self):
+        """Test vocabulary lookups and counting through expanded postings"""
+        from page_index import PageIndex, query_terms
+        
+        page_index = PageIndex.build([
+            'Indemnify the indemnified party.',
+            'Indemnification: organisation and organization.',
+            'Force majeure; force majestic.'
+        ])
+        self.assertEqual(page_index.vocabulary, sorted(set(page_index.vocabulary)))
+        self.assertEqual(page_index.terms_with_prefix('INDEMNIF'), ['indemnification', 'indemnified', 'indemnify'])
+        self.assertEqual(page_index.terms_with_prefix('indemnif', limit=1), ['indemnification'])
+        self.assertEqual(page_index.terms_with_prefix('zz'), [])
+        self.assertEqual(page_index.expand_wildcard('organi?ation'), ['organisation', 'organization'])
+        self.assertEqual(page_index.expand_wildcard('*ation'), ['indemnification', 'organisation', 'organization'])
+        
+        self.assertEqual(page_index.page_counts('indemnif*'), [2, 1, 0])
+        self.assertEqual(page_index.page_counts('force maj*'), [0, 0, 2])
+        self.assertEqual(page_index.match_spans('force maj*', 2), [(0, 13), (15, 29)])
+        # A trailing question mark is punctuation, not a wildcard
+        self.assertEqual(query_terms('Indemnify?'), ['indemnify'])
+        
+        # Indexes stored before the vocabulary existed build it on demand
+        del page_index.vocabulary
+        self.assertEqual(page_index.terms_with_prefix('maj'), ['majestic', 'majeure'])
+    
+    def test_wildcard_in_search_index(self):
+        """Test that the cross-document index expands wildcards too"""
+        from search_index import SearchIndex
+        
+        search_index = SearchIndex(os.path.join(self.temp_dir, 'search.db'))
+        search_index.add_document('a' * 64, ['Indemnify the indemnified.', 'force majeure'], 'a.pdf')
+        self.assertEqual([(hit.page_number, hit.count) for hit in search_index.search('indemnif*')], [(1, 2)])
+        self.assertEqual([(hit.page_number, hit.count) for hit in search_index.search('force maj*')], [(2, 1)])
+        self.assertEqual([(hit.page_number, hit.count) for hit in search_index.search('*nify')], [(1, 1)])
+        search_index.close()
+    
+    def test_wildcard_upload_and_autocomplete(self):
+        """Test a wildcard search from the form and the autocomplete endpoint"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        pdf_path = os.path.join(self.temp_dir, 'indemnity.pdf')
+        c = canvas.Canvas(pdf_path, pagesize=letter)
+        for text in ["Indemnify and indemnification.", "The indemnitor pays."]:
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+        
+        with open(pdf_path, 'rb') as f:
+            response = self.app.post('/', data={'pdfFile': (f, 'indemnity.pdf'), 'searchWord': 'indemni*'},
+                                     follow_redirects=True)
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">3', response.data)
+        self.assertIn(b'js/autocomplete.js', response.data)
+        
+        from text_store import document_hash
+        doc_hash = document_hash(pdf_path)
+        response = self.app.get(f'/api/autocomplete?doc={doc_hash}&prefix=Indemni&limit=2')
+        self.assertEqual(response.get_json(), {
+            'prefix': 'Indemni',
+            'suggestions': [{'term': 'indemnification', 'count': 1}, {'term': 'indemnify', 'count': 1}]
+        })
+        # Without a document hash the current results' document is used
+        response = self.app.get('/api/autocomplete?prefix=pa')
+        self.assertEqual(response.get_json()['suggestions'], [{'term': 'pays', 'count': 1}])
+        self.assertEqual(self.app.get('/api/autocomplete?prefix=the one')
+                         .get_json()['suggestions'], [])
+        self.assertEqual(self.app.get(f'/api/autocomplete?doc={"0" * 64}&prefix=a').status_code, 404)
+
+
+class FuzzyMatchTests(TempStoreMixin, unittest.TestCase):
+    """Tests for fuzzy term matching over the document vocabulary"""
+    
+    def test_deletion_index_lookup(self):
+        """Test that lookups find exactly the terms within the distance"""
+        from fuzzy import DeletionIndex, edit_distance
+        
+        self.assertEqual(edit_distance('indemnity', 'lndemnity', 2), 1)
+        self.assertEqual(edit_distance('indemnity', 'idnemnity', 2), 1)
+        self.assertEqual(edit_distance('indemnity', 'indemnities', 2), 3)
+        
+        vocabulary = ['indemnity', 'lndemnity', 'indemnlty', 'lndemnlty', 'indemnities', 'identity']
+        index = DeletionIndex(vocabulary)
+        self.assertEqual(index.lookup('indemnity', 1), [('indemnity', 0), ('indemnlty', 1), ('lndemnity', 1)])
+        # Same answer as checking every term
+        expected = sorted((term, edit_distance('indemnity', term, 2)) for term in vocabulary
+                          if edit_distance('indemnity', term, 2) <= 2)
+        self.assertEqual(sorted(index.lookup('indemnity', 2)), expected)
+    
+    def test_deletion_indexes_are_bounded(self):
+        """Test that deletion indexes are built for the distance asked for and only a few are kept"""
+        from page_index import PageIndex
+        import fuzzy
+        
+        page_indexes = [PageIndex.build([f'term{number} indemnity']) for number in range(fuzzy.MAX_DELETION_INDEXES + 2)]
+        for page_index in page_indexes:
+            page_index.page_counts('indemnity~')
+        self.assertEqual(len(fuzzy._deletion_indexes), fuzzy.MAX_DELETION_INDEXES)
+        self.assertNotIn(page_indexes[0], fuzzy._deletion_indexes)
+        self.assertEqual(fuzzy.deletion_index(page_indexes[-1]).max_distance, 1)
+        
+        # A ~2 lookup replaces the document's index with a larger one
+        page_indexes[-1].page_counts('indemnity~2')
+        self.assertEqual(fuzzy.deletion_index(page_indexes[-1]).max_distance, 2)
+    
+    def test_fuzzy_terms_in_searches(self):
+        """Test fuzzy terms in counting, variants and boolean queries"""
+        from page_index import PageIndex
+        from boolean_query import query_page_counts
+        
+        page_index = PageIndex.build(['The lndemnity and indemnlty.', 'Indemnity cap.', 'Cat map.', 'lndemnlty'])
+        self.assertEqual(page_index.page_counts('indemnity~'), [2, 1, 0, 0])
+        self.assertEqual(page_index.page_counts('indemnity'), [0, 1, 0, 0])
+        self.assertEqual(page_index.variants('indemnity~1'),
+                         [('indemnity', 1), ('indemnlty', 1), ('lndemnity', 1)])
+        # Bare fuzzy terms allow one edit, ~2 two, and very short terms none
+        self.assertEqual(page_index.page_counts('indemnity~2'), [2, 1, 0, 1])
+        self.assertEqual(page_index.page_counts('ca~'), [0, 0, 0, 0])
+        self.assertEqual(page_index.page_counts('cap~'), [0, 1, 2, 0])
+        self.assertEqual(page_index.page_counts('cap~0'), [0, 1, 0, 0])
+        self.assertEqual(query_page_counts(page_index, 'indemnity~ AND NOT cap'), [2, 0, 0, 0])
+    
+    def test_fuzzy_upload_and_api(self):
+        """Test that fuzzy searches report their variants in the UI and the API"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        pdf_path = os.path.join(self.temp_dir, 'scanned.pdf')
+        c = canvas.Canvas(pdf_path, pagesize=letter)
+        for text in ["Mutual lndemnity clause.", "Indemnity and indemnlty."]:
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+        
+        with open(pdf_path, 'rb') as f:
+            response = self.app.post('/', data={'pdfFile': (f, 'scanned.pdf'), 'searchWord': 'indemnity~'},
+                                     follow_redirects=True)
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">3', response.data)
+        self.assertIn(b'indemnity (1), indemnlty (1), lndemnity (1)', response.data)
+        
+        from text_store import document_hash
+        doc_hash = document_hash(pdf_path)
+        data = self.app.get(f'/api/fuzzy/{doc_hash}?term=indemnity&distance=1').get_json()
+        self.assertEqual(data['variants'][1], {'term': 'indemnlty', 'distance': 1, 'count': 1, 'pages': {'2': 1}})
+        self.assertEqual(data['total_count'], 3)
+        self.assertEqual(data['page_counts'], {'1': 1, '2': 2})
+        self.assertEqual(self.app.get(f'/api/fuzzy/{doc_hash}?term=two words').status_code, 400)
+        self.assertEqual(self.app.get(f'/api/fuzzy/{doc_hash}?term=x&distance=5').status_code, 400)
+
+
+class StemmingTests(TempStoreMixin, unittest.TestCase):
+    """Tests for the opt-in mode that matches every form of a word"""
+    
+    def test_porter_stemmer(self):
+        """Test the stemmer against examples from the Porter paper"""
+        from stemmer import stem
+        
+        for word, expected in [('caresses', 'caress'), ('ponies', 'poni'), ('agreed', 'agre'),
+                               ('hopping', 'hop'), ('filing', 'file'), ('relational', 'relat'),
+                               ('generalization', 'gener'), ('adjustment', 'adjust'), ('adoption', 'adopt'),
+                               ('controlling', 'control'), ('terminating', 'termin'), ('naïve', 'naïve')]:
+            self.assertEqual(stem(word), expected, word)
+    
+    def test_term_families(self):
+        """Test that a stemmed search sums the postings of the word family"""
+        from page_index import PageIndex
+        from stemmer import term_families
+        
+        page_index = PageIndex.build(['They terminated it; termination.', 'Terminate, terminating. Terms.'])
+        self.assertEqual(term_families(page_index)['termin'],
+                         ['terminate', 'terminated', 'terminating', 'termination'])
+        self.assertEqual(page_index.page_counts('terminate'), [0, 1])
+        self.assertEqual(page_index.page_counts('terminate', stemming=True), [2, 2])
+        self.assertEqual(page_index.page_counts('termination', stemming=True), [2, 2])
+        self.assertEqual(page_index.match_spans('terminated', 0, stemming=True), [(5, 15), (20, 31)])
+        self.assertEqual(page_index.variants('terminate', stemming=True)[0], ('terminate', 1))
+        self.assertEqual(page_index.page_counts('terms', stemming=True), [0, 1])
+    
+    def test_stemming_option_in_web_ui(self):
+        """Test the stemming checkbox of the upload and refine forms"""
+        if not REPORTLAB_AVAILABLE:
+            self.skipTest("Reportlab not available")
+        
+        pdf_path = os.path.join(self.temp_dir, 'notice.pdf')
+        c = canvas.Canvas(pdf_path, pagesize=letter)
+        for text in ["Either party may terminate.", "Termination takes effect once terminated."]:
+            c.drawString(100, 750, text)
+            c.showPage()
+        c.save()
+        
+        with open(pdf_path, 'rb') as f:
+            response = self.app.post('/', data={'pdfFile': (f, 'notice.pdf'), 'searchWord': 'terminate',
+                                                'stemming': 'on'}, follow_redirects=True)
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">3', response.data)
+        self.assertIn(b'terminate (1), terminated (1), termination (1)', response.data)
+        response = self.app.get('/view_page/2')
+        self.assertIn(b'<span class="highlight-word">Termination</span>', response.data)
+        
+        response = self.app.post('/refine', data={'searchWord': 'terminate'}, follow_redirects=True)
+        self.assertIn(b'Total Occurrences:</span> <span class="value highlight">1', response.data)
+
+
+class NormalizationTests(unittest.TestCase):
+    """Tests for the normalization of extracted page text"""
+    
+    def test_normalize_text(self):
+        """Test ligatures, Unicode hyphens, dashes and spaces"""
+        from normalize import normalize_text
+        
+        self.assertEqual(normalize_text('The ﬁnal ﬂow'), 'The final flow')
+        # Soft hyphens and U+2010 hyphens at line ends join the word
+        self.assertEqual(normalize_text('indem\u00ad\nnity, indem\u2010\n  nity'), 'indemnity, indemnity')
+        self.assertEqual(normalize_text('indem\u00adnity zero\u200bwidth'), 'indemnity zerowidth')
+        self.assertEqual(normalize_text('2010\u20132015 \u2014 non\u2011compete'), '2010-2015 - non-compete')
+        self.assertEqual(normalize_text('a b c \t\n d  e'), 'a b c d e')
+        self.assertEqual(normalize_text('ＡＢ ①'), 'AB 1')
+        self.assertEqual(normalize_text('plain ascii  text\n'), 'plain ascii text')
+    
+    def test_searches_see_normalized_text(self):
+        """Test that queries and legacy counting normalize like page text"""
+        from page_index import PageIndex
+        
+        page_text = preprocess_text('Final ter\u00ad\nmination of the ﬁnal non\u2011compete')
+        self.assertEqual(page_text, 'Final termination of the final non-compete')
+        page_index = PageIndex.build([page_text])
+        self.assertEqual(page_index.page_counts('ﬁnal'), [2])
+        self.assertEqual(page_index.page_counts('non\u2010compete'), [1])
+        self.assertEqual(count_word_occurrences('The ﬁnal word, FINAL', 'final'), 2)
+    
+    def test_text_stored_by_older_versions_is_ignored(self):
+        """Test that text stored before a preprocessing change is re-extracted"""
+        from text_store import save_pages, load_pages, _store_paths
+        
+        temp_dir = tempfile.mkdtemp()
+        try:
+            save_pages(temp_dir, 'ab' * 32, ['page one'])
+            _, offsets_path = _store_paths(temp_dir, 'ab' * 32)
+            with open(offsets_path, 'r+b') as f:
+                f.write(b'PGO1')
+            self.assertIsNone(load_pages(temp_dir, 'ab' * 32))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class CJKTokenizationTests(unittest.TestCase):
+    """Tests for indexing and searching Chinese, Japanese and Korean text"""
+    
+    def setUp(self):
+        from page_index import PageIndex
+        self.pages = ['東京都の会社は東京に本社がある。Tokyo office 東京', '日本語のテキスト、日本']
+        self.page_index = PageIndex.build(self.pages)
+    
+    def test_cjk_runs_are_indexed_as_bigrams(self):
+        """Test that a CJK run gives one token per character"""
+        from page_index import tokenize, query_terms
+        
+        self.assertEqual([term for term, _, _ in tokenize('Tokyo東京都')], ['tokyo', '東京', '京都', '都'])
+        self.assertEqual(query_terms('東京都'), ['東京', '京都'])
+        # The run's last character is kept when the phrase goes on
+        self.assertEqual(query_terms('東京 office'), ['東京', '京', 'office'])
+        self.assertEqual(query_terms('東'), ['東'])
+    
+    def test_cjk_page_counts(self):
+        """Test counting CJK words, characters and mixed phrases per page"""
+        self.assertEqual(self.page_index.page_counts('東京'), [3, 0])
+        self.assertEqual(self.page_index.page_counts('東京都'), [1, 0])
+        self.assertEqual(self.page_index.page_counts('本'), [1, 2])
+        self.assertEqual(self.page_index.page_counts('日本語'), [0, 1])
+        self.assertEqual(self.page_index.page_counts('テキスト'), [0, 1])
+        self.assertEqual(self.page_index.page_counts('office 東京'), [1, 0])
+        self.assertEqual(count_word_occurrences(self.pages[0], '会社'), 1)
+    
+    def test_cjk_highlights_and_previews(self):
+        """Test match offsets and preview words for CJK text"""
+        from page_index import text_words
+        
+        spans = self.page_index.match_spans('京', 0)
+        self.assertEqual([self.pages[0][start:end] for start, end in spans], ['京', '京', '京'])
+        spans = self.page_index.match_spans('東京都', 0)
+        self.assertEqual([self.pages[0][start:end] for start, end in spans], ['東京都'])
+        self.assertEqual(self.page_index.page_words(0, self.pages[0], limit=9), ['東京都の会社は東京'])
+        self.assertEqual(text_words(self.pages[1]), ['日本語のテキスト', '日本'])
+    
+    def test_search_index_finds_cjk_terms(self):
+        """Test CJK searches across documents"""
+        from search_index import SearchIndex
+        
+        index = SearchIndex(':memory:')
+        try:
+            index.add_document('ab' * 32, self.pages, 'tokyo.pdf')
+            self.assertEqual([(hit.page_number, hit.count) for hit in index.search('日本')], [(2, 2)])
+            self.assertEqual([(hit.page_number, hit.count) for hit in index.search('東京')], [(1, 3)])
+            self.assertEqual(index.search('会社 東京'), [])
+            # Bigrams are index terms, and a lone character matches every term starting with it
+            self.assertEqual([(hit.page_number, hit.count) for hit in index.search('東京都')], [(1, 1)])
+            self.assertEqual([(hit.page_number, hit.count) for hit in index.search('京')],
+                             [(page + 1, count) for page, count in enumerate(self.page_index.page_counts('京')) if count])
+        finally:
+            index.close()
+
+
+class SnippetTests(unittest.TestCase):
+    """Tests for keyword-in-context previews of the matches on a page"""
+    
+    def setUp(self):
+        from page_index import PageIndex
+        self.text = ('Alpha beta gamma delta. The indemnification cap applies here, unless the '
+                     'indemnification is mutual. Many more words follow on this page before '
+                     'indemnification appears once more at the end')
+        self.page_index = PageIndex.build([self.text])
+    
+    def test_snippets_around_matches(self):
+        """Test context windows, merging and the per-page cap"""
+        spans = self.page_index.match_spans('indemnification', 0)
+        snippet, snippet_spans = self.page_index.snippets(0, self.text, spans, context=2, limit=2)
+        self.assertEqual(snippet, '\u2026 delta. The indemnification cap applies \u2026 unless the indemnification is mutual \u2026')
+        self.assertEqual([snippet[start:end] for start, end in snippet_spans], ['indemnification'] * 2)
+        
+        # Windows that touch are merged, and a match at the start needs no ellipsis
+        spans = self.page_index.match_spans('alpha', 0) + self.page_index.match_spans('gamma', 0)
+        snippet, snippet_spans = self.page_index.snippets(0, self.text, sorted(spans), context=1)
+        self.assertEqual(snippet, 'Alpha beta gamma delta \u2026')
+        self.assertEqual(len(snippet_spans), 2)
+        self.assertEqual(self.page_index.snippets(0, self.text, []), ('', []))
+    
+    def test_document_spans_match_page_spans(self):
+        """Test that one search over the document gives each page's counts and offsets"""
+        from page_index import PageIndex
+        from boolean_query import query_page_matches, query_page_counts, query_match_spans, bitset_pages
+        
+        pages = ['Contracts and a contract.', 'No match here.', 'The contracted party contracts.']
+        page_index = PageIndex.build(pages)
+        for query in ('contract', 'contract*', 'contract AND NOT party', 'party OR match'):
+            counts, spans, matches = query_page_matches(page_index, query, stemming=True)
+            self.assertEqual(counts, query_page_counts(page_index, query, stemming=True))
+            # Only matching pages are highlighted
+            self.assertLessEqual(set(spans), set(bitset_pages(matches)))
+            self.assertLessEqual({page for page, count in enumerate(counts) if count}, set(bitset_pages(matches)))
+            for page in spans:
+                self.assertEqual(spans[page], query_match_spans(page_index, query, page, stemming=True))
+    
+    def test_results_show_matches_in_context(self):
+        """Test that the results page shows highlighted snippets from the stored data"""
+        from app import count_pages
+        from page_results import PageResults
+        
+        pdf_data, _ = count_pages([self.text, 'No match here'], 'indemnification cap')
+        self.assertEqual(pdf_data[0][1], 'Alpha beta gamma delta. The indemnification cap applies here, unless the indemnification is \u2026')
+        self.assertEqual(pdf_data[1][1], 'No match here')
+        
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['pdf_results'] = {
+                'filepath': 'test.pdf',
+                'search_word': 'indemnification cap',
+                'pdf_data': PageResults.from_pdf_data(pdf_data).to_bytes(),
+                'total_count': 1,
+                'show_sample': True
+            }
+        response = client.get('/results')
+        self.assertIn('<span class="highlight-word">indemnification cap</span>'.encode(), response.data)
+
+
+class DocumentStatisticsTests(unittest.TestCase):
+    """Tests for top words, words per page and match density"""
+    
+    def setUp(self):
+        from page_index import PageIndex
+        self.pages_text = ['The liability cap limits liability. The cap is 2020 dollars.', 'Cap cap cap']
+        self.page_index = PageIndex.build(self.pages_text)
+    
+    def test_top_terms_and_page_words(self):
+        """Test frequencies from the postings, without stop words or numbers"""
+        self.assertEqual(self.page_index.top_terms(3), [('cap', 5), ('liability', 2), ('limits', 1)])
+        self.assertEqual(self.page_index.frequent_terms[:2], [('cap', 5), ('liability', 2)])
+        self.assertEqual(self.page_index.page_word_counts(), [10, 3])
+    
+    def test_results_page_and_export(self):
+        """Test that words, density and top words reach the results page and the JSON export"""
+        from app import count_pages
+        from page_results import PageResults
+        
+        pdf_data, total_count = count_pages(self.pages_text, 'liability', self.page_index)
+        page_results = PageResults.from_bytes(PageResults.from_pdf_data(pdf_data).to_bytes())
+        self.assertEqual(list(page_results.word_counts), [10, 3])
+        self.assertEqual(page_results.density(0), 200.0)
+        self.assertEqual(page_results.density(1), 0.0)
+        
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['pdf_results'] = {
+                'filepath': 'test.pdf',
+                'search_word': 'liability',
+                'pdf_data': page_results.to_bytes(),
+                'total_count': total_count,
+                'show_sample': True,
+                'top_words': self.page_index.top_terms(2)
+            }
+        response = client.get('/results')
+        self.assertIn(b'cap (5), liability (2)', response.data)
+        self.assertIn(b'200.00', response.data)
+        
+        response = client.get('/results/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        data = response.get_json()
+        self.assertEqual(data['total_words'], 13)
+        self.assertEqual(data['top_words'][0], {'word': 'cap', 'count': 5})
+        self.assertEqual(data['pages'][0], {'page': 1, 'count': 2, 'matched': True, 'words': 10, 'density': 200.0})
+
+
+class HttpCachingTests(TempStoreMixin, unittest.TestCase):
+    """Tests for ETags and 304 responses on the results and page views"""
+    
+    def setUp(self):
+        from text_store import save_pages
+        
+        super().setUp()
+        self.doc_hash = 'cd' * 32
+        pages_text = ['The liability cap applies.', 'Liability is unlimited.']
+        save_pages(self.temp_dir, self.doc_hash, pages_text)
+        
+        from app import count_pages
+        from page_results import PageResults
+        pdf_data, total_count = count_pages(pages_text, 'liability')
+        with self.app.session_transaction() as sess:
+            sess['pdf_results'] = {
+                'filepath': 'test.pdf',
+                'doc_hash': self.doc_hash,
+                'search_word': 'liability',
+                'pdf_data': PageResults.from_pdf_data(pdf_data).to_bytes(),
+                'total_count': total_count,
+                'show_sample': True
+            }
+    
+    def test_results_not_modified(self):
+        """Test that a repeat view with the ETag gets an empty 304"""
+        response = self.app.get('/results')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+        
+        response = self.app.get('/results', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        
+        # A new search gives a new ETag
+        with self.app.session_transaction() as sess:
+            results = sess['pdf_results']
+            results['search_word'] = 'cap'
+            sess['pdf_results'] = results
+        response = self.app.get('/results', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+    
+    def test_new_counts_change_etag(self):
+        """Test that the ETag changes when the stored counts change under the same search"""
+        from page_results import PageResults
+        
+        etag = self.app.get('/results').headers['ETag']
+        with self.app.session_transaction() as sess:
+            results = sess['pdf_results']
+            results['pdf_data'] = PageResults.from_pdf_data([(1, 'The liability cap applies.', 1)]).to_bytes()
+            results['total_count'] = 1
+            sess['pdf_results'] = results
+        response = self.app.get('/results', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+    
+    def test_page_view_not_modified(self):
+        """Test that each page view has its own ETag and is revalidated without rendering"""
+        from unittest.mock import patch
+        
+        first = self.app.get('/view_page/1')
+        second = self.app.get('/view_page/2')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+        
+        with patch('app.open_search_document', side_effect=AssertionError('should not load the document')):
+            response = self.app.get('/view_page/1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,320 @@
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# Each stored document is two files:
+#   <hash>.txt  one UTF-8 blob holding the preprocessed text of every page
+#   <hash>.off  a header plus the byte offset of each page in the blob
+# and optionally <hash>.idx, the document's pickled positional index.
+# While a document is being extracted, <hash>.pages/ holds one checkpoint file
+# per finished page so an interrupted job can resume where it stopped.
+# pages/<xx>/<page hash> caches the raw extracted text of a single page by
+# content hash, shared by every document that contains that page.
+# Workers mmap the blob, so the OS page cache is shared between processes
+# instead of every worker holding its own copy of the text.
+# Reads touch the offsets file (or the cached page), and prune_store removes
+# whatever hasn't been read or written for a while.
+# Bumped whenever preprocessing or tokenization changes, so text and
+# indexes stored the old way are treated as missing and built again
+_OFFSETS_MAGIC = b'PGO3'
+# Identifies how stored text and indexes were produced, for cache validators
+STORE_FORMAT = _OFFSETS_MAGIC.decode('ascii')
+_OFFSETS_HEADER = struct.Struct('<4sI')
+
+# Number of mapped documents (and loaded indexes) each process keeps open
+MAX_OPEN_DOCUMENTS = 64
+
+_open_documents = OrderedDict()
+_open_documents_lock = threading.Lock()
+
+
+def document_hash(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store_base(folder, doc_hash):
+    # Only accept hex digests so a session value can never escape the folder
+    if not _is_hash(doc_hash):
+        raise ValueError(f'Invalid document hash: {doc_hash!r}')
+    return os.path.join(folder, doc_hash)
+
+
+def _is_hash(name):
+    return bool(name) and all(c in '0123456789abcdef' for c in name)
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _store_paths(folder, doc_hash):
+    base = _store_base(folder, doc_hash)
+    return base + '.txt', base + '.off'
+
+
+class MappedDocument:
+    """Read-only, memory-mapped view of a stored document's page text.
+
+    Behaves like a sequence of page strings. ``page_bytes`` returns a
+    zero-copy ``memoryview`` into the mapping; ``page_text`` decodes a
+    single page on demand.
+    """
+
+    def __init__(self, text_path, offsets_path):
+        with open(offsets_path, 'rb') as f:
+            data = f.read()
+        magic, count = _OFFSETS_HEADER.unpack_from(data, 0)
+        if magic != _OFFSETS_MAGIC:
+            raise ValueError(f'Invalid offsets file: {offsets_path}')
+        self._offsets = array('Q')
+        self._offsets.frombytes(data[_OFFSETS_HEADER.size:_OFFSETS_HEADER.size + (count + 1) * 8])
+        if len(self._offsets) != count + 1:
+            raise ValueError(f'Truncated offsets file: {offsets_path}')
+        if sys.byteorder != 'little':
+            self._offsets.byteswap()
+
+        with open(text_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size != self._offsets[-1]:
+                raise ValueError(f'Text blob does not match offsets: {text_path}')
+            # mmap can't map an empty file
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._view = memoryview(self._map)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def page_bytes(self, index):
+        """Return the UTF-8 bytes of a page as a zero-copy memoryview"""
+        if not 0 <= index < len(self):
+            raise IndexError('page index out of range')
+        return self._view[self._offsets[index]:self._offsets[index + 1]]
+
+    def page_text(self, index):
+        """Decode and return the text of a single page"""
+        return str(self.page_bytes(index), 'utf-8')
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return self.page_text(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.page_text(index)
+
+
+def save_pages(folder, doc_hash, pages_text):
+    """Persist the preprocessed text of every page of a document"""
+    text_path, offsets_path = _store_paths(folder, doc_hash)
+    # Unique temp names so two workers storing the same document don't collide
+    suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+    offsets = array('Q', [0])
+    with open(text_path + suffix, 'wb') as f:
+        for page_text in pages_text:
+            encoded = page_text.encode('utf-8')
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    with open(offsets_path + suffix, 'wb') as f:
+        f.write(_OFFSETS_HEADER.pack(_OFFSETS_MAGIC, len(offsets) - 1))
+        f.write(offsets.tobytes())
+    # The offsets file is renamed last, so its presence means the blob is complete
+    os.replace(text_path + suffix, text_path)
+    os.replace(offsets_path + suffix, offsets_path)
+
+
+def _cached(path, loader):
+    # Per-process LRU of loaded documents and indexes, keyed by file path
+    with _open_documents_lock:
+        value = _open_documents.get(path)
+        if value is not None:
+            _open_documents.move_to_end(path)
+            return value
+
+    value = loader()
+
+    with _open_documents_lock:
+        _open_documents[path] = value
+        # Evicted mappings are closed when the last reference goes away
+        while len(_open_documents) > MAX_OPEN_DOCUMENTS:
+            _open_documents.popitem(last=False)
+    return value
+
+
+def load_pages(folder, doc_hash):
+    """Return a MappedDocument for a stored document, or None if not stored"""
+    text_path, offsets_path = _store_paths(folder, doc_hash)
+    try:
+        document = _cached(offsets_path, lambda: MappedDocument(text_path, offsets_path))
+    except (OSError, ValueError, struct.error):
+        return None
+    _touch(offsets_path)
+    return document
+
+
+def save_index(folder, doc_hash, index):
+    """Persist a document's search index next to its page text"""
+    index_path = _store_base(folder, doc_hash) + '.idx'
+    temp_path = f'{index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, index_path)
+
+
+def load_index(folder, doc_hash):
+    """Return a document's stored search index, or None if not stored"""
+    index_path = _store_base(folder, doc_hash) + '.idx'
+
+    def loader():
+        # Index files are only ever written by save_index into our own store
+        with open(index_path, 'rb') as f:
+            return pickle.load(f)
+
+    try:
+        return _cached(index_path, loader)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def _checkpoint_dir(folder, doc_hash):
+    return _store_base(folder, doc_hash) + '.pages'
+
+
+def save_checkpoint(folder, doc_hash, page_number, page_kind, page_text):
+    """Persist one extracted page (1-based ``page_number``) of a document in progress"""
+    checkpoint_dir = _checkpoint_dir(folder, doc_hash)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, f'{page_number:06d}')
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    # The page kind on the first line, then the page text
+    with open(temp_path, 'wb') as f:
+        f.write(f'{page_kind}\n{page_text}'.encode('utf-8'))
+    os.replace(temp_path, path)
+
+
+def load_checkpoints(folder, doc_hash):
+    """Return [(page_kind, page_text)] for the checkpointed pages of a document
+
+    Only the run of pages from page 1 up to the first missing one is
+    returned, since extraction resumes from there.
+    """
+    checkpoint_dir = _checkpoint_dir(folder, doc_hash)
+    pages = []
+    while True:
+        path = os.path.join(checkpoint_dir, f'{len(pages) + 1:06d}')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return pages
+        try:
+            page_kind, page_text = data.decode('utf-8').split('\n', 1)
+        except (ValueError, UnicodeDecodeError):
+            return pages
+        pages.append((page_kind, page_text))
+
+
+def clear_checkpoints(folder, doc_hash):
+    """Remove a document's checkpoints once its full text is stored"""
+    shutil.rmtree(_checkpoint_dir(folder, doc_hash), ignore_errors=True)
+
+
+def _page_text_path(folder, page_hash):
+    return _store_base(os.path.join(folder, 'pages', page_hash[:2]), page_hash)
+
+
+def save_page_text(folder, page_hash, page_text):
+    """Cache the extracted text of a page under its content hash"""
+    path = _page_text_path(folder, page_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(page_text.encode('utf-8'))
+    os.replace(temp_path, path)
+
+
+def load_page_text(folder, page_hash):
+    """Return the cached text of a page, or None if it has never been extracted"""
+    path = _page_text_path(folder, page_hash)
+    try:
+        with open(path, 'rb') as f:
+            page_text = f.read().decode('utf-8')
+    except (OSError, UnicodeDecodeError):
+        return None
+    _touch(path)
+    return page_text
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def prune_store(folder, max_age, now=None):
+    """Remove stored documents and cached pages unused for ``max_age`` seconds
+
+    A document's files (text, offsets, index, checkpoints) go together,
+    and only once the newest of them is that old, so a document being
+    extracted or read is kept. Returns the number of documents and cached
+    pages removed.
+    """
+    cutoff = (time.time() if now is None else now) - max_age
+    try:
+        entries = list(os.scandir(folder))
+    except OSError:
+        return 0
+
+    documents = {}
+    for entry in entries:
+        doc_hash = entry.name.split('.', 1)[0]
+        # Leave alone anything that isn't ours, including the page cache
+        if entry.name == doc_hash or not _is_hash(doc_hash):
+            continue
+        try:
+            mtime = entry.stat(follow_symlinks=False).st_mtime
+        except OSError:
+            continue
+        documents.setdefault(doc_hash, []).append((entry.path, mtime))
+
+    removed = 0
+    for files in documents.values():
+        if max(mtime for _, mtime in files) >= cutoff:
+            continue
+        # Offsets first: without them the document reads as missing, never torn
+        for path, _ in sorted(files, key=lambda file: not file[0].endswith('.off')):
+            _remove(path)
+        removed += 1
+
+    for root, _, names in os.walk(os.path.join(folder, 'pages')):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed